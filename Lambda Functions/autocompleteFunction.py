@@ -0,0 +1,84 @@
+import lambdaRuntime as runtime
+import os
+from collections import Counter
+import prefixIndex
+import searchIndex
+import sessionCache
+import queryCache
+import popularity
+import requestLog
+
+music_table = runtime.lazy_table('music')
+session_table = runtime.lazy_table('sessions')
+popularity_table = runtime.lazy_table(popularity.TABLE_NAME)
+sessions = sessionCache.SessionCache(session_table)
+catalog = queryCache.from_environment()   # Only read for the shared catalog version (QUERY_CACHE_TABLE)
+INDEX_MAX_AGE = int(os.environ.get('AUTOCOMPLETE_MAX_AGE', '900'))  # Rebuild with fresh popularity after 15 minutes
+DEFAULT_K = 8
+
+HEADERS = runtime.headers(content_type=True, methods='GET, OPTIONS', allow_headers='Content-Type, X-Session-Token')
+log = requestLog.RequestLog('autocompleteFunction')
+
+def load_popularity():
+    # Subscribers per title, artist and album value, from the sharded counters
+    counts = Counter()
+    for song, subscribers in popularity.scan_counts(popularity_table).values():
+        for field in prefixIndex.COMPLETION_FIELDS:
+            if song.get(field):
+                counts[(field, song[field])] += subscribers
+    return counts
+
+def build_completions(items):
+    return prefixIndex.PrefixIndex(items, load_popularity())
+
+# Rebuilt in the background when the catalog version moves on, and every INDEX_MAX_AGE for popularity
+completions = searchIndex.RefreshingIndex('index', build_completions, max_age=INDEX_MAX_AGE,
+                                          ProjectionExpression='title, artist, album')
+
+def get_index():
+    return completions.get(music_table, catalog.catalog_version())
+
+@log.handler
+def lambda_handler(event, context):
+    try:
+        runtime.start_invocation()
+
+        log.debug("Received event: %s", lambda: requestLog.dumps(requestLog.redact_event(event)))
+
+        method = event.get('httpMethod')
+        if method == 'OPTIONS':
+            return runtime.text_response(200, 'CORS preflight successful', HEADERS)
+
+        headers = event.get('headers') or {}
+        session_token = headers.get('X-Session-Token') or headers.get('x-session-token')
+        if not session_token:
+            return runtime.json_response(400, {"error": "Session token missing."}, HEADERS)
+
+        if method != 'GET':
+            return runtime.json_response(405, {"error": "Method not allowed."}, HEADERS)
+
+        if sessions.resolve(session_token) is None:
+            return runtime.json_response(401, {"error": "Invalid session token."}, HEADERS)
+
+        params = event.get('queryStringParameters') or {}
+        prefix = params.get('q', '')
+        field = params.get('field') or None
+        if field is not None and field not in prefixIndex.COMPLETION_FIELDS:
+            return runtime.json_response(400, {"error": "field must be one of title, artist or album."}, HEADERS)
+        try:
+            k = int(params.get('k', DEFAULT_K))
+        except ValueError:
+            k = 0
+        if not 1 <= k <= prefixIndex.MAX_K:
+            return runtime.json_response(400, {"error": f"k must be between 1 and {prefixIndex.MAX_K}."}, HEADERS)
+
+        suggestions = get_index().complete(prefix, k, field)
+        log.set(prefix_length=len(prefix), suggestions=len(suggestions))
+
+        return runtime.json_response(200, {"success": True, "suggestions": suggestions}, HEADERS)
+
+    except Exception as e:
+        log.error("Autocomplete failed: %s", e)
+        return runtime.json_response(500, {"error": str(e)}, HEADERS)
+
+runtime.init_complete('autocompleteFunction')
@@ -0,0 +1,62 @@
+import time
+import rateLimiter
+
+# BatchGetItem / BatchWriteItem helpers that split requests to the service
+# limits and retry whatever DynamoDB hands back as unprocessed.
+
+BATCH_GET_LIMIT = 100
+BATCH_WRITE_LIMIT = 25
+MAX_RETRIES = 8
+BASE_DELAY = 0.05          # Seconds, doubled on every retry
+MAX_DELAY = 2.0
+
+
+def backoff(attempt):
+    time.sleep(rateLimiter.jittered_delay(attempt, BASE_DELAY, MAX_DELAY))
+
+
+def chunks(sequence, size):
+    for start in range(0, len(sequence), size):
+        yield sequence[start:start + size]
+
+
+def batch_get(dynamodb, table_name, keys, **table_kwargs):
+    # Returns (items, keys that were still unprocessed after all retries)
+    unique_keys = list({tuple(sorted(key.items())): key for key in keys}.values())
+    items = []
+    unprocessed = []
+    for chunk in chunks(unique_keys, BATCH_GET_LIMIT):
+        request = {table_name: {'Keys': chunk, **table_kwargs}}
+        attempt = 0
+        while request:
+            response = dynamodb.batch_get_item(RequestItems=request)
+            items.extend(response.get('Responses', {}).get(table_name, []))
+            request = response.get('UnprocessedKeys') or {}
+            if not request:
+                break
+            attempt += 1
+            if attempt > MAX_RETRIES:
+                unprocessed.extend(request[table_name]['Keys'])
+                break
+            backoff(attempt)
+    return items, unprocessed
+
+
+def batch_write(dynamodb, table_name, write_requests):
+    # write_requests are {'PutRequest': ...} / {'DeleteRequest': ...} entries.
+    # Returns the requests that were still unprocessed after all retries.
+    unprocessed = []
+    for chunk in chunks(list(write_requests), BATCH_WRITE_LIMIT):
+        request = {table_name: chunk}
+        attempt = 0
+        while request:
+            response = dynamodb.batch_write_item(RequestItems=request)
+            request = response.get('UnprocessedItems') or {}
+            if not request:
+                break
+            attempt += 1
+            if attempt > MAX_RETRIES:
+                unprocessed.extend(request[table_name])
+                break
+            backoff(attempt)
+    return unprocessed
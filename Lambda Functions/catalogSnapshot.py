@@ -0,0 +1,266 @@
+import os
+import sys
+import json
+import mmap
+import time
+from array import array
+import lambdaRuntime as runtime
+import requestLog
+
+# Read-only catalog snapshot for cold starts. The music table is exported into
+# one compact binary file that a container memory-maps instead of scanning
+# DynamoDB, so only the pages a request actually touches are read in.
+#
+# Layout (little endian, sections 8-byte aligned):
+#   MAGIC | u32 format version | u32 header length | JSON header | padding | sections
+# Section spans in the header are [offset, length] from the first section.
+# Rows are sorted by (title, year). title is a string table (u32 offsets into
+# a UTF-8 blob); year, artist, album and img_url are interned: a string table
+# of distinct values plus one u32 code per row, MISSING where a song has none.
+#
+#   CATALOG_SNAPSHOT=s3://bucket/catalog/music.snap   or a local path
+#   CATALOG_SNAPSHOT_CHECK=60    seconds between checks for a newer snapshot
+#   CATALOG_SNAPSHOT_DIR=/tmp/catalog-snapshot   where S3 snapshots are downloaded
+
+MAGIC = b'MUSICSNP'
+FORMAT_VERSION = 1
+STRING_COLUMN = 'title'
+DICTIONARY_COLUMNS = ('year', 'artist', 'album', 'img_url')
+FIELDS = (STRING_COLUMN,) + DICTIONARY_COLUMNS
+MISSING = 0xFFFFFFFF
+ALIGNMENT = 8
+
+SNAPSHOT_LOCATION = os.environ.get('CATALOG_SNAPSHOT', '')
+CHECK_INTERVAL = int(os.environ.get('CATALOG_SNAPSHOT_CHECK', '60'))
+DOWNLOAD_DIR = os.environ.get('CATALOG_SNAPSHOT_DIR', '/tmp/catalog-snapshot')
+
+
+def _u32(values):
+    ids = array('I', values)
+    if sys.byteorder != 'little':
+        ids.byteswap()
+    return ids.tobytes()
+
+
+def _string_table(strings):
+    offsets = [0]
+    blob = bytearray()
+    for value in strings:
+        blob += value.encode('utf-8')
+        offsets.append(len(blob))
+    if len(blob) >= MISSING:
+        raise ValueError("String column exceeds 4 GB")
+    return _u32(offsets), bytes(blob)
+
+
+def build(items, catalog_version=None):
+    # Returns the snapshot bytes; items need title and year, later duplicates win
+    rows = {}
+    for item in items:
+        if item.get('title') and item.get('year'):
+            rows[(str(item['title']), str(item['year']))] = item
+    keys = sorted(rows)
+
+    sections = []
+    position = 0
+
+    def add(data):
+        nonlocal position
+        span = [position, len(data)]
+        padding = -len(data) % ALIGNMENT
+        sections.append(data + b'\0' * padding)
+        position += len(data) + padding
+        return span
+
+    columns = {}
+    offsets, blob = _string_table(title for title, _ in keys)
+    columns[STRING_COLUMN] = {'offsets': add(offsets), 'data': add(blob)}
+    for field in DICTIONARY_COLUMNS:
+        values = {}
+        codes = []
+        for key in keys:
+            value = rows[key].get(field)
+            if value is None or value == '':
+                codes.append(MISSING)
+            else:
+                codes.append(values.setdefault(str(value), len(values)))
+        offsets, blob = _string_table(values)
+        columns[field] = {'codes': add(_u32(codes)), 'offsets': add(offsets), 'data': add(blob), 'distinct': len(values)}
+
+    header = json.dumps({
+        'format': FORMAT_VERSION,
+        'count': len(keys),
+        'catalog_version': catalog_version,
+        'created': int(time.time()),
+        'columns': columns
+    }, separators=(',', ':')).encode('utf-8')
+    prefix = MAGIC + _u32([FORMAT_VERSION, len(header)]) + header
+    return b''.join([prefix, b'\0' * (-len(prefix) % ALIGNMENT)] + sections)
+
+
+def read_header(buffer):
+    # (header, offset of the first section) from the start of a snapshot
+    if bytes(buffer[:len(MAGIC)]) != MAGIC:
+        raise ValueError("Not a catalog snapshot")
+    if sys.byteorder != 'little':
+        raise ValueError("Catalog snapshots are little endian")
+    start = len(MAGIC) + 8
+    version, header_length = memoryview(buffer)[len(MAGIC):start].cast('I')
+    if version != FORMAT_VERSION:
+        raise ValueError(f"Unsupported catalog snapshot format {version}")
+    end = start + header_length
+    return json.loads(bytes(buffer[start:end])), end + (-end % ALIGNMENT)
+
+
+class _StringTable:
+    def __init__(self, offsets, data):
+        self.offsets = offsets
+        self.data = data
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index):
+        return str(self.data[self.offsets[index]:self.offsets[index + 1]], 'utf-8')
+
+
+class _InternedTable(_StringTable):
+    # Each distinct value is decoded once, on first use, and shared by every song that has it
+    def __init__(self, offsets, data):
+        super().__init__(offsets, data)
+        self._decoded = [None] * len(self)
+
+    def __getitem__(self, index):
+        value = self._decoded[index]
+        if value is None:
+            value = self._decoded[index] = super().__getitem__(index)
+        return value
+
+    def decode_all(self):
+        for index, value in enumerate(self._decoded):
+            if value is None:
+                self._decoded[index] = super().__getitem__(index)
+        return self._decoded
+
+
+class CatalogSnapshot:
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as file:
+            # The mapping stays valid after the file is closed
+            self._map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.header, self._base = read_header(self._map)
+        self.count = self.header['count']
+        self.catalog_version = self.header.get('catalog_version')
+        self.created = self.header.get('created')
+        self._columns = {}
+
+    def __len__(self):
+        return self.count
+
+    def _section(self, span):
+        offset, length = span
+        return memoryview(self._map)[self._base + offset:self._base + offset + length]
+
+    def _strings(self, spec, table_type=_StringTable):
+        return table_type(self._section(spec['offsets']).cast('I'), self._section(spec['data']))
+
+    def column(self, field):
+        # Built on first use, so a handler only pays for the columns it reads
+        column = self._columns.get(field)
+        if column is None:
+            spec = self.header['columns'][field]
+            if field == STRING_COLUMN:
+                column = (None, self._strings(spec))
+            else:
+                column = (self._section(spec['codes']).cast('I'), self._strings(spec, _InternedTable))
+            self._columns[field] = column
+        return column
+
+    def __iter__(self):
+        # A full pass touches nearly every interned value, so decode them up front
+        columns = []
+        for field in FIELDS:
+            codes, values = self.column(field)
+            columns.append((field, codes, values if codes is None else values.decode_all()))
+        for row in range(self.count):
+            item = {}
+            for field, codes, values in columns:
+                if codes is None:
+                    item[field] = values[row]
+                else:
+                    code = codes[row]
+                    if code != MISSING:
+                        item[field] = values[code]
+            yield item
+
+
+def _split_s3(location):
+    bucket, _, key = location[len('s3://'):].partition('/')
+    return bucket, key
+
+
+def source_tag(location, s3=None):
+    # Changes whenever a new snapshot is published at the location
+    if location.startswith('s3://'):
+        bucket, key = _split_s3(location)
+        return (s3 or runtime.s3).head_object(Bucket=bucket, Key=key)['ETag'].strip('"')
+    stat = os.stat(location)
+    return f'{stat.st_mtime_ns}-{stat.st_size}'
+
+
+def open_snapshot(location, s3=None, tag=None):
+    if not location.startswith('s3://'):
+        return CatalogSnapshot(location)
+    bucket, key = _split_s3(location)
+    tag = tag or source_tag(location, s3)
+    path = os.path.join(DOWNLOAD_DIR, f'{tag}.snap')
+    if not os.path.exists(path):
+        os.makedirs(DOWNLOAD_DIR, exist_ok=True)
+        partial = f'{path}.{os.getpid()}.part'
+        (s3 or runtime.s3).download_file(bucket, key, partial)
+        os.replace(partial, path)
+        # Older downloads are only taking up /tmp
+        for name in os.listdir(DOWNLOAD_DIR):
+            if name.endswith('.snap') and name != os.path.basename(path):
+                os.remove(os.path.join(DOWNLOAD_DIR, name))
+    return CatalogSnapshot(path)
+
+
+def publish(data, location, s3=None):
+    if location.startswith('s3://'):
+        bucket, key = _split_s3(location)
+        (s3 or runtime.s3).put_object(Bucket=bucket, Key=key, Body=data, ContentType='application/octet-stream')
+        return
+    # Written beside the target and renamed, so readers never map a half-written file
+    partial = f'{location}.{os.getpid()}.part'
+    with open(partial, 'wb') as file:
+        file.write(data)
+    os.replace(partial, location)
+
+
+_snapshot = None
+_tag = None
+_checked_at = 0
+
+
+def current(location=None):
+    # The configured snapshot, reopened when a newer one has been published; None without one
+    global _snapshot, _tag, _checked_at
+    location = location or SNAPSHOT_LOCATION
+    if not location:
+        return None
+    if _snapshot is not None and time.time() - _checked_at < CHECK_INTERVAL:
+        return _snapshot
+    _checked_at = time.time()
+    try:
+        tag = source_tag(location)
+        if _snapshot is None or tag != _tag:
+            started = time.perf_counter()
+            _snapshot, _tag = open_snapshot(location, tag=tag), tag
+            requestLog.annotate(snapshot_songs=len(_snapshot),
+                                snapshot_load_ms=round((time.perf_counter() - started) * 1000, 2))
+    except Exception as e:
+        # A missing or unreadable snapshot falls back to the table scan
+        requestLog.warning("Catalog snapshot unavailable: %s", e)
+    return _snapshot
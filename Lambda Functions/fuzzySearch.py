@@ -0,0 +1,170 @@
+import os
+import heapq
+from array import array
+from collections import Counter
+import searchIndex
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional; without it scoring falls back to plain Python
+    np = None
+
+# Ranked fuzzy search for queryFunction ("match": "fuzzy"). Each distinct
+# title, artist and album value is broken into padded trigrams, and songs are
+# scored by the Dice similarity between the query and their field values, so
+# typos and partial names still match. Scoring runs over distinct values (far
+# fewer than songs for artists and albums) and only the top-k are sorted.
+
+FUZZY_FIELDS = ('title', 'artist', 'album')
+GRAM_SIZE = 3
+MIN_SCORE = float(os.environ.get('FUZZY_MIN_SCORE', '0.3'))
+
+
+def normalize(text):
+    return ' '.join(text.casefold().split())
+
+
+def grams(text):
+    # Padding lets word starts and ends count, so short names still score
+    padded = f' {normalize(text)} '
+    return {padded[i:i + GRAM_SIZE] for i in range(len(padded) - GRAM_SIZE + 1)}
+
+
+class _FieldIndex:
+    def __init__(self):
+        self.value_ids = {}
+        self.gram_ids = {}
+        self.gram_counts = array('I')   # value id -> distinct grams in the value
+        self.postings = []              # gram id -> value ids
+        self.doc_values = array('i')    # doc id -> value id, -1 when the song has no value
+
+    def add(self, value):
+        if not isinstance(value, str) or not value.strip():
+            self.doc_values.append(-1)
+            return
+        value_id = self.value_ids.get(value)
+        if value_id is None:
+            value_id = self.value_ids[value] = len(self.value_ids)
+            value_grams = grams(value)
+            self.gram_counts.append(len(value_grams))
+            for gram in value_grams:
+                gram_id = self.gram_ids.get(gram)
+                if gram_id is None:
+                    gram_id = self.gram_ids[gram] = len(self.postings)
+                    self.postings.append(array('I'))
+                self.postings[gram_id].append(value_id)
+        self.doc_values.append(value_id)
+
+    def freeze(self):
+        # Compressed postings: one flat array of value ids plus offsets per gram
+        self.offsets = array('Q', [0])
+        flat = array('I')
+        for values in self.postings:
+            flat.extend(values)
+            self.offsets.append(len(flat))
+        self.postings = None
+        if np is not None:
+            self.flat = np.frombuffer(flat, dtype=np.uint32) if flat else np.zeros(0, dtype=np.uint32)
+            self.gram_counts = np.frombuffer(self.gram_counts, dtype=np.uint32).astype(np.float32) if self.gram_counts else np.zeros(0, dtype=np.float32)
+            # Songs without a value point at a trailing slot that always scores 0
+            doc_values = np.frombuffer(self.doc_values, dtype=np.int32) if self.doc_values else np.zeros(0, dtype=np.int32)
+            self.doc_values = np.where(doc_values < 0, len(self.value_ids), doc_values)
+        else:
+            self.flat = flat
+            self.value_docs = {}
+            for doc_id, value_id in enumerate(self.doc_values):
+                if value_id >= 0:
+                    self.value_docs.setdefault(value_id, []).append(doc_id)
+
+    def _query_postings(self, query_grams):
+        for gram in query_grams:
+            gram_id = self.gram_ids.get(gram)
+            if gram_id is not None:
+                yield self.offsets[gram_id], self.offsets[gram_id + 1]
+
+    def similarities(self, query):
+        # Dice coefficient per distinct value, with an extra 0 for "no value"
+        query_grams = grams(query)
+        ranges = list(self._query_postings(query_grams))
+        if ranges:
+            shared = np.bincount(np.concatenate([self.flat[start:end] for start, end in ranges]),
+                                 minlength=len(self.value_ids) + 1)[:len(self.value_ids)]
+        else:
+            shared = np.zeros(len(self.value_ids), dtype=np.int64)
+        scores = 2.0 * shared / (len(query_grams) + self.gram_counts)
+        return np.append(scores.astype(np.float32), np.float32(0))
+
+    def similarities_python(self, query):
+        query_grams = grams(query)
+        shared = Counter()
+        for start, end in self._query_postings(query_grams):
+            shared.update(self.flat[start:end])
+        return {value_id: 2.0 * count / (len(query_grams) + self.gram_counts[value_id]) for value_id, count in shared.items()}
+
+
+class FuzzyIndex:
+    def __init__(self, items):
+        self.items = []
+        self.fields = {field: _FieldIndex() for field in FUZZY_FIELDS}
+        years = array('i')
+        self.year_ids = {}
+        for item in items:
+            self.items.append(item)
+            for field, index in self.fields.items():
+                index.add(item.get(field))
+            year = item.get('year')
+            years.append(self.year_ids.setdefault(year, len(self.year_ids)) if year is not None else -1)
+        for index in self.fields.values():
+            index.freeze()
+        self.years = np.frombuffer(years, dtype=np.int32) if np is not None and years else years
+
+    def __len__(self):
+        return len(self.items)
+
+    def search(self, queries, year=None, k=50, min_score=MIN_SCORE):
+        # queries maps field -> text; returns [(score, item)] best first
+        queries = {field: text for field, text in queries.items() if text and field in self.fields}
+        if not queries or not self.items or k <= 0:
+            return []
+        year_id = self.year_ids.get(year, -2) if year else None
+        if year_id == -2:
+            return []
+        if np is None:
+            return self._search_python(queries, year_id, k, min_score)
+
+        scores = np.zeros(len(self.items), dtype=np.float32)
+        for field, text in queries.items():
+            index = self.fields[field]
+            scores += index.similarities(text)[index.doc_values]
+        scores /= len(queries)
+        if year_id is not None:
+            scores[self.years != year_id] = 0
+
+        candidates = np.flatnonzero(scores >= min_score)
+        if len(candidates) > k:
+            # Partial selection: only the k best are ever sorted
+            candidates = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+        order = candidates[np.lexsort((candidates, -scores[candidates]))]
+        return [(round(float(scores[doc_id]), 4), self.items[doc_id]) for doc_id in order]
+
+    def _search_python(self, queries, year_id, k, min_score):
+        totals = Counter()
+        for field, text in queries.items():
+            index = self.fields[field]
+            for value_id, score in index.similarities_python(text).items():
+                for doc_id in index.value_docs[value_id]:
+                    totals[doc_id] += score
+        ranked = (
+            (score / len(queries), doc_id) for doc_id, score in totals.items()
+            if score / len(queries) >= min_score and (year_id is None or self.years[doc_id] == year_id)
+        )
+        best = heapq.nsmallest(k, ranked, key=lambda pair: (-pair[0], pair[1]))
+        return [(round(score, 4), self.items[doc_id]) for score, doc_id in best]
+
+
+_fuzzy = searchIndex.RefreshingIndex('fuzzy', FuzzyIndex)
+
+
+def get_index(music_table, version=None):
+    # Kept current with the catalog version like the search index
+    return _fuzzy.get(music_table, version)
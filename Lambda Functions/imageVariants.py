@@ -0,0 +1,61 @@
+import os
+
+# Resized copies of the song images. ingestImages writes a JPEG thumbnail and
+# WebP versions next to every original under their own key prefixes, and the
+# handlers sign the smallest variant that suits the view the client renders.
+# Result cards are a few hundred pixels wide at most, so the full-size
+# original is only signed when it is asked for.
+#
+#   IMAGE_DERIVATIVES=1   derivatives have been generated (unset: every view gets the original)
+
+ENABLED = os.environ.get('IMAGE_DERIVATIVES', '').lower() in ('1', 'true', 'yes')
+ORIGINAL_PREFIX = 'images/'
+
+# name -> (key prefix, longest edge in pixels, Pillow format, file extension, content type)
+VARIANTS = {
+    'thumbnail': ('thumbnails/', 160, 'JPEG', '.jpg', 'image/jpeg'),
+    'thumbnail.webp': ('webp/thumbnails/', 160, 'WEBP', '.webp', 'image/webp'),
+    'medium.webp': ('webp/medium/', 480, 'WEBP', '.webp', 'image/webp'),
+}
+
+# view -> (variant when the client takes WebP, variant otherwise); None is the original
+VIEWS = {
+    'card': ('thumbnail.webp', 'thumbnail'),
+    'detail': ('medium.webp', None),
+    'original': (None, None),
+}
+DEFAULT_VIEW = 'card'
+
+
+def variant_key(original_key, variant):
+    if variant is None or not original_key or not original_key.startswith(ORIGINAL_PREFIX):
+        return original_key
+    prefix, _, _, extension, _ = VARIANTS[variant]
+    stem = original_key[len(ORIGINAL_PREFIX):].rsplit('.', 1)[0]
+    return prefix + stem + extension
+
+
+def accepts_webp(event, params=None):
+    # <img> requests send image/webp, API calls usually don't, so the client may also say so explicitly
+    if (params or {}).get('image_format') == 'webp':
+        return True
+    headers = event.get('headers') or {}
+    accept = next((value for name, value in headers.items() if name.lower() == 'accept'), None) or ''
+    return 'image/webp' in accept
+
+
+def requested_view(event, params=None):
+    # "image_view" in the body or query string: card (default), detail or original
+    query = event.get('queryStringParameters') or {}
+    view = (params or {}).get('image_view') or query.get('image_view')
+    return view if view in VIEWS else DEFAULT_VIEW
+
+
+def selector(event, params=None):
+    # Maps an original image key to the key to sign for this request
+    if not ENABLED:
+        return lambda key: key
+    webp_variant, fallback = VIEWS[requested_view(event, params)]
+    variant = webp_variant if webp_variant and accepts_webp(event, params) else fallback
+    return lambda key: variant_key(key, variant)
+
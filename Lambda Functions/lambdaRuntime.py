@@ -0,0 +1,155 @@
+import time
+_IMPORT_STARTED = time.perf_counter()
+
+import os
+import base64
+import functools
+from types import MappingProxyType
+import boto3
+from botocore.config import Config
+import requestLog
+import responseEncoder
+import rateLimiter
+
+# Shared warm-start runtime for the Lambda handlers: AWS clients are created
+# lazily once per container with tuned connection settings, response headers
+# are prebuilt, and init/cold-start timings are recorded per function. With
+# STORAGE_BACKEND=memory or sqlite, DynamoDB and S3 are the local stand-ins
+# from storageBackend instead.
+
+REGION = 'us-east-1'
+CLIENT_CONFIG = Config(
+    region_name=REGION,
+    max_pool_connections=int(os.environ.get('MAX_POOL_CONNECTIONS', '16')),
+    tcp_keepalive=True,
+    connect_timeout=2,
+    read_timeout=10,
+    retries={'max_attempts': 3, 'mode': 'standard'}
+)
+# storageBackend is only imported when asked for, so deployed containers don't pay for it at init
+LOCAL_STORAGE = os.environ.get('STORAGE_BACKEND', 'dynamodb').lower() != 'dynamodb'
+
+_session = None
+_resources = {}
+_clients = {}
+_timings = {'client_init_ms': 0.0}
+_cold_start = True
+
+
+def session():
+    global _session
+    if _session is None:
+        _session = boto3.session.Session(region_name=REGION)
+    return _session
+
+
+def resource(service_name):
+    if service_name not in _resources:
+        started = time.perf_counter()
+        if service_name == 'dynamodb' and LOCAL_STORAGE:
+            import storageBackend
+            _resources[service_name] = storageBackend.resource()
+        else:
+            _resources[service_name] = session().resource(service_name, config=CLIENT_CONFIG)
+            requestLog.instrument(_resources[service_name].meta.client)
+            if service_name == 'dynamodb':
+                rateLimiter.install(_resources[service_name].meta.client)
+        _timings['client_init_ms'] += (time.perf_counter() - started) * 1000
+    return _resources[service_name]
+
+
+def client(service_name):
+    if service_name not in _clients:
+        started = time.perf_counter()
+        if service_name == 'dynamodb' and LOCAL_STORAGE:
+            import storageBackend
+            _clients[service_name] = storageBackend.resource().meta.client
+        elif service_name == 's3' and LOCAL_STORAGE:
+            import storageBackend
+            _clients[service_name] = storageBackend.presigner()
+        else:
+            _clients[service_name] = requestLog.instrument(session().client(service_name, config=CLIENT_CONFIG))
+            if service_name == 'dynamodb':
+                rateLimiter.install(_clients[service_name])
+        _timings['client_init_ms'] += (time.perf_counter() - started) * 1000
+    return _clients[service_name]
+
+
+class Lazy:
+    # Stands in for a client, resource or table until it is first used
+    def __init__(self, factory):
+        self._factory = factory
+        self._target = None
+
+    def __getattr__(self, name):
+        target = self._target
+        if target is None:
+            target = self._target = self._factory()
+        return getattr(target, name)
+
+
+dynamodb = Lazy(lambda: resource('dynamodb'))
+s3 = Lazy(lambda: client('s3'))
+
+
+def lazy_table(table_name):
+    return Lazy(lambda: resource('dynamodb').Table(table_name))
+
+
+def headers(content_type=False, methods=None, allow_headers=None):
+    # Immutable, built once per container; responses get a shallow copy
+    values = {}
+    if content_type:
+        values['Content-Type'] = 'application/json'
+    values['Access-Control-Allow-Origin'] = '*'
+    if methods:
+        values['Access-Control-Allow-Methods'] = methods
+    if allow_headers:
+        values['Access-Control-Allow-Headers'] = allow_headers
+    return MappingProxyType(values)
+
+
+def request_body(event, default=None):
+    # Body text of a proxy event; with binary media types such as */*, API Gateway base64-encodes it
+    body = event.get('body')
+    if body is None:
+        return default
+    if event.get('isBase64Encoded'):
+        return base64.b64decode(body).decode('utf-8')
+    return body
+
+
+def json_response(status_code, payload, response_headers):
+    return {'statusCode': status_code, 'headers': dict(response_headers), 'body': responseEncoder.dumps(payload)}
+
+
+def text_response(status_code, text, response_headers):
+    return {'statusCode': status_code, 'headers': dict(response_headers), 'body': text}
+
+
+def compressible(function):
+    # Compresses large response bodies for clients that send Accept-Encoding, when RESPONSE_COMPRESSION is on
+    @functools.wraps(function)
+    def wrapper(event, context):
+        return responseEncoder.compress_response(function(event, context), event)
+    return wrapper
+
+
+def init_complete(function_name):
+    # Called at the end of a handler module's import
+    _timings['function'] = function_name
+    _timings['init_ms'] = (time.perf_counter() - _IMPORT_STARTED) * 1000
+
+
+def start_invocation():
+    # Adds init timings to the request summary on the first invocation of the container
+    global _cold_start
+    if not _cold_start:
+        return False
+    _cold_start = False
+    requestLog.annotate(cold_start=True, init_ms=timings().get('init_ms'))
+    return True
+
+
+def timings():
+    return {name: round(value, 3) if isinstance(value, float) else value for name, value in _timings.items()}
@@ -1,91 +1,64 @@
+import lambdaRuntime as runtime
 import json
-import boto3
 import uuid
 import time
+import sessionTokens
+import requestLog
 
-dynamodb = boto3.resource('dynamodb', region_name='us-east-1')
-login_table = dynamodb.Table('login')  
-session_table = dynamodb.Table('sessions')  
+login_table = runtime.lazy_table('login')  
+session_table = runtime.lazy_table('sessions')  
 
+PREFLIGHT_HEADERS = runtime.headers(methods='*', allow_headers='Content-Type')
+HEADERS = runtime.headers(content_type=True, methods='*', allow_headers='Content-Type')
+log = requestLog.RequestLog('loginFunction')
+
+@log.handler
 def lambda_handler(event, context):
     try:
+        runtime.start_invocation()
         
-        print("Received eventRAGGGGGGGGGGHhh: " + json.dumps(event))
+        log.debug("Received event: %s", lambda: requestLog.dumps(requestLog.redact_event(event)))
         
         if event.get('httpMethod') == 'OPTIONS':
-            return {
-                'statusCode': 200,
-                'headers': {
-                    'Access-Control-Allow-Origin': '*',
-                    'Access-Control-Allow-Methods': '*',
-                    'Access-Control-Allow-Headers': 'Content-Type'
-                },
-                'body': json.dumps('CORS preflight successful')
-            }
+            return runtime.json_response(200, 'CORS preflight successful', PREFLIGHT_HEADERS)
         
        
-        body = json.loads(event['body'])
+        body = json.loads(runtime.request_body(event))
         email = body.get('email')
         password = body.get('password')
 
-        print(f"Received Email: {email}")
-        print(f"Received Password: {password}")
-
         response = login_table.get_item(Key={'email': email})
-        
-        print("DynamoDB Response: ", json.dumps(response))
 
         if 'Item' in response and response['Item'].get('password') == password:
-           
-            session_token = str(uuid.uuid4())
-            ttl = int(time.time()) + 3600  # Expire session after 1 hour (3600 seconds)
-            
-            
-            session_table.put_item(
-                Item={
-                    'session_token': session_token,
-                    'email': email,
-                    'created_at': int(time.time()),
-                    'ttl': ttl
-                }
-            )
-            
-            print(f"Session {email} with token {session_token}")
 
-            return {
-                'statusCode': 200,
-                'headers': {
-                    'Content-Type': 'application/json',
-                    'Access-Control-Allow-Origin': '*',
-                    'Access-Control-Allow-Methods': '*',
-                    'Access-Control-Allow-Headers': 'Content-Type'
-                },
-                'body': json.dumps({
-                    "success": True,
-                    "session_token": session_token,
-                    "session_expiration": ttl  
-                })
-            }
+            if sessionTokens.SIGNED:
+                # Self-contained token: nothing to write, nothing for other handlers to read back
+                session_token, ttl = sessionTokens.issue(email, response['Item'].get('user_name', email))
+            else:
+                session_token = str(uuid.uuid4())
+                ttl = int(time.time()) + sessionTokens.SESSION_LIFETIME  # Expire session after 1 hour (3600 seconds)
+
+                session_table.put_item(
+                    Item={
+                        'session_token': session_token,
+                        'email': email,
+                        'created_at': int(time.time()),
+                        'ttl': ttl
+                    }
+                )
+
+            log.set(session_mode=sessionTokens.SESSION_MODE)
+
+            return runtime.json_response(200, {
+                "success": True,
+                "session_token": session_token,
+                "session_expiration": ttl  
+            }, HEADERS)
         else:
-            return {
-                'statusCode': 401,
-                'headers': {
-                    'Content-Type': 'application/json',
-                    'Access-Control-Allow-Origin': '*',
-                    'Access-Control-Allow-Methods': '*',
-                    'Access-Control-Allow-Headers': 'Content-Type'
-                },
-                'body': json.dumps({"success": False, "message": "Email or password is invalid"})
-            }
+            return runtime.json_response(401, {"success": False, "message": "Email or password is invalid"}, HEADERS)
 
     except Exception as e:
-        return {
-            'statusCode': 500,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': '*',
-                'Access-Control-Allow-Headers': 'Content-Type'
-            },
-            'body': json.dumps({"error": str(e)})
-        }
+        log.error("Login failed: %s", e)
+        return runtime.json_response(500, {"error": str(e)}, HEADERS)
+
+runtime.init_complete('loginFunction')
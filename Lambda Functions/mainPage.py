@@ -1,108 +1,46 @@
-import json
-import boto3
-import time
-from decimal import Decimal
+import lambdaRuntime as runtime
+import sessionCache
+import requestLog
 
-dynamodb = boto3.resource('dynamodb', region_name='us-east-1')
-session_table = dynamodb.Table('sessions')
-login_table = dynamodb.Table('login')
+session_table = runtime.lazy_table('sessions')
+login_table = runtime.lazy_table('login')
+sessions = sessionCache.SessionCache(session_table, login_table)
 
-def decimal_to_float(obj):
-    if isinstance(obj, Decimal):
-        return float(obj)
-    if isinstance(obj, dict):
-        return {k: decimal_to_float(v) for k, v in obj.items()}
-    if isinstance(obj, list):
-        return [decimal_to_float(v) for v in obj]
-    return obj
+HEADERS = runtime.headers(content_type=True, methods='*', allow_headers='Content-Type, X-Session-Token')
+log = requestLog.RequestLog('mainPage')
 
+@log.handler
 def lambda_handler(event, context):
     try:
-        print("FULL EVENT RECEIVED: ", json.dumps(event))
+        runtime.start_invocation()
+
+        log.debug("Received event: %s", lambda: requestLog.dumps(requestLog.redact_event(event)))
 
         if 'headers' not in event or not isinstance(event['headers'], dict):
-            return {
-                'statusCode': 400,
-                'headers': {
-                    'Content-Type': 'application/json',
-                    'Access-Control-Allow-Origin': '*',
-                    'Access-Control-Allow-Methods': '*',
-                    'Access-Control-Allow-Headers': 'Content-Type, X-Session-Token'
-                },
-                'body': json.dumps({'error': 'Headers are missing from the request.'})
-            }
+            return runtime.json_response(400, {'error': 'Headers are missing from the request.'}, HEADERS)
 
         session_token = event['headers'].get('x-session-token') or event['headers'].get('X-Session-Token')
-        print(f"Received session token: {session_token}")
 
         if not session_token:
-            return {
-                'statusCode': 400,
-                'headers': {
-                    'Content-Type': 'application/json',
-                    'Access-Control-Allow-Origin': '*',
-                    'Access-Control-Allow-Methods': '*',
-                    'Access-Control-Allow-Headers': 'Content-Type, X-Session-Token'
-                },
-                'body': json.dumps({'error': 'Session token is missing.'})
-            }
+            return runtime.json_response(400, {'error': 'Session token is missing.'}, HEADERS)
+
+        session = sessions.resolve(session_token, with_profile=True)
+        log.set(session_cache=sessions.stats())
 
-        response = session_table.get_item(Key={'session_token': session_token})
-        response = decimal_to_float(response) 
-        
-        print("DynamoDB Response: ", json.dumps(response))
+        if session:
+            profile = session['profile']
 
-        if 'Item' in response:
-            if int(time.time()) < response['Item']['ttl']:
-                email = response['Item']['email']
-                
-                user_response = login_table.get_item(Key={'email': email})
-                user_response = decimal_to_float(user_response)  
-                
-                if 'Item' in user_response:
-                    user_name = user_response['Item'].get('user_name', email)
+            if profile is not None:
+                user_name = profile['user_name']
 
-                    return {
-                        'statusCode': 200,
-                        'headers': {
-                            'Content-Type': 'application/json',
-                            'Access-Control-Allow-Origin': '*',
-                            'Access-Control-Allow-Methods': '*',
-                            'Access-Control-Allow-Headers': 'Content-Type, X-Session-Token'
-                        },
-                        'body': json.dumps({'success': True, 'user_name': user_name})
-                    }
-                else:
-                    return {
-                        'statusCode': 404,
-                        'headers': {
-                            'Content-Type': 'application/json',
-                            'Access-Control-Allow-Origin': '*',
-                            'Access-Control-Allow-Methods': '*',
-                            'Access-Control-Allow-Headers': 'Content-Type, X-Session-Token'
-                        },
-                        'body': json.dumps({'success': False, 'message': 'User not found'})
-                    }
+                return runtime.json_response(200, {'success': True, 'user_name': user_name}, HEADERS)
+            else:
+                return runtime.json_response(404, {'success': False, 'message': 'User not found'}, HEADERS)
 
-        return {
-            'statusCode': 401,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': '*',
-                'Access-Control-Allow-Headers': 'Content-Type, X-Session-Token'
-            },
-            'body': json.dumps({'success': False, 'message': 'Invalid session token'})
-        }
+        return runtime.json_response(401, {'success': False, 'message': 'Invalid session token'}, HEADERS)
 
     except Exception as e:
-        return {
-            'statusCode': 500,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': '*',
-                'Access-Control-Allow-Headers': 'Content-Type, X-Session-Token'
-            },
-            'body': json.dumps({"error": str(e)})
-        }
+        log.error("Main page failed: %s", e)
+        return runtime.json_response(500, {"error": str(e)}, HEADERS)
+
+runtime.init_complete('mainPage')
@@ -0,0 +1,89 @@
+import time
+from collections import OrderedDict
+from boto3.dynamodb.conditions import Key
+
+# Per-user subscription membership for annotating query results. Each user's
+# subscriptions are read with one query and kept as a (title, year) -> uuid
+# map. A version item in the user's own partition is bumped on every
+# subscribe and unsubscribe; a single strongly consistent read of it tells a
+# container whether its cached map is still current. The same version tags
+# the subscription listing for conditional GETs.
+
+VERSION_UUID = '#version'     # user_subscriptions sort key of the per-user version item
+TITLE_INDEX = 'user-title-index'   # user_email, title_sort: a user's subscriptions in title order
+MAX_USERS = 1000
+
+
+def is_version_item(item):
+    return item.get('uuid') == VERSION_UUID
+
+
+def title_sort_key(title):
+    # Case-insensitive title order; the version item has no title, so it stays out of the index
+    return title.casefold() if title else None
+
+
+def bump_version(subscription_table, user_email):
+    subscription_table.update_item(
+        Key={'user_email': user_email, 'uuid': VERSION_UUID},
+        UpdateExpression='ADD version :one SET updated = :now',
+        ExpressionAttributeValues={':one': 1, ':now': int(time.time())}
+    )
+
+
+def read_version(subscription_table, user_email):
+    # (version, epoch seconds of the last change); a user who never subscribed is at (0, 0)
+    item = subscription_table.get_item(
+        Key={'user_email': user_email, 'uuid': VERSION_UUID},
+        ConsistentRead=True,
+        ProjectionExpression='version, updated'
+    ).get('Item')
+    return (int(item['version']), int(item.get('updated', 0))) if item else (0, 0)
+
+
+class MembershipCache:
+    def __init__(self, subscription_table, max_users=MAX_USERS):
+        self.subscription_table = subscription_table
+        self.max_users = max_users
+        self._users = OrderedDict()   # email -> (version, {(title, year): uuid}), least recently used first
+        self.hits = 0
+        self.misses = 0
+
+    def _version(self, user_email):
+        return read_version(self.subscription_table, user_email)[0]
+
+    def _load(self, user_email):
+        membership = {}
+        kwargs = {
+            'KeyConditionExpression': Key('user_email').eq(user_email),
+            'ProjectionExpression': '#t, #y, #u',
+            'ExpressionAttributeNames': {'#t': 'title', '#y': 'year', '#u': 'uuid'},
+            'ConsistentRead': True
+        }
+        while True:
+            response = self.subscription_table.query(**kwargs)
+            for item in response.get('Items', []):
+                if not is_version_item(item):
+                    membership[(item.get('title'), item.get('year'))] = item['uuid']
+            if 'LastEvaluatedKey' not in response:
+                return membership
+            kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+    def get(self, user_email):
+        version = self._version(user_email)
+        cached = self._users.get(user_email)
+        if cached is not None and cached[0] == version:
+            self._users.move_to_end(user_email)
+            self.hits += 1
+            return cached[1]
+
+        self.misses += 1
+        membership = self._load(user_email)
+        self._users[user_email] = (version, membership)
+        self._users.move_to_end(user_email)
+        while len(self._users) > self.max_users:
+            self._users.popitem(last=False)
+        return membership
+
+    def stats(self):
+        return {'users': len(self._users), 'hits': self.hits, 'misses': self.misses}
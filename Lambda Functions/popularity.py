@@ -0,0 +1,111 @@
+import os
+import random
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+import requestLog
+
+# Subscriber counts per song for trending and autocomplete ranking. Every
+# subscribe and unsubscribe ADDs to one of SHARDS counter items for the song,
+# picked at random, so a song many users follow at once spreads its writes
+# over several partitions instead of one hot key. A song's count is the sum of
+# its shards; rollupFunction adds them up periodically and stores ranked
+# lists that trendingFunction serves with a single read.
+#
+#   POPULARITY_TABLE=song_popularity   counter_key HASH
+#   POPULARITY_SHARDS=8
+
+TABLE_NAME = os.environ.get('POPULARITY_TABLE', 'song_popularity')
+SHARDS = int(os.environ.get('POPULARITY_SHARDS', '8'))
+SEPARATOR = '\x1f'            # Can't appear in a title, so keys never collide
+ROLLUP_PREFIX = SEPARATOR + 'top'
+SONG_FIELDS = ('title', 'year', 'artist', 'album', 'img_key')
+MAX_PARALLEL = 8
+
+
+def counter_key(title, year, shard):
+    return SEPARATOR.join((title, year, str(shard)))
+
+
+def rollup_key(scope, value=None):
+    # scope is 'overall', 'artist' or 'year'
+    return SEPARATOR.join((ROLLUP_PREFIX, scope) if value is None else (ROLLUP_PREFIX, scope, value))
+
+
+def _add(client, table_name, song, delta):
+    # Song attributes ride along on every shard, so rollups never need the catalog
+    names = {'#c': 'subscribers', '#s': 'shard'}
+    values = {':d': delta, ':s': song['shard']}
+    assignments = ['#s = :s']
+    for position, field in enumerate(SONG_FIELDS):
+        if song.get(field) is not None:
+            names[f'#f{position}'] = field
+            values[f':f{position}'] = song[field]
+            assignments.append(f'#f{position} = :f{position}')
+    client.update_item(
+        TableName=table_name,
+        Key={'counter_key': counter_key(song['title'], song['year'], song['shard'])},
+        UpdateExpression='ADD #c :d SET ' + ', '.join(assignments),
+        ExpressionAttributeNames=names,
+        ExpressionAttributeValues=values
+    )
+
+
+def record(table, songs, delta):
+    # delta is +1 per subscription created, -1 per subscription removed. Counting is
+    # best effort: a failed update is logged and never fails the subscription itself.
+    totals = Counter()
+    attributes = {}
+    for song in songs:
+        if song.get('title') and song.get('year'):
+            key = (song['title'], song['year'])
+            totals[key] += delta
+            attributes[key] = song
+    updates = [
+        (dict(attributes[key], shard=random.randrange(SHARDS)), amount)
+        for key, amount in totals.items() if amount
+    ]
+    if not updates:
+        return 0
+    # The resource's client is thread safe and takes plain Python values
+    client = table.meta.client
+
+    def apply(update):
+        try:
+            _add(client, table.name, *update)
+            return True
+        except Exception as e:
+            requestLog.warning("Popularity update failed for %s: %s", update[0].get('title'), e)
+            return False
+
+    if len(updates) == 1:
+        applied = int(apply(updates[0]))
+    else:
+        with ThreadPoolExecutor(max_workers=min(MAX_PARALLEL, len(updates))) as executor:
+            applied = sum(executor.map(apply, updates))
+    requestLog.annotate(popularity_updates=applied)
+    return applied
+
+
+def scan(table):
+    # One pass over the table: ({(title, year): (song attributes, subscribers)}, {rollup key: songs})
+    songs = {}
+    counts = Counter()
+    rollups = {}
+    kwargs = {}
+    while True:
+        response = table.scan(**kwargs)
+        for item in response.get('Items', []):
+            if 'shard' not in item:
+                rollups[item['counter_key']] = item.get('songs', [])
+                continue
+            key = (item.get('title'), item.get('year'))
+            counts[key] += int(item.get('subscribers', 0))
+            songs.setdefault(key, {field: item[field] for field in SONG_FIELDS if field in item})
+        if 'LastEvaluatedKey' not in response:
+            break
+        kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+    return {key: (songs[key], count) for key, count in counts.items() if count > 0}, rollups
+
+
+def scan_counts(table):
+    return scan(table)[0]
@@ -0,0 +1,129 @@
+import heapq
+from array import array
+from bisect import bisect_left
+
+# Compact prefix index for autocomplete over titles, artists and albums. Every
+# distinct value is stored once; a sorted array of normalized keys (the value
+# and each of its word starts, so "sto" finds "Love Story") is searched with
+# bisect. Prefixes that match many keys get their top completions precomputed,
+# so a lookup never ranks more than a small, fixed number of candidates.
+
+COMPLETION_FIELDS = ('title', 'artist', 'album')
+MAX_K = 20                  # Completions kept per precomputed prefix, and the most a request can ask for
+SCAN_LIMIT = 256            # Prefix ranges larger than this are precomputed
+MAX_PRECOMPUTED_LENGTH = 16
+MAX_WORD_STARTS = 6
+KEY_END = '\uffff'          # Sorts after every character used in keys
+
+
+def normalize(text):
+    return ' '.join(text.casefold().split())
+
+
+def word_starts(value):
+    words = normalize(value).split(' ')
+    return [' '.join(words[i:]) for i in range(min(len(words), MAX_WORD_STARTS)) if words[i]]
+
+
+class PrefixIndex:
+    def __init__(self, items, popularity=None, fields=COMPLETION_FIELDS):
+        # popularity maps (field, value) -> score, e.g. subscription counts
+        popularity = popularity or {}
+        entries = {}
+        for item in items:
+            for field in fields:
+                value = item.get(field)
+                if isinstance(value, str) and value.strip() and (field, value) not in entries:
+                    entries[(field, value)] = len(entries)
+
+        self.fields = tuple(fields)
+        self.values = [None] * len(entries)
+        self.entry_fields = array('B', [0]) * len(entries)
+        self.scores = array('q', [0]) * len(entries)
+        for (field, value), entry_id in entries.items():
+            self.values[entry_id] = value
+            self.entry_fields[entry_id] = self.fields.index(field)
+            self.scores[entry_id] = int(popularity.get((field, value), 0))
+
+        # Most popular first, then alphabetical; ranking compares plain ints from here on
+        order = sorted(range(len(self.values)), key=lambda i: (-self.scores[i], self.values[i].casefold()))
+        self.rank = array('I', [0]) * len(order)
+        for position, entry_id in enumerate(order):
+            self.rank[entry_id] = position
+
+        keys = []
+        ids = array('I')
+        for entry_id, value in enumerate(self.values):
+            for key in word_starts(value):
+                keys.append(key)
+                ids.append(entry_id)
+        order = sorted(range(len(keys)), key=keys.__getitem__)
+        # One sorted key array per scope: every field together, and each field alone on first use
+        self.scopes = {None: self._build_scope([keys[i] for i in order], array('I', [ids[i] for i in order]))}
+
+    def __len__(self):
+        return len(self.values)
+
+    def _top(self, entry_ids, k):
+        return heapq.nsmallest(k, set(entry_ids), key=self.rank.__getitem__)
+
+    def _scope(self, field):
+        scope = self.scopes.get(field)
+        if scope is None:
+            keys, ids, _ = self.scopes[None]
+            position = self.fields.index(field)
+            kept = [i for i, entry_id in enumerate(ids) if self.entry_fields[entry_id] == position]
+            scope = self.scopes[field] = self._build_scope([keys[i] for i in kept], array('I', [ids[i] for i in kept]))
+        return scope
+
+    def _build_scope(self, keys, ids):
+        precomputed = {}
+
+        def collect(start, end, length):
+            # keys[start:end] share their first `length` characters; returns the range's top completions
+            if end - start <= SCAN_LIMIT or length == MAX_PRECOMPUTED_LENGTH:
+                top = self._top(ids[start:end], MAX_K)
+            else:
+                # Children are ranked first, so each level only merges MAX_K candidates per child
+                candidates = []
+                position = start
+                while position < end:
+                    key = keys[position]
+                    if len(key) == length:
+                        candidates.append(ids[position])
+                        position += 1
+                        continue
+                    child_end = bisect_left(keys, key[:length + 1] + KEY_END, position, end)
+                    candidates.extend(collect(position, child_end, length + 1))
+                    position = child_end
+                top = self._top(candidates, MAX_K)
+            if end - start > SCAN_LIMIT and length:
+                precomputed[keys[start][:length]] = tuple(top)
+            return top
+
+        if keys:
+            collect(0, len(keys), 0)
+        return keys, ids, precomputed
+
+    def complete(self, prefix, k=10, field=None):
+        prefix = normalize(prefix)
+        if not prefix:
+            return []
+        keys, ids, precomputed = self._scope(field)
+        top = precomputed.get(prefix)
+        if top is None:
+            start = bisect_left(keys, prefix)
+            end = bisect_left(keys, prefix + KEY_END, start)
+            if end - start > SCAN_LIMIT:
+                # Only past MAX_PRECOMPUTED_LENGTH: rank the ancestor's completions that still match,
+                # plus the first SCAN_LIMIT keys of the range, instead of the whole range
+                ancestor = precomputed.get(prefix[:MAX_PRECOMPUTED_LENGTH], ())
+                matching = [entry_id for entry_id in ancestor
+                            if any(key.startswith(prefix) for key in word_starts(self.values[entry_id]))]
+                top = self._top(matching + list(ids[start:start + SCAN_LIMIT]), k)
+            else:
+                top = self._top(ids[start:end], k)
+        return [
+            {'field': self.fields[self.entry_fields[entry_id]], 'value': self.values[entry_id], 'score': self.scores[entry_id]}
+            for entry_id in top[:k]
+        ]
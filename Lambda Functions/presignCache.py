@@ -0,0 +1,79 @@
+import time
+from collections import OrderedDict
+import requestLog
+
+# Shared pre-signed URL signing for the query and subscription handlers.
+# Many songs point at the same artist image, so a key is signed once and the
+# URL is reused for as long as it still has enough lifetime left.
+
+URL_EXPIRATION = 3600      # Lifetime of every signed URL (1 hour)
+MIN_REMAINING = 900        # Only hand out a cached URL with at least 15 minutes left
+MAX_ENTRIES = 5000
+
+
+def image_key_for_url(img_url):
+    # Song images were copied from GitHub into images/ in the bucket
+    if not img_url or 'githubusercontent.com' not in img_url:
+        return None
+    img_name = img_url.split("/")[-1]
+    return f'images/{img_name}'
+
+
+class PresignedUrlCache:
+    def __init__(self, s3_client, bucket_name, expiration=URL_EXPIRATION,
+                 min_remaining=MIN_REMAINING, max_entries=MAX_ENTRIES):
+        self.s3 = s3_client
+        self.bucket_name = bucket_name
+        self.expiration = expiration
+        self.min_remaining = min_remaining
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # key -> (url, expires_at), least recently used first
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def generate_presigned_url(self, key):
+        try:
+            return self.s3.generate_presigned_url(
+                'get_object',
+                Params={'Bucket': self.bucket_name, 'Key': key},
+                ExpiresIn=self.expiration
+            )
+        except Exception as e:
+            requestLog.warning("Error generating pre-signed URL: %s", e)
+            return None
+
+    def get(self, key, now=None):
+        now = time.time() if now is None else now
+        entry = self._entries.get(key)
+        if entry is not None and entry[1] - now >= self.min_remaining:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+        self.misses += 1
+        url = self.generate_presigned_url(key)
+        if url is None:
+            return None
+        self._entries[key] = (url, now + self.expiration)
+        self._entries.move_to_end(key)
+        if len(self._entries) > self.max_entries:
+            self._evict(now)
+        return url
+
+    def sign_many(self, keys):
+        # Each distinct key is looked up once per response
+        now = time.time()
+        return {key: self.get(key, now) for key in set(keys)}
+
+    def _evict(self, now):
+        expired = [key for key, (_, expires_at) in self._entries.items() if expires_at - now < self.min_remaining]
+        for key in expired:
+            del self._entries[key]
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def stats(self):
+        return {'size': len(self._entries), 'hits': self.hits, 'misses': self.misses}
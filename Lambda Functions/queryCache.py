@@ -0,0 +1,225 @@
+import os
+import json
+import time
+import hashlib
+from collections import OrderedDict
+import lambdaRuntime as runtime
+import responseEncoder
+import requestLog
+
+# Result cache for queryFunction. Entries hold the raw, unsigned results of one
+# normalized query page and are keyed on the catalog version, so any change to
+# the music table makes older entries unreachable. An optional shared tier lets
+# containers reuse each other's results.
+#
+#   QUERY_CACHE_TTL=60              seconds an entry is served (0 disables the cache)
+#   QUERY_CACHE_MAX_BYTES=8388608   memory bound for the in-container tier
+#   QUERY_CACHE_TABLE=query_cache   shared tier in DynamoDB (cache_key HASH, TTL on expires)
+#   QUERY_CACHE_DIR=/tmp/qcache     shared tier in a local directory instead
+
+CACHE_TTL = int(os.environ.get('QUERY_CACHE_TTL', '60'))
+MAX_BYTES = int(os.environ.get('QUERY_CACHE_MAX_BYTES', str(8 * 1024 * 1024)))
+VERSION_KEY = '#catalog-version'
+VERSION_CHECK_INTERVAL = 5     # Seconds between reads of the shared catalog version
+MAX_SHARED_ITEM_BYTES = 350 * 1024   # Stay clear of the 400 KB DynamoDB item limit
+
+
+def cache_key(version, filters, match='contains', page_size=None, next_token=None):
+    # Field order, empty fields and surrounding whitespace never change the key
+    normalized = {field: value.strip() for field, value in filters.items() if value and value.strip()}
+    raw = json.dumps([version, sorted(normalized.items()), match, page_size, next_token or None])
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+class DynamoDBTier:
+    def __init__(self, table):
+        self.table = table
+
+    def get(self, key, now):
+        item = self.table.get_item(Key={'cache_key': key}).get('Item')
+        # DynamoDB deletes expired items lazily, so check expiry here too
+        if item is None or int(item.get('expires', 0)) <= now:
+            return None
+        return item.get('payload')
+
+    def put(self, key, payload, expires):
+        if len(payload) <= MAX_SHARED_ITEM_BYTES:
+            self.table.put_item(Item={'cache_key': key, 'payload': payload, 'expires': int(expires)})
+
+    def version(self):
+        item = self.table.get_item(Key={'cache_key': VERSION_KEY}).get('Item')
+        return int(item['version']) if item else 0
+
+    def bump(self):
+        response = self.table.update_item(
+            Key={'cache_key': VERSION_KEY},
+            UpdateExpression='ADD version :one',
+            ExpressionAttributeValues={':one': 1},
+            ReturnValues='UPDATED_NEW'
+        )
+        return int(response['Attributes']['version'])
+
+
+class FileTier:
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + '.json')
+
+    def _write(self, path, data):
+        temp_path = f'{path}.{os.getpid()}.tmp'
+        with open(temp_path, 'w') as file:
+            json.dump(data, file)
+        os.replace(temp_path, path)
+
+    def get(self, key, now):
+        try:
+            with open(self._path(key), 'r') as file:
+                entry = json.load(file)
+        except (OSError, ValueError):
+            return None
+        if entry.get('expires', 0) <= now:
+            return None
+        return entry.get('payload')
+
+    def put(self, key, payload, expires):
+        self._write(self._path(key), {'payload': payload, 'expires': expires})
+
+    def version(self):
+        try:
+            with open(os.path.join(self.directory, 'VERSION'), 'r') as file:
+                return int(file.read().strip() or 0)
+        except (OSError, ValueError):
+            return 0
+
+    def bump(self):
+        version = self.version() + 1
+        temp_path = os.path.join(self.directory, f'VERSION.{os.getpid()}.tmp')
+        with open(temp_path, 'w') as file:
+            file.write(str(version))
+        os.replace(temp_path, os.path.join(self.directory, 'VERSION'))
+        return version
+
+
+class QueryCache:
+    def __init__(self, ttl=CACHE_TTL, max_bytes=MAX_BYTES, shared=None):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.shared = shared
+        self._entries = OrderedDict()  # key -> (payload, expires_at), least recently used first
+        self._bytes = 0
+        self._version = 0
+        self._version_checked = 0
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def enabled(self):
+        return self.ttl > 0
+
+    def version(self, now=None):
+        now = time.time() if now is None else now
+        if self.shared is not None and now - self._version_checked >= VERSION_CHECK_INTERVAL:
+            self._version_checked = now
+            try:
+                self._version = max(self._version, self.shared.version())
+            except Exception as e:
+                requestLog.warning("Error reading query cache version: %s", e)
+        return self._version
+
+    def catalog_version(self, version=None):
+        # Only the shared tier's version is seen by every container; the local counter can't detect changes
+        if self.shared is None:
+            return None
+        return self.version() if version is None else version
+
+    def invalidate(self):
+        # Called when the music table changes; entries under the old version are never read again
+        self._entries.clear()
+        self._bytes = 0
+        self._version += 1
+        if self.shared is not None:
+            try:
+                self._version = max(self._version, self.shared.bump())
+            except Exception as e:
+                requestLog.warning("Error bumping query cache version: %s", e)
+        return self._version
+
+    def get(self, key, now=None):
+        # Returns a fresh copy of the cached page, or None
+        now = time.time() if now is None else now
+        entry = self._entries.get(key)
+        if entry is not None and entry[1] > now:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return json.loads(entry[0])
+        if entry is not None:
+            self._remove(key)
+
+        if self.shared is not None:
+            try:
+                payload = self.shared.get(key, now)
+            except Exception as e:
+                requestLog.warning("Error reading shared query cache: %s", e)
+                payload = None
+            if payload is not None:
+                self.shared_hits += 1
+                self._store(key, payload, now + self.ttl)
+                return json.loads(payload)
+
+        self.misses += 1
+        return None
+
+    def put(self, key, page, now=None):
+        now = time.time() if now is None else now
+        payload = responseEncoder.dumps(page)
+        self._store(key, payload, now + self.ttl)
+        if self.shared is not None:
+            try:
+                self.shared.put(key, payload, now + self.ttl)
+            except Exception as e:
+                requestLog.warning("Error writing shared query cache: %s", e)
+
+    def _store(self, key, payload, expires_at):
+        # A single page bigger than a quarter of the budget would just flush everything else
+        if len(payload) > self.max_bytes // 4:
+            return
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (payload, expires_at)
+        self._bytes += len(payload)
+        while self._bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+
+    def _remove(self, key):
+        payload, _ = self._entries.pop(key)
+        self._bytes -= len(payload)
+
+    def stats(self):
+        lookups = self.hits + self.shared_hits + self.misses
+        return {
+            'size': len(self._entries),
+            'bytes': self._bytes,
+            'hits': self.hits,
+            'shared_hits': self.shared_hits,
+            'misses': self.misses,
+            'hit_ratio': round((self.hits + self.shared_hits) / lookups, 3) if lookups else 0.0
+        }
+
+
+def from_environment():
+    table_name = os.environ.get('QUERY_CACHE_TABLE')
+    directory = os.environ.get('QUERY_CACHE_DIR')
+    shared = None
+    if table_name:
+        shared = DynamoDBTier(runtime.lazy_table(table_name))
+    elif directory:
+        shared = FileTier(directory)
+    return QueryCache(shared=shared)
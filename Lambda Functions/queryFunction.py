@@ -1,68 +1,249 @@
+import lambdaRuntime as runtime
+import os
 import json
-import boto3
+import base64
+import hashlib
 from boto3.dynamodb.conditions import Key, Attr
+import searchIndex
+import queryPlanner
+import queryCache
+import fuzzySearch
+import sessionCache
+import membershipCache
+import presignCache
+import imageVariants
+import responseEncoder
+import requestLog
 
-dynamodb = boto3.resource('dynamodb', region_name='us-east-1')
-music_table = dynamodb.Table('music')
-s3 = boto3.client('s3', region_name='us-east-1')
+music_table = runtime.lazy_table('music')
+session_table = runtime.lazy_table('sessions')
+subscription_table = runtime.lazy_table('user_subscriptions')
 BUCKET_NAME = 'rmit-music-images' 
+url_cache = presignCache.PresignedUrlCache(runtime.s3, BUCKET_NAME)
+result_cache = queryCache.from_environment()
+sessions = sessionCache.SessionCache(session_table)
+memberships = membershipCache.MembershipCache(subscription_table)
+SEARCH_INDEX_ENABLED = os.environ.get('SEARCH_INDEX_ENABLED', 'true').lower() == 'true'
+MAX_PAGE_SIZE = 1000
+FUZZY_PAGE_SIZE = 50   # Fuzzy results are ranked, so an unpaged request still gets one page
 
-def generate_presigned_url(bucket_name, key, expiration=3600):
-    try:
-        url = s3.generate_presigned_url(
-            'get_object',
-            Params={'Bucket': bucket_name, 'Key': key},
-            ExpiresIn=expiration
-        )
-        return url
-    except Exception as e:
-        print(f"Error generating pre-signed URL: {e}")
-        return None
+HEADERS = runtime.headers(methods='*', allow_headers='Content-Type, X-Session-Token')
+log = requestLog.RequestLog('queryFunction')
+
+TABLE_KEYS = ('title', 'year')
+INDEX_KEYS = {
+    'artist-title-index': ('artist', 'title'),
+    'album-title-index': ('album', 'title'),
+    'year-title-index': ('year', 'title'),
+    'title-year-index': ('title', 'year'),
+}
+
+def iter_pages(operation, **kwargs):
+    # Follows LastEvaluatedKey so results are never cut off at the 1 MB page limit
+    while True:
+        response = operation(**kwargs)
+        yield response.get('Items', []), response.get('LastEvaluatedKey')
+        if 'LastEvaluatedKey' not in response:
+            return
+        kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+def collect_page(operation, key_names, page_size=None, start_key=None, **kwargs):
+    if start_key:
+        kwargs['ExclusiveStartKey'] = start_key
+    if page_size and 'FilterExpression' not in kwargs:
+        kwargs['Limit'] = page_size
 
-def query_index(index_name, key_name, key_value):
-    response = music_table.query(
+    results = []
+    for items, last_key in iter_pages(operation, **kwargs):
+        for position, item in enumerate(items):
+            results.append(item)
+            if page_size and len(results) == page_size:
+                if last_key is None and position == len(items) - 1:
+                    return results, None
+                # Resume right after the last item handed to the client
+                return results, {name: item[name] for name in key_names}
+    return results, None
+
+def query_index(index_name, key_name, key_value, page_size=None, start_key=None):
+    key_names = set(TABLE_KEYS) | set(INDEX_KEYS[index_name])
+    return collect_page(
+        music_table.query,
+        key_names,
+        page_size=page_size,
+        start_key=start_key,
         IndexName=index_name,
         KeyConditionExpression=Key(key_name).eq(key_value)
     )
-    return response.get('Items', [])
 
+def query_fingerprint(title, year, artist, album, match='contains'):
+    raw = json.dumps([title, year, artist, album, match])
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()[:16]
+
+def encode_token(fingerprint, state):
+    raw = json.dumps({'q': fingerprint, **state}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+def decode_token(token, fingerprint):
+    if not token:
+        return {}
+    try:
+        state = json.loads(base64.urlsafe_b64decode(token.encode('ascii')))
+    except Exception:
+        raise ValueError("Invalid continuation token.")
+    # A token is only valid for the filters it was issued for
+    if not isinstance(state, dict) or state.pop('q', None) != fingerprint:
+        raise ValueError("Invalid continuation token.")
+    offset = state.get('o', 0)
+    if isinstance(offset, bool) or not isinstance(offset, int) or offset < 0:
+        raise ValueError("Invalid continuation token.")
+    start_key = state.get('k', {})
+    if not isinstance(start_key, dict) or not all(isinstance(value, str) for value in start_key.values()):
+        raise ValueError("Invalid continuation token.")
+    return state
+
+def iter_response_body(results, next_token, plan=None):
+    # Serialize item by item instead of building one large intermediate structure
+    yield '{"success":true,"results":['
+    for position, item in enumerate(results):
+        if position:
+            yield ','
+        yield responseEncoder.dumps(item)
+    yield ']'
+    if next_token:
+        yield ',"next_token":' + responseEncoder.dumps(next_token)
+    if plan:
+        yield ',"plan":' + responseEncoder.dumps(plan)
+    yield '}'
+
+def sign_images(results, select_key):
+    keys = {id(item): select_key(presignCache.image_key_for_url(item.get('img_url'))) for item in results}
+    urls = url_cache.sign_many(key for key in keys.values() if key)
+    for item in results:
+        presigned_url = urls.get(keys[id(item)])
+        if presigned_url:
+            item['img_url'] = presigned_url
+        yield item
+
+def annotate_subscriptions(results, membership):
+    # Subscription state for the session's user; cached pages stay user independent
+    for item in results:
+        subscription_uuid = membership.get((item.get('title'), item.get('year')))
+        item['subscribed'] = subscription_uuid is not None
+        if subscription_uuid is not None:
+            item['uuid'] = subscription_uuid
+        yield item
+
+def run_fuzzy_query(filters, page_size, cursor, fingerprint):
+    log.set(path='fuzzy')
+    plan = queryPlanner.Plan('fuzzy', filters, False)
+    plan.residual = ['year'] if 'year' in filters else []
+    offset = int(cursor.get('o', 0))
+    limit = page_size or FUZZY_PAGE_SIZE
+
+    index = fuzzySearch.get_index(music_table, result_cache.catalog_version())
+    # One extra result says whether there is another page
+    queries = {field: filters[field] for field in fuzzySearch.FUZZY_FIELDS if field in filters}
+    ranked = index.search(queries, filters.get('year'), offset + limit + 1)
+    results = [dict(item, score=score) for score, item in ranked[offset:offset + limit]]
+    next_token = encode_token(fingerprint, {'o': offset + limit}) if len(ranked) > offset + limit else None
+    return {'results': results, 'next_token': next_token, 'plan': plan.describe(), 'index_version': index.version}
+
+def run_query(filters, match, page_size, cursor, fingerprint):
+    # Plans and runs one query page; returns the unsigned results, the next token and the plan
+    if match == 'fuzzy' and any(field in filters for field in fuzzySearch.FUZZY_FIELDS):
+        return run_fuzzy_query(filters, page_size, cursor, fingerprint)
+    exact = match == 'exact'
+    title, year, artist, album = (filters.get(field, '') for field in ('title', 'year', 'artist', 'album'))
+    plan = queryPlanner.plan_query(filters, exact, SEARCH_INDEX_ENABLED)
+
+    results = []
+    next_key = None
+    next_state = None
+    index_version = None
+    start_key = cursor.get('k')
+
+    if plan.strategy == 'gsi':
+        field = plan.indexes[0]
+        log.set(path=queryPlanner.FIELD_INDEXES[field])
+        results, next_key = query_index(queryPlanner.FIELD_INDEXES[field], field, filters[field], page_size, start_key)
+
+    elif plan.strategy == 'scan':
+        log.set(path='scan')
+        filter_conditions = []
+
+        if title:
+            filter_conditions.append(Attr('title').eq(title) if exact else Attr('title').contains(title))
+        if year:
+            filter_conditions.append(Attr('year').eq(year))
+        if artist:
+            filter_conditions.append(Attr('artist').eq(artist) if exact else Attr('artist').contains(artist))
+        if album:
+            filter_conditions.append(Attr('album').eq(album) if exact else Attr('album').contains(album))
+
+        combined_filter = filter_conditions[0]
+        for condition in filter_conditions[1:]:
+            combined_filter = combined_filter & condition
+
+        results, next_key = collect_page(
+            music_table.scan,
+            TABLE_KEYS,
+            page_size=page_size,
+            start_key=start_key,
+            FilterExpression=combined_filter
+        )
+
+    elif plan.strategy in ('get-item', 'gsi-residual'):
+        log.set(path=plan.strategy)
+        results, next_key = queryPlanner.execute(plan, page_size, start_key)
+
+    else:
+        log.set(path=plan.strategy)
+        index = searchIndex.get_index(music_table, result_cache.catalog_version())
+        matches = index.search(title=title, year=year, artist=artist, album=album, exact=exact)
+        index_version = index.version
+        offset = int(cursor.get('o', 0))
+        end = offset + page_size if page_size else len(matches)
+        results = matches[offset:end]
+        if end < len(matches):
+            next_state = {'o': end}
+
+    if next_key:
+        next_state = {'k': next_key}
+    next_token = encode_token(fingerprint, next_state) if next_state else None
+    return {'results': results, 'next_token': next_token, 'plan': plan.describe(), 'index_version': index_version}
+
+@log.handler
+@runtime.compressible
 def lambda_handler(event, context):
     try:
-        print("FULL EVENT RECEIVED: ", json.dumps(event))
+        runtime.start_invocation()
+
+        # DynamoDB stream from the music table: bumps the catalog version every container
+        # checks, and updates this container's own index in place
+        if 'Records' in event:
+            version = result_cache.catalog_version(result_cache.invalidate()) if event['Records'] else None
+            applied = searchIndex.apply_stream_records(event['Records'], version)
+            log.set(stream_records=len(event['Records']), applied=applied)
+            return {'applied': applied}
+
+        log.debug("Received event: %s", lambda: requestLog.dumps(requestLog.redact_event(event)))
         
         method = event.get('httpMethod')
         headers = event.get('headers', {})
         session_token = headers.get('X-Session-Token') or headers.get('x-session-token')
         
-        print("HTTP Method: ", method)
-        print("Headers: ", headers)
-        print("Session Token: ", session_token)
-        
         if not session_token:
-            print("Session token is missing.")
-            return {
-                'statusCode': 400,
-                'headers': {
-                    'Access-Control-Allow-Origin': '*',
-                    'Access-Control-Allow-Methods': '*',
-                    'Access-Control-Allow-Headers': 'Content-Type, X-Session-Token'
-                },
-                'body': json.dumps({"error": "Session token missing."})
-            }
+            return runtime.json_response(400, {"error": "Session token missing."}, HEADERS)
 
         if method == 'OPTIONS':
-            return {
-                'statusCode': 200,
-                'headers': {
-                    'Access-Control-Allow-Origin': '*',
-                    'Access-Control-Allow-Methods': '*',
-                    'Access-Control-Allow-Headers': 'Content-Type, X-Session-Token'
-                },
-                'body': 'CORS preflight successful'
-            }
+            return runtime.text_response(200, 'CORS preflight successful', HEADERS)
 
         if method == 'POST':
-            body = json.loads(event.get('body', '{}'))
+            session = sessions.resolve(session_token)
+            if session is None:
+                return runtime.json_response(401, {"error": "Invalid session token."}, HEADERS)
+
+            body = json.loads(runtime.request_body(event, '{}'))
 
             title = body.get('title', '').strip()
             year = body.get('year', '').strip()
@@ -70,99 +251,67 @@ def lambda_handler(event, context):
             album = body.get('album', '').strip()
 
             if not (title or year or artist or album):
-                print("No query parameters provided. At least one is required.")
-                return {
-                    'statusCode': 400,
-                    'headers': {
-                        'Access-Control-Allow-Origin': '*',
-                        'Access-Control-Allow-Methods': '*',
-                        'Access-Control-Allow-Headers': 'Content-Type, X-Session-Token'
-                    },
-                    'body': json.dumps({"error": "You must provide at least one filter: title, year, artist, or album."})
-                }
-
-            results = []
-
-            if artist and not year and not title and not album:
-                print("Querying artist-title-index")
-                results = query_index('artist-title-index', 'artist', artist)
-
-            elif album and not year and not title and not artist:
-                print("Querying album-title-index")
-                results = query_index('album-title-index', 'album', album)
-
-            elif year and not title and not artist and not album:
-                print("Querying year-title-index")
-                results = query_index('year-title-index', 'year', year)
-            
-            elif title and not year and not artist and not album:
-                print("Querying title-year-index")
-                results = query_index('title-year-index', 'title', title)
-            
-            else:
-                print("Using Scan operation for more complex queries")
-                filter_conditions = []
-                
-                if title:
-                    filter_conditions.append(Attr('title').contains(title))
-                if year:
-                    filter_conditions.append(Attr('year').eq(year))
-                if artist:
-                    filter_conditions.append(Attr('artist').contains(artist))
-                if album:
-                    filter_conditions.append(Attr('album').contains(album))
-
-                if filter_conditions:
-                    combined_filter = filter_conditions[0]
-                    for condition in filter_conditions[1:]:
-                        combined_filter = combined_filter & condition
-
-                    response = music_table.scan(
-                        FilterExpression=combined_filter
-                    )
-                    results = response.get('Items', [])
-                else:
-                    response = music_table.scan()
-                    results = response.get('Items', [])
-
-            
-            for item in results:
-                if 'img_url' in item and 'githubusercontent.com' in item['img_url']:
-                    img_name = item['img_url'].split("/")[-1]
-                    s3_key = f'images/{img_name}'
-                    presigned_url = generate_presigned_url(BUCKET_NAME, s3_key)
-                    if presigned_url:
-                        item['img_url'] = presigned_url
-            
-            print("Items Retrieved: ", results)
-
-            return {
-                'statusCode': 200,
-                'headers': {
-                    'Access-Control-Allow-Origin': '*',
-                    'Access-Control-Allow-Methods': '*',
-                    'Access-Control-Allow-Headers': 'Content-Type, X-Session-Token'
-                },
-                'body': json.dumps({"success": True, "results": results})
-            }
-
-        return {
-            'statusCode': 405,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': '*',
-                'Access-Control-Allow-Headers': 'Content-Type, X-Session-Token'
-            },
-            'body': json.dumps({"error": "Method not allowed."})
-        }
+                return runtime.json_response(400, {"error": "You must provide at least one filter: title, year, artist, or album."}, HEADERS)
+
+            page_size = body.get('page_size')
+            if page_size is not None:
+                try:
+                    page_size = int(page_size)
+                except (TypeError, ValueError):
+                    page_size = 0
+                if not 1 <= page_size <= MAX_PAGE_SIZE:
+                    return runtime.json_response(400, {"error": f"page_size must be between 1 and {MAX_PAGE_SIZE}."}, HEADERS)
+
+            match = body.get('match') if body.get('match') in ('exact', 'fuzzy') else 'contains'
+            explain = body.get('explain') is True
+
+            fingerprint = query_fingerprint(title, year, artist, album, match)
+            try:
+                cursor = decode_token(body.get('next_token'), fingerprint)
+            except ValueError as e:
+                return runtime.json_response(400, {"error": str(e)}, HEADERS)
+
+            filters = {field: value for field, value in (('title', title), ('year', year), ('artist', artist), ('album', album)) if value}
+
+            # Cached pages hold unsigned results, images are signed fresh for every response
+            page = None
+            key = None
+            version = None
+            if result_cache.enabled:
+                version = result_cache.version()
+                key = queryCache.cache_key(version, filters, match, page_size, body.get('next_token'))
+                page = result_cache.get(key)
+            log.set(cache='hit' if page is not None else 'miss' if key else 'off')
+            if page is None:
+                page = run_query(filters, match, page_size, cursor, fingerprint)
+                # A page from an in-memory index that is still being rebuilt must not be
+                # stored under the new version's key, where it would outlive the rebuild
+                index_version = page.pop('index_version', None)
+                if key and index_version in (None, result_cache.catalog_version(version)):
+                    result_cache.put(key, page)
+                elif key:
+                    log.set(cache='stale-index')
+            if result_cache.enabled:
+                log.set(query_cache=result_cache.stats())
+            results = page['results']
+            next_token = page['next_token']
+            # One version read per request; the user's subscriptions are only queried when they changed
+            membership = memberships.get(session['email']) if results else {}
+
+            # Plan diagnostics are opt-in: "explain": true in the body, or the debug metrics header
+            plan_details = page['plan'] if explain or requestLog.wants_debug_metrics(event) else None
+
+            with log.timed('s3.presign'):
+                response_body = ''.join(iter_response_body(annotate_subscriptions(sign_images(results, imageVariants.selector(event, body)), membership), next_token, plan_details))
+            log.set(results=len(results))
+            log.debug("Items retrieved: %s", lambda: requestLog.dumps(results))
+
+            return runtime.text_response(200, response_body, HEADERS)
+
+        return runtime.json_response(405, {"error": "Method not allowed."}, HEADERS)
 
     except Exception as e:
-        return {
-            'statusCode': 500,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': '*',
-                'Access-Control-Allow-Headers': 'Content-Type, X-Session-Token'
-            },
-            'body': json.dumps({"error": str(e)})
-        }
+        log.error("Query failed: %s", e)
+        return runtime.json_response(500, {"error": str(e)}, HEADERS)
+
+runtime.init_complete('queryFunction')
@@ -0,0 +1,198 @@
+import lambdaRuntime as runtime
+import searchIndex
+
+# Chooses how queryFunction answers a filter combination: a GetItem when title
+# and year are both matched exactly, one GSI, a GSI plus in-memory residual
+# filters, the in-memory search index, or a full scan. Plans are compared by
+# estimated read capacity using the best statistics available in the container.
+#
+# A residual plan streams its one index a page at a time and checks the other
+# filters on each item (every index projects all song attributes), so a page
+# never reads more than READ_BUDGET index rows: a short page with a next token
+# is returned instead, and the next page resumes from that key.
+
+TABLE_NAME = 'music'
+FIELD_INDEXES = {
+    'title': 'title-year-index',
+    'artist': 'artist-title-index',
+    'album': 'album-title-index',
+    'year': 'year-title-index',
+}
+AVG_ITEM_BYTES = 256
+DEFAULT_CATALOG_SIZE = 100000
+READ_BUDGET = 1000   # Index rows one page of a residual plan may read
+SELECTIVITY = ('album', 'artist', 'title', 'year')   # Usually most selective first
+
+# Lower wins when estimated costs tie
+PREFERENCE = {'gsi': 0, 'search-index': 1, 'gsi-residual': 2, 'scan': 3}
+
+_observed_rows = {}   # (field, value) -> rows in the index partition, from the last full read
+_catalog_size = None
+
+
+def read_rcu(rows):
+    # Eventually consistent reads: 0.5 RCU per 4 KB read, at least one unit per request
+    return max(0.5, rows * AVG_ITEM_BYTES / 4096 * 0.5)
+
+
+class Plan:
+    def __init__(self, strategy, filters, exact, indexes=(), estimated_rcu=0.0, statistics='none'):
+        self.strategy = strategy
+        self.filters = filters
+        self.exact = exact
+        self.indexes = list(indexes)
+        self.residual = [field for field in filters if field not in self.indexes]
+        self.estimated_rcu = estimated_rcu
+        self.statistics = statistics
+        self.consumed_rcu = None
+        self.candidates = None
+
+    def describe(self):
+        plan = {
+            'strategy': self.strategy,
+            'indexes': [FIELD_INDEXES[field] for field in self.indexes],
+            'residual': self.residual,
+            'estimated_rcu': round(self.estimated_rcu, 2),
+            'statistics': self.statistics
+        }
+        if self.consumed_rcu is not None:
+            plan['consumed_rcu'] = round(self.consumed_rcu, 2)
+        if self.candidates is not None:
+            plan['candidates'] = self.candidates
+        return plan
+
+
+def catalog_size(index=None):
+    global _catalog_size
+    if index is not None:
+        return len(index)
+    if _catalog_size is None:
+        # ItemCount is refreshed by DynamoDB about every six hours, which is plenty for costing
+        try:
+            _catalog_size = runtime.dynamodb.meta.client.describe_table(TableName=TABLE_NAME)['Table']['ItemCount']
+        except Exception:
+            _catalog_size = DEFAULT_CATALOG_SIZE
+    return _catalog_size
+
+
+def estimate_rows(field, value, index=None):
+    if index is not None:
+        return index.count(field, value)
+    return _observed_rows.get((field, value))
+
+
+def plan_query(filters, exact=False, search_index_enabled=True):
+    # filters maps field -> non-empty value; year is always eq(), other fields eq() only when exact
+    eq_fields = [field for field in filters if field == 'year' or exact]
+    index = searchIndex.current_index() if search_index_enabled else None
+
+    if exact and 'title' in filters and 'year' in filters:
+        # The whole primary key: one item at most
+        plan = Plan('get-item', filters, exact, estimated_rcu=read_rcu(1), statistics='key')
+        plan.residual = [field for field in filters if field not in ('title', 'year')]
+        return plan
+
+    if len(filters) == 1:
+        field = next(iter(filters))
+        rows = estimate_rows(field, filters[field], index)
+        return Plan('gsi', filters, exact, [field], read_rcu(rows or 1), 'catalog' if index else 'observed' if rows else 'none')
+
+    scan_rcu = read_rcu(catalog_size(index))
+    candidates = [Plan('scan', filters, exact, estimated_rcu=scan_rcu)]
+    if search_index_enabled:
+        # Free once built; the first query in a container pays for the build scan
+        candidates.append(Plan('search-index', filters, exact, estimated_rcu=0.0 if index else scan_rcu))
+
+    if eq_fields:
+        estimates = {field: estimate_rows(field, filters[field], index) for field in eq_fields}
+        if all(rows is not None for rows in estimates.values()):
+            # Statistics for every field: read only the most selective index
+            best = min(eq_fields, key=lambda field: estimates[field])
+            candidates.append(Plan('gsi-residual', filters, exact, [best], read_rcu(estimates[best]),
+                                   'catalog' if index else 'observed'))
+        else:
+            # Selectivity unknown: drive from the field that is usually the most selective
+            field = min(eq_fields, key=SELECTIVITY.index)
+            candidates.append(Plan('gsi-residual', filters, exact, [field], read_rcu(catalog_size(index) / 50)))
+
+    return min(candidates, key=lambda plan: (plan.estimated_rcu, PREFERENCE[plan.strategy]))
+
+
+def matches(item, filters, fields, exact):
+    for field in fields:
+        value = item.get(field)
+        if field == 'year' or exact:
+            if value != filters[field]:
+                return False
+        elif not isinstance(value, str) or filters[field] not in value:
+            return False
+    return True
+
+
+def _get_item(plan):
+    response = runtime.dynamodb.meta.client.get_item(
+        TableName=TABLE_NAME,
+        Key={'title': plan.filters['title'], 'year': plan.filters['year']},
+        ProjectionExpression='#t, #y, artist, album, img_url',
+        ExpressionAttributeNames={'#t': 'title', '#y': 'year'},
+        ReturnConsumedCapacity='TOTAL'
+    )
+    item = response.get('Item')
+    plan.consumed_rcu = float(response.get('ConsumedCapacity', {}).get('CapacityUnits', 0))
+    plan.candidates = 1 if item else 0
+    return [item] if item and matches(item, plan.filters, plan.residual, plan.exact) else []
+
+
+def _stream_index(plan, page_size, start_key):
+    # The resource's client (de)serializes DynamoDB types for us
+    client = runtime.dynamodb.meta.client
+    field = plan.indexes[0]
+    key_names = {'title', 'year', field}
+    kwargs = {
+        'TableName': TABLE_NAME,
+        'IndexName': FIELD_INDEXES[field],
+        'KeyConditionExpression': '#k = :v',
+        'ExpressionAttributeNames': {'#k': field},
+        'ExpressionAttributeValues': {':v': plan.filters[field]},
+        'ReturnConsumedCapacity': 'TOTAL'
+    }
+    if start_key:
+        kwargs['ExclusiveStartKey'] = start_key
+    results = []
+    read = 0
+    plan.consumed_rcu = 0.0
+    try:
+        while True:
+            if page_size:
+                kwargs['Limit'] = READ_BUDGET - read
+            response = client.query(**kwargs)
+            plan.consumed_rcu += float(response.get('ConsumedCapacity', {}).get('CapacityUnits', 0))
+            items = response.get('Items', [])
+            last_key = response.get('LastEvaluatedKey')
+            for position, item in enumerate(items):
+                read += 1
+                if not matches(item, plan.filters, plan.residual, plan.exact):
+                    continue
+                results.append(item)
+                if page_size and len(results) == page_size:
+                    if last_key is None and position == len(items) - 1:
+                        return results, None
+                    # Resume right after the last item handed to the client
+                    return results, {name: item[name] for name in key_names}
+            if last_key is None:
+                if not start_key:
+                    _observed_rows[(field, plan.filters[field])] = read
+                return results, None
+            if page_size and read >= READ_BUDGET:
+                # Out of budget: a short page, the next one carries on from here
+                return results, last_key
+            kwargs['ExclusiveStartKey'] = last_key
+    finally:
+        plan.candidates = read
+
+
+def execute(plan, page_size=None, start_key=None):
+    # Runs get-item and gsi-residual plans; returns one page of results and the key to resume from
+    if plan.strategy == 'get-item':
+        return _get_item(plan), None
+    return _stream_index(plan, page_size, start_key)
@@ -0,0 +1,238 @@
+import os
+import time
+import random
+import threading
+import requestLog
+
+# Client-side throttling for every DynamoDB caller, handlers and bulk jobs alike.
+# Each table gets a read and a write token bucket whose rate adapts to the
+# service: consumed capacity is charged as responses arrive, throttles halve
+# the rate and successful calls grow it back. Throttled requests are retried
+# with jittered exponential backoff and the number of calls in flight is
+# capped, so bursts queue briefly instead of failing.
+#
+#   RATE_LIMIT_MAX_UNITS=1000     starting and maximum units per second per table and kind
+#   RATE_LIMIT_MAX_WAIT=2         longest a call waits for tokens before going ahead anyway
+#   RATE_LIMIT_MAX_IN_FLIGHT=64   concurrent DynamoDB calls per process
+
+THROTTLE_CODES = frozenset({'ProvisionedThroughputExceededException', 'ThrottlingException', 'RequestLimitExceeded'})
+MAX_UNITS = float(os.environ.get('RATE_LIMIT_MAX_UNITS', '1000'))
+MIN_UNITS = 1.0
+MAX_WAIT = float(os.environ.get('RATE_LIMIT_MAX_WAIT', '2'))
+MAX_IN_FLIGHT = int(os.environ.get('RATE_LIMIT_MAX_IN_FLIGHT', '64'))
+MAX_ATTEMPTS = 6
+BASE_DELAY = 0.05
+MAX_DELAY = 5.0
+
+
+def jittered_delay(attempt, base=BASE_DELAY, cap=MAX_DELAY):
+    # Full jitter so concurrent callers don't retry in lockstep
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+class TokenBucket:
+    def __init__(self, rate=MAX_UNITS, max_rate=MAX_UNITS, min_rate=MIN_UNITS):
+        self.rate = rate
+        self.max_rate = max_rate
+        self.min_rate = min_rate
+        self.tokens = rate       # Up to one second of burst
+        self.updated = time.monotonic()
+        self.throttles = 0
+        self.waited_ms = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, units, max_wait=MAX_WAIT):
+        # Returns seconds waited; the balance may go negative and later callers pay it back
+        started = time.monotonic()
+        deadline = started + max_wait
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self.tokens >= min(units, self.rate) or now >= deadline:
+                    self.tokens -= units
+                    waited = now - started
+                    self.waited_ms += waited * 1000
+                    return waited
+                delay = min(deadline - now, (min(units, self.rate) - self.tokens) / self.rate)
+            time.sleep(delay)
+
+    def charge(self, units):
+        # Difference between the capacity a call really consumed and what it reserved
+        with self._lock:
+            self.tokens -= units
+
+    def throttled(self):
+        with self._lock:
+            self.throttles += 1
+            self.rate = max(self.min_rate, self.rate / 2)
+            self.tokens = min(self.tokens, 0.0)
+
+    def succeeded(self):
+        # Additive increase: about one more unit per second for every call that went through
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + 1.0)
+
+
+class AdaptiveLimiter:
+    def __init__(self, max_units=MAX_UNITS, max_in_flight=MAX_IN_FLIGHT, max_wait=MAX_WAIT):
+        self.max_units = max_units
+        self.max_wait = max_wait
+        self.max_in_flight = max_in_flight
+        self._slots = threading.BoundedSemaphore(max_in_flight)
+        self._buckets = {}
+        self._estimates = {}     # (table, operation) -> capacity units the last call consumed
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.retries = 0
+
+    def bucket(self, table_name, kind):
+        key = (table_name, kind)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            with self._lock:
+                bucket = self._buckets.setdefault(key, TokenBucket(self.max_units, self.max_units))
+        return bucket
+
+    @staticmethod
+    def _tables(params):
+        if 'TableName' in params:
+            return [params['TableName']]
+        if 'RequestItems' in params:
+            return list(params['RequestItems'])
+        return [item[kind]['TableName'] for item in params.get('TransactItems', []) for kind in item]
+
+    def _parameters(self, params=None, model=None, context=None, **kwargs):
+        # The request body is already serialized by before-call, so note the tables here
+        if context is None or params is None:
+            return
+        context['rate_limit_tables'] = self._tables(params)
+        # Consumed capacity is what keeps the buckets honest
+        if model is not None and 'ReturnConsumedCapacity' in model.input_shape.members:
+            params.setdefault('ReturnConsumedCapacity', 'TOTAL')
+
+    def _before_call(self, model=None, context=None, **kwargs):
+        if context is None or 'rate_limit' in context:
+            return
+        kind = 'read' if model.name in requestLog.READ_OPERATIONS else 'write'
+        # A slot that can't be had in time is skipped rather than failing the call
+        slot = self._slots.acquire(timeout=self.max_wait)
+        with self._lock:
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        reserved = {}
+        waited = 0.0
+        for table_name in context.get('rate_limit_tables', ()):
+            units = self._estimates.get((table_name, model.name), 1.0)
+            waited += self.bucket(table_name, kind).acquire(units, self.max_wait)
+            reserved[table_name] = units
+        context['rate_limit'] = (kind, reserved, slot)
+        if waited:
+            requestLog.increment(rate_limit_wait_ms=round(waited * 1000, 2))
+
+    def _release(self, context):
+        state = context.pop('rate_limit', None) if context is not None else None
+        if state is not None:
+            with self._lock:
+                self.in_flight -= 1
+            if state[2]:
+                self._slots.release()
+        return state
+
+    def _after_call(self, model=None, parsed=None, context=None, **kwargs):
+        state = self._release(context)
+        if state is None:
+            return
+        kind, reserved, _ = state
+        parsed = parsed or {}
+        consumed = parsed.get('ConsumedCapacity')
+        for entry in consumed if isinstance(consumed, list) else [consumed] if consumed else []:
+            table_name = entry.get('TableName')
+            units = float(entry.get('CapacityUnits', 0))
+            if table_name in reserved:
+                self.bucket(table_name, kind).charge(units - reserved[table_name])
+                self._estimates[(table_name, model.name)] = max(units, 0.5)
+
+        error = parsed.get('Error', {}).get('Code')
+        # Unprocessed batch entries are DynamoDB's way of throttling part of a batch
+        partial = parsed.get('UnprocessedItems') or parsed.get('UnprocessedKeys') or {}
+        for table_name in reserved:
+            if error in THROTTLE_CODES:
+                continue  # Already counted by the retry handler
+            if table_name in partial:
+                self.bucket(table_name, kind).throttled()
+                requestLog.increment(throttles=1)
+            elif not error:
+                self.bucket(table_name, kind).succeeded()
+
+    def _after_call_error(self, context=None, **kwargs):
+        self._release(context)
+
+    def _needs_retry(self, response=None, attempts=None, operation=None, request_dict=None, **kwargs):
+        if response is None:
+            return None
+        code = response[1].get('Error', {}).get('Code')
+        if code not in THROTTLE_CODES:
+            return None
+        kind = 'read' if operation.name in requestLog.READ_OPERATIONS else 'write'
+        for table_name in self._tables_from_context(request_dict):
+            self.bucket(table_name, kind).throttled()
+        requestLog.increment(throttles=1)
+        if attempts >= MAX_ATTEMPTS:
+            return None
+        with self._lock:
+            self.retries += 1
+        return jittered_delay(attempts)
+
+    @staticmethod
+    def _tables_from_context(request_dict):
+        state = ((request_dict or {}).get('context') or {}).get('rate_limit')
+        return list(state[1]) if state else []
+
+    def install(self, client):
+        # Hooks a DynamoDB client; registered first so this handler decides throttle retries
+        events = client.meta.events
+        events.register('before-parameter-build.dynamodb', self._parameters)
+        events.register('before-call.dynamodb', self._before_call)
+        events.register('after-call.dynamodb', self._after_call)
+        events.register('after-call-error.dynamodb', self._after_call_error)
+        events.register_first('needs-retry.dynamodb', self._needs_retry)
+        return client
+
+    def stats(self):
+        return {
+            'in_flight': self.in_flight,
+            'peak_in_flight': self.peak_in_flight,
+            'retries': self.retries,
+            'tables': {
+                f'{table_name}.{kind}': {
+                    'rate': round(bucket.rate, 1),
+                    'throttles': bucket.throttles,
+                    'waited_ms': round(bucket.waited_ms, 1)
+                }
+                for (table_name, kind), bucket in self._buckets.items()
+            }
+        }
+
+
+_shared = None
+_shared_lock = threading.Lock()
+
+
+def shared():
+    # One limiter per process, so handlers and bulk jobs see the same buckets
+    global _shared
+    if _shared is None:
+        with _shared_lock:
+            if _shared is None:
+                _shared = AdaptiveLimiter()
+    return _shared
+
+
+def install(client, limiter=None):
+    return (limiter or shared()).install(client)
@@ -1,25 +1,24 @@
+import lambdaRuntime as runtime
 import json
-import boto3
+import requestLog
 
-dynamodb = boto3.resource('dynamodb', region_name='us-east-1')
-table = dynamodb.Table('login')  
+table = runtime.lazy_table('login')  
 
+PREFLIGHT_HEADERS = runtime.headers(methods='*', allow_headers='Content-Type')
+HEADERS = runtime.headers(content_type=True)
+log = requestLog.RequestLog('registerFunction')
+
+@log.handler
 def lambda_handler(event, context):
     try:
-        print("Received event: " + json.dumps(event))
+        runtime.start_invocation()
+
+        log.debug("Received event: %s", lambda: requestLog.dumps(requestLog.redact_event(event)))
 
         if event.get('httpMethod') == 'OPTIONS':
-            return {
-                'statusCode': 200,
-                'headers': {
-                    'Access-Control-Allow-Origin': '*',
-                    'Access-Control-Allow-Methods': '*',
-                    'Access-Control-Allow-Headers': 'Content-Type'
-                },
-                'body': json.dumps('CORS preflight successful')
-            }
+            return runtime.json_response(200, 'CORS preflight successful', PREFLIGHT_HEADERS)
 
-        body = json.loads(event['body'])
+        body = json.loads(runtime.request_body(event))
 
         # Normalize email input (trim + lowercase)
         raw_email = body.get('email', '')
@@ -29,27 +28,13 @@ def lambda_handler(event, context):
         password = body.get('password')
 
         if not email or not user_name or not password:
-            return {
-                'statusCode': 400,
-                'headers': {
-                    'Content-Type': 'application/json',
-                    'Access-Control-Allow-Origin': '*'
-                },
-                'body': json.dumps({"success": False, "message": "Missing email, username or password"})
-            }
+            return runtime.json_response(400, {"success": False, "message": "Missing email, username or password"}, HEADERS)
 
         
         response = table.get_item(Key={'email': email})
 
         if 'Item' in response:
-            return {
-                'statusCode': 409,  # Conflict
-                'headers': {
-                    'Content-Type': 'application/json',
-                    'Access-Control-Allow-Origin': '*'
-                },
-                'body': json.dumps({"success": False, "message": "The email already exists"})
-            }
+            return runtime.json_response(409, {"success": False, "message": "The email already exists"}, HEADERS)  # Conflict
 
         # If email doesn't exist, add new user
         table.put_item(Item={
@@ -58,21 +43,10 @@ def lambda_handler(event, context):
             'password': password
         })
 
-        return {
-            'statusCode': 201,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({"success": True, "message": "User registered successfully"})
-        }
+        return runtime.json_response(201, {"success": True, "message": "User registered successfully"}, HEADERS)
 
     except Exception as e:
-        return {
-            'statusCode': 500,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({'error': str(e)})
-        }
+        log.error("Registration failed: %s", e)
+        return runtime.json_response(500, {'error': str(e)}, HEADERS)
+
+runtime.init_complete('registerFunction')
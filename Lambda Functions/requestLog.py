@@ -0,0 +1,237 @@
+import os
+import time
+import json
+import base64
+import random
+import functools
+from contextlib import contextmanager
+
+# Leveled, structured request logging for the Lambda handlers. Nothing is
+# formatted or serialized unless its level is enabled, sensitive fields are
+# redacted, and every request ends with one compact summary line that carries
+# the time spent in each DynamoDB and S3 call.
+#
+#   LOG_LEVEL=DEBUG|INFO|WARNING|ERROR   (default INFO)
+#   LOG_SAMPLE_RATE=0.01                 log 1% of requests at DEBUG regardless of LOG_LEVEL
+#   DEBUG_METRICS=off|header|always      return timings and consumed capacity as X-Debug-* headers,
+#                                        for every request or only when X-Debug-Metrics is sent; off by
+#                                        default, benchHandlers and localServer turn on header
+
+LEVELS = {'DEBUG': 10, 'INFO': 20, 'WARNING': 30, 'ERROR': 40}
+LOG_LEVEL = LEVELS.get(os.environ.get('LOG_LEVEL', 'INFO').upper(), LEVELS['INFO'])
+SAMPLE_RATE = float(os.environ.get('LOG_SAMPLE_RATE', '0'))
+REDACTED_FIELDS = frozenset({'password', 'email', 'session_token', 'x-session-token', 'authorization', 'cookie'})
+REDACTED = '***'
+DEBUG_METRICS = os.environ.get('DEBUG_METRICS', 'off').lower()
+READ_OPERATIONS = frozenset({'GetItem', 'Query', 'Scan', 'BatchGetItem', 'TransactGetItems'})
+
+_current = None
+
+
+def redact(value):
+    if isinstance(value, dict):
+        return {k: REDACTED if isinstance(k, str) and k.lower() in REDACTED_FIELDS else redact(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [redact(v) for v in value]
+    return value
+
+
+def redact_event(event):
+    # Bodies arrive as JSON strings, so redact inside them too
+    event = redact(event)
+    body = event.get('body')
+    if isinstance(body, str):
+        try:
+            if event.get('isBase64Encoded'):
+                body = base64.b64decode(body).decode('utf-8')
+            event['body'] = redact(json.loads(body))
+        except ValueError:
+            pass
+    return event
+
+
+def dumps(record):
+    return json.dumps(record, default=str, separators=(',', ':'))
+
+
+class RequestLog:
+    def __init__(self, function_name):
+        self.function_name = function_name
+        self.level = LOG_LEVEL
+        self.sampled = False
+        self.started = time.perf_counter()
+        self.calls = {}
+        self.capacity = {}
+        self.fields = {}
+
+    def start(self, event):
+        global _current
+        _current = self
+        self.sampled = SAMPLE_RATE > 0 and random.random() < SAMPLE_RATE
+        self.level = LEVELS['DEBUG'] if self.sampled else LOG_LEVEL
+        self.started = time.perf_counter()
+        self.calls = {}
+        self.capacity = {}
+        self.fields = {'method': event.get('httpMethod') if isinstance(event, dict) else None}
+
+    def enabled(self, level):
+        return LEVELS[level] >= self.level
+
+    def _emit(self, level, message, args, fields):
+        # Arguments may be callables so expensive values are only built when emitted
+        if args:
+            message = message % tuple(arg() if callable(arg) else arg for arg in args)
+        record = {'level': level, 'fn': self.function_name, 'msg': message}
+        record.update(fields)
+        print(dumps(record))
+
+    def debug(self, message, *args, **fields):
+        if self.level <= LEVELS['DEBUG']:
+            self._emit('DEBUG', message, args, fields)
+
+    def info(self, message, *args, **fields):
+        if self.level <= LEVELS['INFO']:
+            self._emit('INFO', message, args, fields)
+
+    def warning(self, message, *args, **fields):
+        if self.level <= LEVELS['WARNING']:
+            self._emit('WARNING', message, args, fields)
+
+    def error(self, message, *args, **fields):
+        self._emit('ERROR', message, args, fields)
+
+    def set(self, **fields):
+        self.fields.update(fields)
+
+    def increment(self, **amounts):
+        for name, amount in amounts.items():
+            self.fields[name] = self.fields.get(name, 0) + amount
+
+    def record_call(self, name, elapsed_ms):
+        totals = self.calls.get(name)
+        if totals is None:
+            totals = self.calls[name] = {'n': 0, 'ms': 0.0}
+        totals['n'] += 1
+        totals['ms'] += elapsed_ms
+
+    def record_capacity(self, operation, consumed):
+        # ConsumedCapacity is a dict for single-table calls and a list for batches
+        kind = 'rcu' if operation in READ_OPERATIONS else 'wcu'
+        for entry in consumed if isinstance(consumed, list) else [consumed]:
+            table = self.capacity.setdefault(entry.get('TableName', '?'), {'rcu': 0.0, 'wcu': 0.0})
+            table[kind] += float(entry.get('CapacityUnits', 0))
+
+    @contextmanager
+    def timed(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record_call(name, (time.perf_counter() - started) * 1000)
+
+    def metrics(self):
+        metrics = {'ms': round((time.perf_counter() - self.started) * 1000, 2)}
+        if self.calls:
+            metrics['calls'] = {name: {'n': t['n'], 'ms': round(t['ms'], 2)} for name, t in self.calls.items()}
+        if self.capacity:
+            metrics['capacity'] = {table: {k: round(v, 2) for k, v in units.items()} for table, units in self.capacity.items()}
+        return metrics
+
+    def debug_headers(self, metrics):
+        values = {
+            'X-Debug-Duration-Ms': str(metrics['ms']),
+            'X-Debug-Calls': dumps(metrics.get('calls', {})),
+            'X-Debug-Capacity': dumps(metrics.get('capacity', {})),
+            'Access-Control-Expose-Headers': 'X-Debug-Duration-Ms, X-Debug-Calls, X-Debug-Capacity'
+        }
+        return values
+
+    def finish(self, status_code):
+        metrics = self.metrics()
+        if self.level > LEVELS['INFO']:
+            return metrics
+        record = {'level': 'INFO', 'fn': self.function_name, 'status': status_code}
+        record.update(self.fields)
+        record.update(metrics)
+        if self.sampled:
+            record['sampled'] = True
+        print(dumps(record))
+        return metrics
+
+    def handler(self, function):
+        # Wraps lambda_handler so every request gets exactly one summary line
+        @functools.wraps(function)
+        def wrapper(event, context):
+            self.start(event)
+            response = None
+            try:
+                response = function(event, context)
+                return response
+            finally:
+                metrics = self.finish(response.get('statusCode') if isinstance(response, dict) else None)
+                if isinstance(response, dict) and 'headers' in response and wants_debug_metrics(event):
+                    response['headers'].update(self.debug_headers(metrics))
+        return wrapper
+
+
+def wants_debug_metrics(event):
+    if DEBUG_METRICS == 'always':
+        return True
+    if DEBUG_METRICS != 'header':
+        return False
+    headers = event.get('headers') or {}
+    return any(name.lower() == 'x-debug-metrics' for name in headers)
+
+
+def current():
+    return _current
+
+
+def annotate(**fields):
+    if _current is not None:
+        _current.set(**fields)
+
+
+def increment(**amounts):
+    if _current is not None:
+        _current.increment(**amounts)
+
+
+def warning(message, *args, **fields):
+    # For shared modules that log outside a handler's own RequestLog
+    if _current is not None:
+        _current.warning(message, *args, **fields)
+    else:
+        print(message % args if args else message)
+
+
+def _before_call(model=None, context=None, **kwargs):
+    if context is not None:
+        context['request_log_call'] = f"{model.service_model.service_name}.{model.name}"
+        context['request_log_started'] = time.perf_counter()
+
+
+def _after_call(context=None, parsed=None, model=None, **kwargs):
+    started = (context or {}).get('request_log_started')
+    if started is not None and _current is not None:
+        _current.record_call(context['request_log_call'], (time.perf_counter() - started) * 1000)
+        if parsed and 'ConsumedCapacity' in parsed:
+            _current.record_capacity(model.name, parsed['ConsumedCapacity'])
+
+
+def _request_capacity(params=None, model=None, **kwargs):
+    # Ask DynamoDB to report the capacity every supported call consumes
+    members = model.input_shape.members if model.input_shape is not None else {}
+    if 'ReturnConsumedCapacity' in members and 'ReturnConsumedCapacity' not in params:
+        params['ReturnConsumedCapacity'] = 'TOTAL'
+
+
+def instrument(client):
+    # Times every API call made through a boto3 client, and records consumed capacity for DynamoDB
+    events = client.meta.events
+    if client.meta.service_model.service_name == 'dynamodb':
+        events.register('before-parameter-build.dynamodb', _request_capacity)
+    events.register('before-call', _before_call)
+    events.register('after-call', _after_call)
+    events.register('after-call-error', _after_call)
+    return client
@@ -0,0 +1,95 @@
+import os
+import gzip
+import json
+import base64
+from decimal import Decimal
+from boto3.dynamodb.types import Binary
+
+try:
+    import brotli
+except ImportError:  # br is only offered when the brotli package is deployed with the function
+    brotli = None
+
+# JSON encoding for handler responses. DynamoDB types (Decimal, sets, Binary)
+# are converted as the encoder reaches them instead of deep-copying items
+# first, output uses compact separators, and large bodies can be compressed
+# when the client accepts it. Compressed bodies are returned base64 encoded,
+# which needs the API's binary media types to include */*; with that set, API
+# Gateway base64-encodes request bodies too (see lambdaRuntime.request_body).
+# Browsers always send Accept-Encoding, so compression stays off until the API
+# is configured for it.
+#
+#   RESPONSE_COMPRESSION=1   compress large bodies (unset: responses are always plain JSON)
+
+COMPRESSION = os.environ.get('RESPONSE_COMPRESSION', '').lower() in ('1', 'true', 'yes')
+MIN_COMPRESS_BYTES = 1024     # Smaller bodies are not worth the CPU or the base64 overhead
+GZIP_LEVEL = 5
+BROTLI_QUALITY = 4
+
+
+class DynamoEncoder(json.JSONEncoder):
+    def default(self, obj):
+        if isinstance(obj, Decimal):
+            # DynamoDB numbers: keep integers exact, everything else as float
+            return int(obj) if obj == obj.to_integral_value() else float(obj)
+        if isinstance(obj, (set, frozenset)):
+            return list(obj)
+        if isinstance(obj, Binary):
+            return base64.b64encode(obj.value).decode('ascii')
+        if isinstance(obj, (bytes, bytearray)):
+            return base64.b64encode(obj).decode('ascii')
+        return super().default(obj)
+
+
+_encoder = DynamoEncoder(separators=(',', ':'), ensure_ascii=False)
+dumps = _encoder.encode
+iterencode = _encoder.iterencode
+
+
+def accepted_encodings(event):
+    # Codings from Accept-Encoding, ignoring any the client ruled out with q=0
+    headers = (event.get('headers') if isinstance(event, dict) else None) or {}
+    header = next((value for name, value in headers.items() if name.lower() == 'accept-encoding'), None) or ''
+    accepted = set()
+    for part in header.split(','):
+        coding, _, params = part.strip().partition(';')
+        quality = params.strip()
+        if quality.startswith('q='):
+            try:
+                if float(quality[2:]) <= 0:
+                    continue
+            except ValueError:
+                continue
+        if coding:
+            accepted.add(coding.strip().lower())
+    return accepted
+
+
+def compress_response(response, event):
+    if not COMPRESSION or not isinstance(response, dict) or response.get('isBase64Encoded'):
+        return response
+    body = response.get('body')
+    if not isinstance(body, str) or len(body) < MIN_COMPRESS_BYTES:
+        return response
+    accepted = accepted_encodings(event)
+    if not accepted:
+        return response
+
+    raw = body.encode('utf-8')
+    if brotli is not None and 'br' in accepted:
+        encoding, compressed = 'br', brotli.compress(raw, quality=BROTLI_QUALITY)
+    elif 'gzip' in accepted or '*' in accepted:
+        encoding, compressed = 'gzip', gzip.compress(raw, compresslevel=GZIP_LEVEL, mtime=0)
+    else:
+        return response
+
+    encoded = base64.b64encode(compressed).decode('ascii')
+    if len(encoded) >= len(raw):
+        return response
+
+    headers = response.setdefault('headers', {})
+    headers['Content-Encoding'] = encoding
+    headers['Vary'] = 'Accept-Encoding'
+    response['body'] = encoded
+    response['isBase64Encoded'] = True
+    return response
@@ -0,0 +1,69 @@
+import lambdaRuntime as runtime
+import os
+import time
+import heapq
+from collections import defaultdict
+import popularity
+import batchOps
+import requestLog
+
+# Periodic rollup of the sharded popularity counters, run from an EventBridge
+# schedule (every minute is plenty). Sums every song's shards and stores the
+# top songs overall, per artist and per year as one item each, which is all
+# trendingFunction has to read. Lists that did not change are not rewritten
+# and scopes whose songs lost all their subscribers are removed.
+#
+#   TRENDING_TOP_N=50   songs kept per list
+
+TOP_N = int(os.environ.get('TRENDING_TOP_N', '50'))
+
+dynamodb = runtime.dynamodb
+popularity_table = runtime.lazy_table(popularity.TABLE_NAME)
+log = requestLog.RequestLog('rollupFunction')
+
+def build_rollups(counts, top_n=TOP_N):
+    scopes = defaultdict(list)
+    for (title, year), (song, subscribers) in counts.items():
+        entry = dict(song, subscribers=subscribers)
+        scopes[popularity.rollup_key('overall')].append(entry)
+        scopes[popularity.rollup_key('year', year)].append(entry)
+        if song.get('artist'):
+            scopes[popularity.rollup_key('artist', song['artist'])].append(entry)
+    # Ties break on title and year so the lists are stable between runs
+    return {
+        key: heapq.nsmallest(top_n, entries, key=lambda entry: (-entry['subscribers'], entry['title'], entry['year']))
+        for key, entries in scopes.items()
+    }
+
+def same_songs(stored, songs):
+    # Stored numbers come back as Decimal
+    return len(stored) == len(songs) and all(
+        {**old, 'subscribers': int(old.get('subscribers', 0))} == new for old, new in zip(stored, songs)
+    )
+
+@log.handler
+def lambda_handler(event, context):
+    try:
+        runtime.start_invocation()
+
+        counts, stored = popularity.scan(popularity_table)
+        rollups = build_rollups(counts)
+
+        now = int(time.time())
+        writes = [
+            {'PutRequest': {'Item': {'counter_key': key, 'songs': songs, 'updated': now}}}
+            for key, songs in rollups.items() if not same_songs(stored.get(key, []), songs)
+        ]
+        writes += [{'DeleteRequest': {'Key': {'counter_key': key}}} for key in stored if key not in rollups]
+        unprocessed = batchOps.batch_write(dynamodb, popularity_table.name, writes)
+
+        summary = {'songs': len(counts), 'lists': len(rollups), 'written': len(writes) - len(unprocessed),
+                   'unprocessed': len(unprocessed)}
+        log.set(**summary)
+        return summary
+
+    except Exception as e:
+        log.error("Rollup failed: %s", e)
+        raise
+
+runtime.init_complete('rollupFunction')
@@ -0,0 +1,294 @@
+import os
+import time
+import threading
+from boto3.dynamodb.types import TypeDeserializer
+import requestLog
+import catalogSnapshot
+
+# In-memory search index over the music table, so filtered searches are
+# answered without touching the table. With CATALOG_SNAPSHOT set, builds read
+# the published catalog snapshot instead of scanning the table, as long as the
+# catalog version in its header is no older than the shared one: a snapshot
+# without the table's latest writes (or without a version, once there is a
+# shared version to compare with) falls back to the scan.
+#
+# Stream records only reach the one container the stream invokes, never the
+# containers serving searches. Each index therefore remembers the catalog
+# version (queryCache's shared version item, bumped on every stream batch) and
+# the snapshot it was built from. When either moves on, the index is rebuilt
+# on a background thread while requests keep using the old one. Without a
+# shared version there is nothing to compare, and the index is rebuilt every
+# SEARCH_INDEX_MAX_AGE seconds instead. RefreshingIndex does this for any
+# index built from the catalog, so fuzzySearch and autocomplete use it too.
+#
+#   SEARCH_INDEX_MAX_AGE=900   rebuild interval when no catalog version is available
+
+SEARCH_FIELDS = ('title', 'artist', 'album')
+GRAM_SIZE = 3
+INDEX_MAX_AGE = int(os.environ.get('SEARCH_INDEX_MAX_AGE', '900'))
+
+_deserializer = TypeDeserializer()
+
+
+def _grams(text):
+    return {text[i:i + GRAM_SIZE] for i in range(len(text) - GRAM_SIZE + 1)}
+
+
+def scan_catalog(music_table, **scan_kwargs):
+    response = music_table.scan(**scan_kwargs)
+    yield from response.get('Items', [])
+    while 'LastEvaluatedKey' in response:
+        response = music_table.scan(ExclusiveStartKey=response['LastEvaluatedKey'], **scan_kwargs)
+        yield from response.get('Items', [])
+
+
+def usable_snapshot(version=None):
+    # The published snapshot, unless the shared catalog version has moved past it
+    snapshot = catalogSnapshot.current()
+    if snapshot is None or version is None:
+        return snapshot
+    if snapshot.catalog_version is None or snapshot.catalog_version < version:
+        return None
+    return snapshot
+
+
+def catalog_items(music_table, version=None, **scan_kwargs):
+    # The memory-mapped snapshot when one is published and current, otherwise a full scan
+    snapshot = usable_snapshot(version)
+    if snapshot is not None:
+        return iter(snapshot)
+    return scan_catalog(music_table, **scan_kwargs)
+
+
+class CatalogIndex:
+    def __init__(self):
+        self.items = {}      # doc id -> music item
+        self.doc_ids = {}    # (title, year) -> doc id
+        self.postings = {field: {} for field in SEARCH_FIELDS}  # field -> gram -> doc ids
+        self.field_docs = {field: set() for field in SEARCH_FIELDS}
+        self.years = {}      # year -> doc ids
+        self.value_counts = {field: {} for field in SEARCH_FIELDS}  # exact value frequencies for the query planner
+        self.built_at = 0
+        self.version = None     # Catalog version the index is current with
+        self.snapshot = None    # Snapshot it was built from
+        self._next_id = 0
+
+    def __len__(self):
+        return len(self.items)
+
+    def upsert(self, item):
+        key = (item.get('title'), item.get('year'))
+        if key in self.doc_ids:
+            self._unlink(self.doc_ids[key])
+            doc_id = self.doc_ids[key]
+        else:
+            doc_id = self._next_id
+            self._next_id += 1
+            self.doc_ids[key] = doc_id
+
+        self.items[doc_id] = item
+        for field in SEARCH_FIELDS:
+            value = item.get(field)
+            if not isinstance(value, str):
+                continue
+            self.field_docs[field].add(doc_id)
+            counts = self.value_counts[field]
+            counts[value] = counts.get(value, 0) + 1
+            postings = self.postings[field]
+            for gram in _grams(value):
+                postings.setdefault(gram, set()).add(doc_id)
+        if item.get('year') is not None:
+            self.years.setdefault(item['year'], set()).add(doc_id)
+
+    def remove(self, title, year):
+        doc_id = self.doc_ids.pop((title, year), None)
+        if doc_id is not None:
+            self._unlink(doc_id)
+
+    def _unlink(self, doc_id):
+        item = self.items.pop(doc_id)
+        for field in SEARCH_FIELDS:
+            value = item.get(field)
+            if not isinstance(value, str):
+                continue
+            self.field_docs[field].discard(doc_id)
+            counts = self.value_counts[field]
+            counts[value] -= 1
+            if not counts[value]:
+                del counts[value]
+            postings = self.postings[field]
+            for gram in _grams(value):
+                docs = postings.get(gram)
+                if docs is not None:
+                    docs.discard(doc_id)
+                    if not docs:
+                        del postings[gram]
+        docs = self.years.get(item.get('year'))
+        if docs is not None:
+            docs.discard(doc_id)
+            if not docs:
+                del self.years[item['year']]
+
+    def _contains_candidates(self, field, needle):
+        # Needles shorter than a gram can only be narrowed to "has this field"
+        if len(needle) < GRAM_SIZE:
+            return self.field_docs[field]
+        postings = self.postings[field]
+        lists = []
+        for gram in _grams(needle):
+            docs = postings.get(gram)
+            if not docs:
+                return set()
+            lists.append(docs)
+        lists.sort(key=len)
+        return set.intersection(*lists)
+
+    def count(self, field, value):
+        if field == 'year':
+            return len(self.years.get(value, ()))
+        return self.value_counts[field].get(value, 0)
+
+    def search(self, title='', year='', artist='', album='', exact=False):
+        # Same semantics as the scan filter: contains() on text fields, eq() on year.
+        # With exact=True every field must match eq() instead.
+        lists = []
+        if year:
+            lists.append(self.years.get(year, set()))
+        contains = [(field, needle) for field, needle in (('title', title), ('artist', artist), ('album', album)) if needle]
+        for field, needle in contains:
+            lists.append(self._contains_candidates(field, needle))
+
+        if not lists:
+            doc_ids = self.items.keys()
+        else:
+            lists.sort(key=len)
+            doc_ids = set(lists[0])
+            for docs in lists[1:]:
+                doc_ids &= docs
+                if not doc_ids:
+                    break
+
+        results = []
+        for doc_id in sorted(doc_ids):
+            item = self.items[doc_id]
+            # Gram intersection can over-match, confirm the real substring
+            if exact:
+                if all(item.get(field) == needle for field, needle in contains):
+                    results.append(dict(item))
+            elif all(needle in (item.get(field) or '') for field, needle in contains):
+                results.append(dict(item))
+        return results
+
+    def apply_stream_records(self, records):
+        applied = 0
+        for record in records:
+            change = record.get('dynamodb', {})
+            if record.get('eventName') == 'REMOVE':
+                keys = {k: _deserializer.deserialize(v) for k, v in change.get('Keys', {}).items()}
+                self.remove(keys.get('title'), keys.get('year'))
+            elif 'NewImage' in change:
+                self.upsert({k: _deserializer.deserialize(v) for k, v in change['NewImage'].items()})
+            else:
+                continue
+            applied += 1
+        return applied
+
+
+def build_index(items):
+    index = CatalogIndex()
+    for item in items:
+        index.upsert(item)
+    return index
+
+
+class RefreshingIndex:
+    # One in-memory index over the catalog per container, made by build(items).
+    # Only the first build in a container runs on the request path; a stale
+    # index keeps answering while a background thread builds its replacement.
+    # The fuzzy and autocomplete indexes are kept current the same way.
+    def __init__(self, name, build, max_age=None, **scan_kwargs):
+        self.name = name              # Prefix of the request log annotations
+        self.build = build
+        self.max_age = max_age        # Rebuild at least this often, even when the version hasn't moved
+        self.scan_kwargs = scan_kwargs
+        self.index = None
+        self._refresh = None
+        self._refresh_lock = threading.Lock()
+
+    def _build(self, music_table, version):
+        snapshot = usable_snapshot(version)
+        items = iter(snapshot) if snapshot is not None else scan_catalog(music_table, **self.scan_kwargs)
+        index = self.build(items)
+        index.version = version
+        index.snapshot = snapshot
+        index.built_at = time.time()
+        return index
+
+    def _stale(self, version):
+        index = self.index
+        if index.snapshot is not usable_snapshot(version):
+            return True
+        if version is not None and index.version != version:
+            return True
+        max_age = self.max_age or (INDEX_MAX_AGE if version is None else None)
+        return max_age is not None and time.time() - index.built_at > max_age
+
+    def _rebuild(self, music_table, version):
+        started = time.perf_counter()
+        try:
+            self.index = self._build(music_table, version)
+            requestLog.annotate(**{f'{self.name}_rebuild_ms': round((time.perf_counter() - started) * 1000, 2)})
+        except Exception as e:
+            requestLog.warning("%s index rebuild failed: %s", self.name, e)
+
+    def _refresh_in_background(self, music_table, version):
+        # One rebuild at a time. In Lambda it runs while the container is handling
+        # requests and can finish during a later invocation.
+        with self._refresh_lock:
+            if self._refresh is not None and self._refresh.is_alive():
+                return
+            self._refresh = threading.Thread(target=self._rebuild, args=(music_table, version), daemon=True)
+            self._refresh.start()
+
+    def get(self, music_table, version=None):
+        # version is the shared catalog version, or None when the container has none to read
+        if self.index is None:
+            started = time.perf_counter()
+            self.index = self._build(music_table, version)
+            requestLog.annotate(**{f'{self.name}_entries': len(self.index),
+                                   f'{self.name}_build_ms': round((time.perf_counter() - started) * 1000, 2)})
+        elif self._stale(version):
+            self._refresh_in_background(music_table, version)
+            requestLog.annotate(**{f'{self.name}_stale': True})
+        return self.index
+
+    def wait(self):
+        # Blocks until a running rebuild has finished
+        refresh = self._refresh
+        if refresh is not None:
+            refresh.join()
+
+
+_catalog = RefreshingIndex('index', build_index)
+
+
+def get_index(music_table, version=None):
+    return _catalog.get(music_table, version)
+
+
+def current_index():
+    # The index if one has been built; never triggers a build
+    return _catalog.index
+
+
+def apply_stream_records(records, version=None):
+    # Nothing to update until a query has built the index in this container.
+    # version is the catalog version these records were counted under; if the
+    # index was current with the one before it, it is current again.
+    index = _catalog.index
+    if index is None:
+        return 0
+    applied = index.apply_stream_records(records)
+    if version is not None and index.version is not None and index.version == version - 1:
+        index.version = version
+    return applied
@@ -0,0 +1,104 @@
+import time
+import sessionTokens
+
+# In-process session resolution shared by the session-checked handlers.
+# Valid sessions are kept until their ttl together with the user's profile,
+# and unknown tokens are remembered briefly so retries don't hit DynamoDB.
+# Signed tokens (see sessionTokens) are checked locally and never read the table.
+
+NEGATIVE_TTL = 30          # Seconds an invalid token is answered from cache
+MAX_ENTRIES = 10000
+
+
+class SessionCache:
+    def __init__(self, session_table, login_table=None, negative_ttl=NEGATIVE_TTL, max_entries=MAX_ENTRIES):
+        self.session_table = session_table
+        self.login_table = login_table
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self._sessions = {}   # token -> {'email', 'ttl', 'profile'?}
+        self._invalid = {}    # token -> time the negative entry expires
+        self.hits = 0
+        self.misses = 0
+        self.negative_hits = 0
+        self.signed = 0
+        self.revocations = sessionTokens.RevocationList(session_table)
+
+    def resolve(self, session_token, with_profile=False):
+        now = int(time.time())
+        if sessionTokens.is_signed(session_token):
+            return self._resolve_signed(session_token, now)
+
+        session = self._sessions.get(session_token)
+        if session is not None:
+            if now < session['ttl']:
+                self.hits += 1
+                if with_profile and 'profile' not in session:
+                    session['profile'] = self._load_profile(session['email'])
+                return session
+            del self._sessions[session_token]
+
+        retry_at = self._invalid.get(session_token)
+        if retry_at is not None:
+            if now < retry_at:
+                self.negative_hits += 1
+                return None
+            del self._invalid[session_token]
+
+        self.misses += 1
+        # Strongly consistent so a session written moments ago by login is never cached as invalid
+        response = self.session_table.get_item(Key={'session_token': session_token}, ConsistentRead=True)
+        item = response.get('Item')
+        if item is None or 'ttl' not in item or now >= int(item['ttl']):
+            self._remember(self._invalid, session_token, now + self.negative_ttl, now)
+            return None
+
+        session = {'email': item['email'], 'ttl': int(item['ttl'])}
+        if with_profile:
+            session['profile'] = self._load_profile(item['email'])
+        self._remember(self._sessions, session_token, session, now)
+        return session
+
+    def _resolve_signed(self, session_token, now):
+        claims = sessionTokens.verify(session_token, now)
+        if claims is None or self.revocations.is_revoked(claims['j'], now):
+            return None
+        self.signed += 1
+        # The profile travels in the token, so mainPage skips the login table too
+        return {'email': claims['e'], 'ttl': claims['x'], 'profile': {'email': claims['e'], 'user_name': claims['n']}}
+
+    def invalidate(self, session_token):
+        self._sessions.pop(session_token, None)
+        self._invalid.pop(session_token, None)
+
+    def _load_profile(self, email):
+        response = self.login_table.get_item(Key={'email': email})
+        if 'Item' not in response:
+            return None
+        return {'email': email, 'user_name': response['Item'].get('user_name', email)}
+
+    def _remember(self, entries, session_token, value, now):
+        entries[session_token] = value
+        if len(self._sessions) + len(self._invalid) > self.max_entries:
+            self._evict(now)
+
+    def _evict(self, now):
+        for token in [t for t, s in self._sessions.items() if now >= s['ttl']]:
+            del self._sessions[token]
+        for token in [t for t, retry_at in self._invalid.items() if now >= retry_at]:
+            del self._invalid[token]
+        # Still full: drop the oldest entries, negative ones first
+        while self._invalid and len(self._sessions) + len(self._invalid) > self.max_entries:
+            del self._invalid[next(iter(self._invalid))]
+        while len(self._sessions) > self.max_entries:
+            del self._sessions[next(iter(self._sessions))]
+
+    def stats(self):
+        return {
+            'sessions': len(self._sessions),
+            'invalid': len(self._invalid),
+            'hits': self.hits,
+            'misses': self.misses,
+            'negative_hits': self.negative_hits,
+            'signed': self.signed
+        }
@@ -0,0 +1,129 @@
+import os
+import hmac
+import json
+import time
+import uuid
+import base64
+import hashlib
+import requestLog
+
+# Stateless session tokens. With SESSION_MODE=signed, login issues an
+# HMAC-SHA256 signed token carrying the email, user name and expiry, and every
+# handler validates it locally instead of reading the sessions table. Tokens
+# can still be revoked through a small list that containers cache in memory.
+#
+#   SESSION_MODE=table|signed                 (default table)
+#   SESSION_SIGNING_KEY=<secret>              signs and verifies tokens
+#   SESSION_PREVIOUS_SIGNING_KEY=<secret>     still accepted while keys are rotated
+#   SESSION_REVOCATION_REFRESH=60             seconds between revocation list reads, 0 disables
+
+SESSION_MODE = os.environ.get('SESSION_MODE', 'table').lower()
+SIGNED = SESSION_MODE == 'signed'
+SESSION_LIFETIME = 3600
+TOKEN_PREFIX = 'v1.'
+REVOCATION_KEY = '#revoked'   # sessions table item holding revoked token ids
+REVOCATION_REFRESH = int(os.environ.get('SESSION_REVOCATION_REFRESH', '60'))
+
+
+def _keys():
+    keys = [os.environ.get('SESSION_SIGNING_KEY'), os.environ.get('SESSION_PREVIOUS_SIGNING_KEY')]
+    return [key.encode('utf-8') for key in keys if key]
+
+
+def _encode(raw):
+    return base64.urlsafe_b64encode(raw).rstrip(b'=').decode('ascii')
+
+
+def _decode(text):
+    return base64.urlsafe_b64decode(text + '=' * (-len(text) % 4))
+
+
+def _signature(key, payload):
+    return _encode(hmac.new(key, (TOKEN_PREFIX + payload).encode('ascii'), hashlib.sha256).digest())
+
+
+def is_signed(session_token):
+    return isinstance(session_token, str) and session_token.startswith(TOKEN_PREFIX)
+
+
+def issue(email, user_name, lifetime=SESSION_LIFETIME, now=None):
+    # Returns (token, expiry); the token id lets a single token be revoked
+    keys = _keys()
+    if not keys:
+        raise RuntimeError("SESSION_SIGNING_KEY must be set when SESSION_MODE is signed.")
+    expires = int(time.time() if now is None else now) + lifetime
+    claims = {'e': email, 'n': user_name, 'x': expires, 'j': uuid.uuid4().hex}
+    payload = _encode(json.dumps(claims, separators=(',', ':')).encode('utf-8'))
+    return f'{TOKEN_PREFIX}{payload}.{_signature(keys[0], payload)}', expires
+
+
+def verify(session_token, now=None):
+    # Returns the token's claims, or None if it is malformed, forged or expired
+    if not is_signed(session_token):
+        return None
+    payload, _, signature = session_token[len(TOKEN_PREFIX):].partition('.')
+    if not payload or not signature:
+        return None
+    if not any(hmac.compare_digest(signature, _signature(key, payload)) for key in _keys()):
+        return None
+    try:
+        claims = json.loads(_decode(payload))
+    except ValueError:
+        return None
+    now = int(time.time() if now is None else now)
+    if not isinstance(claims, dict) or not isinstance(claims.get('x'), int) or now >= claims['x']:
+        return None
+    return claims
+
+
+class RevocationList:
+    def __init__(self, session_table, refresh=REVOCATION_REFRESH):
+        self.session_table = session_table
+        self.refresh = refresh
+        self._revoked = {}    # token id -> expiry
+        self._loaded_at = None
+
+    def _load(self, now):
+        self._loaded_at = now
+        try:
+            item = self.session_table.get_item(Key={'session_token': REVOCATION_KEY}).get('Item') or {}
+        except Exception as e:
+            # Keep the last known list rather than failing every request
+            requestLog.warning("Error reading session revocation list: %s", e)
+            return
+        revoked = {}
+        expired = set()
+        for entry in item.get('revoked', ()):
+            token_id, _, expires = entry.partition(':')
+            if expires.isdigit() and int(expires) > now:
+                revoked[token_id] = int(expires)
+            else:
+                expired.add(entry)
+        self._revoked = revoked
+        if expired:
+            # Keep the item small: tokens past their expiry are rejected anyway
+            try:
+                self.session_table.update_item(
+                    Key={'session_token': REVOCATION_KEY},
+                    UpdateExpression='DELETE revoked :expired',
+                    ExpressionAttributeValues={':expired': expired}
+                )
+            except Exception as e:
+                requestLog.warning("Error pruning session revocation list: %s", e)
+
+    def is_revoked(self, token_id, now=None):
+        if not self.refresh:
+            return False
+        now = int(time.time() if now is None else now)
+        if self._loaded_at is None or now - self._loaded_at >= self.refresh:
+            self._load(now)
+        return token_id in self._revoked
+
+    def revoke(self, claims):
+        # Entries carry the token's expiry so readers can ignore them once it has passed
+        self.session_table.update_item(
+            Key={'session_token': REVOCATION_KEY},
+            UpdateExpression='ADD revoked :entry',
+            ExpressionAttributeValues={':entry': {f"{claims['j']}:{claims['x']}"}}
+        )
+        self._revoked[claims['j']] = claims['x']
@@ -0,0 +1,614 @@
+import os
+import sys
+import json
+import hmac
+import time
+import bisect
+import hashlib
+import functools
+import threading
+from decimal import Decimal
+from urllib.parse import quote
+from boto3.dynamodb.conditions import ConditionBase, ConditionExpressionBuilder
+from boto3.dynamodb.types import TypeSerializer, TypeDeserializer
+from botocore.exceptions import ClientError
+import requestLog
+import storageExpressions as expressions
+from storageExpressions import ExpressionError, MISSING
+
+# Local stand-ins for DynamoDB and S3, so the handlers can run outside AWS for
+# load tests and profiling (see benchmarks/localServer.py). With
+# STORAGE_BACKEND set to memory or sqlite, lambdaRuntime hands out a
+# LocalResource instead of the boto3 resource. It answers the table and client
+# calls the handlers make, with the keys, indexes and index projections
+# provisionTables creates, and S3 shrinks to a presigner whose URLs the local
+# server can verify. Each call is timed into the request summary like a real
+# one; capacity is not reported.
+#
+#   STORAGE_BACKEND=dynamodb|memory|sqlite          (default dynamodb)
+#   STORAGE_PATH=/tmp/music-storage.db              SQLite database file
+#   STORAGE_IMAGE_URL=http://localhost:8080/images  base of presigned image URLs
+#   STORAGE_SIGNING_KEY=local                       key the presigned URLs are signed with
+
+BACKEND = os.environ.get('STORAGE_BACKEND', 'dynamodb').lower()
+LOCAL_BACKENDS = ('memory', 'sqlite')
+STORAGE_PATH = os.environ.get('STORAGE_PATH', '/tmp/music-storage.db')
+IMAGE_URL = os.environ.get('STORAGE_IMAGE_URL', 'http://localhost:8080/images')
+SIGNING_KEY = os.environ.get('STORAGE_SIGNING_KEY', 'local')
+PAGE_ITEMS = 1000     # Stands in for DynamoDB's 1 MB page, so callers still paginate
+TASK_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Task 1 + 2')
+TABLE_NAMES = {   # provisionTables names these; the handlers take theirs from the environment
+    'song_popularity': os.environ.get('POPULARITY_TABLE', 'song_popularity'),
+    'query_cache': os.environ.get('QUERY_CACHE_TABLE') or 'query_cache',
+}
+
+_tables = None
+
+
+def tables():
+    # provisionTables.SCHEMA as table -> (hash key, range key, {index: (hash key, range key, projected attributes)})
+    global _tables
+    if _tables is None:
+        if TASK_DIR not in sys.path:
+            sys.path.insert(0, TASK_DIR)
+        from provisionTables import SCHEMA
+        _tables = {}
+        for table_name, spec in SCHEMA.items():
+            keys = dict((key_type, name) for name, key_type in spec['keys'])
+            table_keys = tuple(name for name, _ in spec['keys'])
+            indexes = {}
+            for index in spec.get('indexes', []):
+                (index_hash, _), (index_range, _) = index['keys']
+                indexes[index['name']] = (index_hash, index_range,
+                                          frozenset((index_hash, index_range) + table_keys + tuple(index['include'])))
+            _tables[TABLE_NAMES.get(table_name, table_name)] = (keys['HASH'], keys.get('RANGE'), indexes)
+    return _tables
+
+
+def _error(code, message, operation):
+    return ClientError({'Error': {'Code': code, 'Message': message}}, operation)
+
+
+def _schema(table_name, operation):
+    schema = tables().get(table_name)
+    if schema is None:
+        raise _error('ResourceNotFoundException', f'Requested resource not found: Table: {table_name} not found', operation)
+    return schema
+
+
+def _order(value):
+    # Keys of different types never compare in Python; DynamoDB orders numbers before strings before binary
+    if isinstance(value, Decimal):
+        return (0, value)
+    if isinstance(value, str):
+        return (1, value)
+    return (2, value)
+
+
+def _primary_key(schema, item):
+    hash_key, range_key, _ = schema
+    return (item[hash_key], item[range_key] if range_key else None)
+
+
+def _scan_position(schema, item):
+    hash_key, range_key, _ = schema
+    return _order(item[hash_key]), _order(item[range_key]) if range_key else ()
+
+
+def _index_keys(schema, index_name, item):
+    # (hash value, sort position) of an item in an index, None when the item isn't in it
+    hash_key, range_key, indexes = schema
+    if index_name is None:
+        return item[hash_key], (_order(item[range_key]),) if range_key else ()
+    index_hash, index_range, _ = indexes[index_name]
+    if index_hash not in item or index_range not in item:
+        return None
+    return item[index_hash], (_order(item[index_range]),) + _scan_position(schema, item)
+
+
+def _copy(item):
+    return {k: v.copy() if isinstance(v, (set, list, dict)) else v for k, v in item.items()}
+
+
+class MemoryStore:
+    # Dicts per table, plus one sorted list per index partition, rebuilt after a write to it
+    def __init__(self):
+        self.lock = threading.RLock()
+        self._items = {}        # table -> {primary key: item}
+        self._scan_order = {}   # table -> sorted [(position, primary key)], None after a write
+        self._partitions = {}   # (table, index) -> {hash value: {primary key: position}}
+        self._sorted = {}       # (table, index, hash value) -> sorted [(position, primary key)]
+
+    def _table(self, table_name, schema):
+        items = self._items.get(table_name)
+        if items is None:
+            items = self._items[table_name] = {}
+            for index_name in (None, *schema[2]):
+                self._partitions[(table_name, index_name)] = {}
+        return items
+
+    def get(self, table_name, schema, key):
+        return self._table(table_name, schema).get(key)
+
+    def count(self, table_name, schema):
+        return len(self._table(table_name, schema))
+
+    def _unindex(self, table_name, schema, key, item):
+        for index_name in (None, *schema[2]):
+            keys = _index_keys(schema, index_name, item)
+            if keys is not None:
+                self._partitions[(table_name, index_name)][keys[0]].pop(key, None)
+                self._sorted.pop((table_name, index_name, keys[0]), None)
+
+    def put(self, table_name, schema, item):
+        items = self._table(table_name, schema)
+        key = _primary_key(schema, item)
+        old = items.get(key)
+        if old is not None:
+            self._unindex(table_name, schema, key, old)
+        else:
+            self._scan_order[table_name] = None
+        items[key] = item
+        for index_name in (None, *schema[2]):
+            keys = _index_keys(schema, index_name, item)
+            if keys is not None:
+                self._partitions[(table_name, index_name)].setdefault(keys[0], {})[key] = keys[1]
+                self._sorted.pop((table_name, index_name, keys[0]), None)
+        return old
+
+    def delete(self, table_name, schema, key):
+        old = self._table(table_name, schema).pop(key, None)
+        if old is not None:
+            self._unindex(table_name, schema, key, old)
+            self._scan_order[table_name] = None
+        return old
+
+    def scan(self, table_name, schema, after=None):
+        # Items in primary key order, from just past the position after
+        items = self._table(table_name, schema)
+        order = self._scan_order.get(table_name)
+        if order is None:
+            order = self._scan_order[table_name] = sorted(
+                (_scan_position(schema, item), key) for key, item in items.items())
+        start = 0 if after is None else bisect.bisect_right(order, (after, (MAX_KEY,)))
+        for position in range(start, len(order)):
+            item = items.get(order[position][1])
+            if item is not None:
+                yield item
+
+    def query(self, table_name, schema, index_name, hash_value, after=None):
+        items = self._table(table_name, schema)
+        cache_key = (table_name, index_name, hash_value)
+        order = self._sorted.get(cache_key)
+        if order is None:
+            partition = self._partitions[(table_name, index_name)].get(hash_value, {})
+            order = self._sorted[cache_key] = sorted((position, key) for key, position in partition.items())
+        start = 0 if after is None else bisect.bisect_right(order, (after, (MAX_KEY,)))
+        for position in range(start, len(order)):
+            item = items.get(order[position][1])
+            if item is not None:
+                yield item
+
+
+class _MaxKey:
+    # Sorts after every key, so bisecting on (position, MAX_KEY) lands past that position
+    def __lt__(self, other):
+        return False
+
+    def __gt__(self, other):
+        return True
+
+    def __eq__(self, other):
+        return other is self
+
+
+MAX_KEY = _MaxKey()
+_serializer = TypeSerializer()
+_deserializer = TypeDeserializer()
+
+
+def _sql_key(value):
+    # SQLite orders integers and reals numerically before text, like DynamoDB numbers before strings
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    return value
+
+
+def _sql_position(position):
+    return [_sql_key(element[1]) if element else '' for element in position]
+
+
+class SQLiteStore:
+    # One SQL table per table: key columns, one column pair per index and the item as DynamoDB JSON
+    def __init__(self, path):
+        import sqlite3   # Not needed by the in-memory store
+        self.lock = threading.RLock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._ready = set()
+
+    def _table(self, table_name, schema):
+        if table_name not in self._ready:
+            columns = ''.join(f', i{n}_h, i{n}_r' for n in range(len(schema[2])))
+            self._db.execute(f'CREATE TABLE IF NOT EXISTS "{table_name}" '
+                             f'(h NOT NULL, r NOT NULL, item TEXT NOT NULL{columns}, PRIMARY KEY (h, r)) WITHOUT ROWID')
+            for n in range(len(schema[2])):
+                self._db.execute(f'CREATE INDEX IF NOT EXISTS "{table_name}_i{n}" ON "{table_name}" '
+                                 f'(i{n}_h, i{n}_r, h, r) WHERE i{n}_h IS NOT NULL')
+            self._ready.add(table_name)
+        return f'"{table_name}"'
+
+    @staticmethod
+    def _key(key):
+        return _sql_key(key[0]), '' if key[1] is None else _sql_key(key[1])
+
+    @staticmethod
+    def _load(text):
+        return {name: _deserializer.deserialize(value) for name, value in json.loads(text).items()}
+
+    def get(self, table_name, schema, key):
+        row = self._db.execute(f'SELECT item FROM {self._table(table_name, schema)} WHERE h = ? AND r = ?',
+                               self._key(key)).fetchone()
+        return self._load(row[0]) if row else None
+
+    def count(self, table_name, schema):
+        return self._db.execute(f'SELECT COUNT(*) FROM {self._table(table_name, schema)}').fetchone()[0]
+
+    def put(self, table_name, schema, item):
+        table = self._table(table_name, schema)
+        key = _primary_key(schema, item)
+        old = self.get(table_name, schema, key)
+        values = list(self._key(key))
+        values.append(json.dumps({name: _serializer.serialize(value) for name, value in item.items()},
+                                 separators=(',', ':')))
+        for index_name, (index_hash, index_range, _) in schema[2].items():
+            present = index_hash in item and index_range in item
+            values += [_sql_key(item[index_hash]), _sql_key(item[index_range])] if present else [None, None]
+        self._db.execute(f'INSERT OR REPLACE INTO {table} VALUES ({", ".join("?" * len(values))})', values)
+        return old
+
+    def delete(self, table_name, schema, key):
+        old = self.get(table_name, schema, key)
+        if old is not None:
+            self._db.execute(f'DELETE FROM {self._table(table_name, schema)} WHERE h = ? AND r = ?', self._key(key))
+        return old
+
+    def scan(self, table_name, schema, after=None):
+        table = self._table(table_name, schema)
+        if after is None:
+            rows = self._db.execute(f'SELECT item FROM {table} ORDER BY h, r')
+        else:
+            rows = self._db.execute(f'SELECT item FROM {table} WHERE (h, r) > (?, ?) ORDER BY h, r',
+                                    _sql_position(after))
+        for row in rows:
+            yield self._load(row[0])
+
+    def query(self, table_name, schema, index_name, hash_value, after=None):
+        table = self._table(table_name, schema)
+        if index_name is None:
+            columns, sort = 'h', ['r']
+        else:
+            n = list(schema[2]).index(index_name)
+            columns, sort = f'i{n}_h', [f'i{n}_r', 'h', 'r']
+        sort = sort if index_name is not None or schema[1] else []
+        where = f'{columns} = ?'
+        parameters = [_sql_key(hash_value)]
+        if after is not None and sort:
+            where += f' AND ({", ".join(sort)}) > ({", ".join("?" * len(sort))})'
+            parameters += _sql_position(after)
+        order = f' ORDER BY {", ".join(sort)}' if sort else ''
+        for row in self._db.execute(f'SELECT item FROM {table} WHERE {where}{order}', parameters):
+            yield self._load(row[0])
+
+
+def _builds_conditions(method):
+    # Like the resource, turns Key() and Attr() conditions into expression strings and placeholders
+    @functools.wraps(method)
+    def wrapper(self, **kwargs):
+        builder = ConditionExpressionBuilder()
+        for field, is_key_condition in (('KeyConditionExpression', True), ('FilterExpression', False)):
+            condition = kwargs.get(field)
+            if isinstance(condition, ConditionBase):
+                built = builder.build_expression(condition, is_key_condition=is_key_condition)
+                kwargs[field] = built.condition_expression
+                kwargs['ExpressionAttributeNames'] = {**kwargs.get('ExpressionAttributeNames', {}),
+                                                      **built.attribute_name_placeholders}
+                kwargs['ExpressionAttributeValues'] = {**kwargs.get('ExpressionAttributeValues', {}),
+                                                       **built.attribute_value_placeholders}
+        return method(self, **kwargs)
+    return wrapper
+
+
+def _operation(name):
+    # Times the call into the request summary, serializes it against the store and maps errors to ClientError
+    def decorate(method):
+        @functools.wraps(method)
+        def wrapper(self, **kwargs):
+            started = time.perf_counter()
+            try:
+                with self.store.lock:
+                    return method(self, **kwargs)
+            except (ExpressionError, KeyError) as e:
+                raise _error('ValidationException', f'{name}: {e}', name)
+            finally:
+                log = requestLog.current()
+                if log is not None:
+                    log.record_call(f'dynamodb.{name}', (time.perf_counter() - started) * 1000)
+        return wrapper
+    return decorate
+
+
+class LocalClient:
+    # The low-level client calls the handlers make, taking and returning plain Python values
+    def __init__(self, store):
+        self.store = store
+
+    def _key(self, schema, key, operation):
+        hash_key, range_key, _ = schema
+        expected = {hash_key, range_key} - {None}
+        if set(key) != expected or any(key[name] is None for name in expected):
+            raise _error('ValidationException', 'The provided key element does not match the schema', operation)
+        return (expressions.stored_value(key[hash_key]),
+                expressions.stored_value(key[range_key]) if range_key else None)
+
+    @_operation('GetItem')
+    def get_item(self, TableName, Key, ProjectionExpression=None, ExpressionAttributeNames=None,
+                 ConsistentRead=False, ReturnConsumedCapacity=None):
+        schema = _schema(TableName, 'GetItem')
+        item = self.store.get(TableName, schema, self._key(schema, Key, 'GetItem'))
+        if item is None:
+            return {}
+        return {'Item': _copy(expressions.project(item, ProjectionExpression, ExpressionAttributeNames))}
+
+    @_operation('PutItem')
+    def put_item(self, TableName, Item, ReturnConsumedCapacity=None):
+        schema = _schema(TableName, 'PutItem')
+        item = expressions.stored_value(Item)
+        self._key(schema, {name: item.get(name) for name in schema[:2] if name}, 'PutItem')
+        self.store.put(TableName, schema, item)
+        return {}
+
+    @_operation('UpdateItem')
+    def update_item(self, TableName, Key, UpdateExpression, ExpressionAttributeNames=None,
+                    ExpressionAttributeValues=None, ReturnValues='NONE', ReturnConsumedCapacity=None):
+        schema = _schema(TableName, 'UpdateItem')
+        key = self._key(schema, Key, 'UpdateItem')
+        old = self.store.get(TableName, schema, key)
+        base = old or {name: value for name, value in zip(schema[:2], key) if name}
+        item, touched = expressions.apply_update(base, UpdateExpression, ExpressionAttributeNames,
+                                                 ExpressionAttributeValues)
+        if any(name in touched for name in schema[:2] if name):
+            raise _error('ValidationException', 'Cannot update attribute that is part of the key', 'UpdateItem')
+        self.store.put(TableName, schema, item)
+        if ReturnValues == 'NONE':
+            return {}
+        if ReturnValues != 'UPDATED_NEW':
+            raise _error('ValidationException', f'The local backends only return UPDATED_NEW, not {ReturnValues}',
+                         'UpdateItem')
+        updated = {name: item[name] for name in touched if name in item}
+        return {'Attributes': _copy(updated)} if updated else {}
+
+    @_operation('DeleteItem')
+    def delete_item(self, TableName, Key, ReturnValues='NONE', ReturnConsumedCapacity=None):
+        schema = _schema(TableName, 'DeleteItem')
+        old = self.store.delete(TableName, schema, self._key(schema, Key, 'DeleteItem'))
+        return {'Attributes': _copy(old)} if ReturnValues == 'ALL_OLD' and old else {}
+
+    def _page(self, rows, schema, index_name, key_condition, filter_expression, projection, names, values, limit):
+        # Limit counts the items read, before the filter, as in DynamoDB
+        limit = limit or PAGE_ITEMS
+        items = []
+        read = 0
+        last = None
+        for item in rows:
+            if key_condition is not None and not expressions.evaluate(key_condition, item, names, values):
+                continue
+            read += 1
+            last = item
+            if filter_expression is None or expressions.evaluate(filter_expression, item, names, values):
+                if index_name is not None:
+                    projected = schema[2][index_name][2]
+                    item = {name: value for name, value in item.items() if name in projected}
+                items.append(_copy(expressions.project(item, projection, names)))
+            if read >= limit:
+                break
+        response = {'Items': items, 'Count': len(items), 'ScannedCount': read}
+        if read >= limit and last is not None:
+            key_names = {name for name in schema[:2] if name}
+            if index_name is not None:
+                key_names.update(schema[2][index_name][:2])
+            response['LastEvaluatedKey'] = {name: last[name] for name in key_names}
+        return response
+
+    @_operation('Query')
+    def query(self, TableName, KeyConditionExpression, IndexName=None, FilterExpression=None,
+              ProjectionExpression=None, ExpressionAttributeNames=None, ExpressionAttributeValues=None,
+              Limit=None, ExclusiveStartKey=None, ConsistentRead=False, ReturnConsumedCapacity=None):
+        schema = _schema(TableName, 'Query')
+        if IndexName is not None and IndexName not in schema[2]:
+            raise _error('ValidationException', f'The table does not have the specified index: {IndexName}', 'Query')
+        hash_key = schema[2][IndexName][0] if IndexName else schema[0]
+        key_condition = expressions.parse_condition(KeyConditionExpression)
+        hash_value = expressions.key_equality(key_condition, ExpressionAttributeNames, ExpressionAttributeValues,
+                                              hash_key)
+        if hash_value is MISSING:
+            raise _error('ValidationException', f'Query condition missed key schema element: {hash_key}', 'Query')
+        after = _index_keys(schema, IndexName, expressions.stored_value(ExclusiveStartKey))[1] if ExclusiveStartKey else None
+        rows = self.store.query(TableName, schema, IndexName, hash_value, after)
+        return self._page(rows, schema, IndexName, key_condition,
+                          expressions.parse_condition(FilterExpression) if FilterExpression else None,
+                          ProjectionExpression, ExpressionAttributeNames, ExpressionAttributeValues, Limit)
+
+    @_operation('Scan')
+    def scan(self, TableName, FilterExpression=None, ProjectionExpression=None, ExpressionAttributeNames=None,
+             ExpressionAttributeValues=None, Limit=None, ExclusiveStartKey=None, ConsistentRead=False,
+             ReturnConsumedCapacity=None):
+        schema = _schema(TableName, 'Scan')
+        after = _scan_position(schema, expressions.stored_value(ExclusiveStartKey)) if ExclusiveStartKey else None
+        rows = self.store.scan(TableName, schema, after)
+        return self._page(rows, schema, None, None,
+                          expressions.parse_condition(FilterExpression) if FilterExpression else None,
+                          ProjectionExpression, ExpressionAttributeNames, ExpressionAttributeValues, Limit)
+
+    @_operation('BatchGetItem')
+    def batch_get_item(self, RequestItems, ReturnConsumedCapacity=None):
+        responses = {}
+        for table_name, request in RequestItems.items():
+            schema = _schema(table_name, 'BatchGetItem')
+            found = responses[table_name] = []
+            for key in request['Keys']:
+                item = self.store.get(table_name, schema, self._key(schema, key, 'BatchGetItem'))
+                if item is not None:
+                    found.append(_copy(expressions.project(item, request.get('ProjectionExpression'),
+                                                           request.get('ExpressionAttributeNames'))))
+        return {'Responses': responses, 'UnprocessedKeys': {}}
+
+    @_operation('BatchWriteItem')
+    def batch_write_item(self, RequestItems, ReturnConsumedCapacity=None):
+        for table_name, requests in RequestItems.items():
+            schema = _schema(table_name, 'BatchWriteItem')
+            for request in requests:
+                if 'PutRequest' in request:
+                    item = expressions.stored_value(request['PutRequest']['Item'])
+                    self._key(schema, {name: item.get(name) for name in schema[:2] if name}, 'BatchWriteItem')
+                    self.store.put(table_name, schema, item)
+                else:
+                    self.store.delete(table_name, schema,
+                                      self._key(schema, request['DeleteRequest']['Key'], 'BatchWriteItem'))
+        return {'UnprocessedItems': {}}
+
+    @_operation('DescribeTable')
+    def describe_table(self, TableName):
+        schema = _schema(TableName, 'DescribeTable')
+        key_schema = [{'AttributeName': schema[0], 'KeyType': 'HASH'}]
+        if schema[1]:
+            key_schema.append({'AttributeName': schema[1], 'KeyType': 'RANGE'})
+        return {'Table': {
+            'TableName': TableName,
+            'TableStatus': 'ACTIVE',
+            'KeySchema': key_schema,
+            'ItemCount': self.store.count(TableName, schema),
+            'GlobalSecondaryIndexes': [{'IndexName': name, 'IndexStatus': 'ACTIVE'} for name in schema[2]]
+        }}
+
+
+class _Meta:
+    def __init__(self, client):
+        self.client = client
+
+
+class _BatchWriter:
+    # Writes go straight through; there is no request batching to do locally
+    def __init__(self, table):
+        self._table = table
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def put_item(self, Item):
+        self._table.put_item(Item=Item)
+
+    def delete_item(self, Key):
+        self._table.delete_item(Key=Key)
+
+
+class LocalTable:
+    def __init__(self, meta, name):
+        self.meta = meta
+        self.name = self.table_name = name
+
+    def get_item(self, **kwargs):
+        return self.meta.client.get_item(TableName=self.name, **kwargs)
+
+    def put_item(self, **kwargs):
+        return self.meta.client.put_item(TableName=self.name, **kwargs)
+
+    def update_item(self, **kwargs):
+        return self.meta.client.update_item(TableName=self.name, **kwargs)
+
+    def delete_item(self, **kwargs):
+        return self.meta.client.delete_item(TableName=self.name, **kwargs)
+
+    @_builds_conditions
+    def query(self, **kwargs):
+        return self.meta.client.query(TableName=self.name, **kwargs)
+
+    @_builds_conditions
+    def scan(self, **kwargs):
+        return self.meta.client.scan(TableName=self.name, **kwargs)
+
+    def batch_writer(self, overwrite_by_pkeys=None):
+        return _BatchWriter(self)
+
+
+class LocalResource:
+    def __init__(self, store):
+        self.meta = _Meta(LocalClient(store))
+
+    def Table(self, name):
+        return LocalTable(self.meta, name)
+
+    def batch_get_item(self, **kwargs):
+        return self.meta.client.batch_get_item(**kwargs)
+
+    def batch_write_item(self, **kwargs):
+        return self.meta.client.batch_write_item(**kwargs)
+
+
+class LocalPresigner:
+    # generate_presigned_url for get_object, signed with an HMAC the local server checks
+    def __init__(self, base_url=IMAGE_URL, signing_key=SIGNING_KEY):
+        self.base_url = base_url.rstrip('/')
+        self._key = signing_key.encode('utf-8')
+
+    def signature(self, bucket, key, expires):
+        message = f'{bucket}/{key}\n{expires}'.encode('utf-8')
+        return hmac.new(self._key, message, hashlib.sha256).hexdigest()
+
+    def generate_presigned_url(self, ClientMethod, Params=None, ExpiresIn=3600, HttpMethod=None):
+        if ClientMethod != 'get_object':
+            raise _error('InvalidRequest', f'The local presigner only signs get_object, not {ClientMethod}',
+                         'GeneratePresignedUrl')
+        bucket, key = Params['Bucket'], Params['Key']
+        expires = int(time.time()) + int(ExpiresIn)
+        return (f'{self.base_url}/{quote(bucket)}/{quote(key)}'
+                f'?Expires={expires}&Signature={self.signature(bucket, key, expires)}')
+
+    def verify(self, bucket, key, expires, signature):
+        try:
+            expires = int(expires)
+        except (TypeError, ValueError):
+            return False
+        return expires >= time.time() and hmac.compare_digest(self.signature(bucket, key, expires), signature or '')
+
+
+_store = None
+_resource = None
+_presigner = None
+
+
+def store():
+    global _store
+    if _store is None:
+        if BACKEND not in LOCAL_BACKENDS:
+            raise ValueError(f"STORAGE_BACKEND={BACKEND} is not a local backend")
+        _store = SQLiteStore(STORAGE_PATH) if BACKEND == 'sqlite' else MemoryStore()
+    return _store
+
+
+def resource():
+    global _resource
+    if _resource is None:
+        _resource = LocalResource(store())
+    return _resource
+
+
+def presigner():
+    global _presigner
+    if _presigner is None:
+        _presigner = LocalPresigner()
+    return _presigner
@@ -0,0 +1,229 @@
+import re
+from decimal import Decimal
+from functools import lru_cache
+
+# The DynamoDB expressions the handlers send, for the local storage backends
+# (see storageBackend). Only the forms they use are understood: conditions are
+# "=" comparisons and contains() joined by AND, as boto3's condition builder
+# writes them; updates are SET, ADD and DELETE of top-level attributes; and
+# projections list top-level attributes. Anything else is rejected, so a
+# handler that starts relying on more fails locally instead of misbehaving.
+# Expressions are parsed once per distinct string and evaluated against items
+# in the form the boto3 resource hands out: numbers as Decimal, sets as Python sets.
+
+TOKEN = re.compile(r'\s*(?:(?P<name>#\w+)|(?P<value>:\w+)|(?P<op>[=(),])|(?P<word>[A-Za-z_]\w*))')
+UPDATE_CLAUSES = ('SET', 'ADD', 'DELETE')
+MISSING = object()
+
+
+class ExpressionError(ValueError):
+    pass
+
+
+def stored_value(value):
+    # Plain Python values as the resource would store them: ints and floats become Decimal
+    if isinstance(value, bool) or value is None or isinstance(value, (str, bytes, Decimal)):
+        return value
+    if isinstance(value, (int, float)):
+        return Decimal(str(value))
+    if isinstance(value, (set, frozenset)):
+        return {stored_value(v) for v in value}
+    if isinstance(value, (list, tuple)):
+        return [stored_value(v) for v in value]
+    if isinstance(value, dict):
+        return {k: stored_value(v) for k, v in value.items()}
+    raise ExpressionError(f"Unsupported type {type(value).__name__}")
+
+
+class _Parser:
+    def __init__(self, expression):
+        self.expression = expression
+        self.tokens = []
+        position = 0
+        expression = expression.rstrip()
+        while position < len(expression):
+            match = TOKEN.match(expression, position)
+            if match is None:
+                raise self.unsupported()
+            self.tokens.append((match.lastgroup, match.group(match.lastgroup)))
+            position = match.end()
+        self.position = 0
+
+    def unsupported(self):
+        return ExpressionError(f"The local backends don't support the expression {self.expression!r}")
+
+    def peek(self):
+        return self.tokens[self.position] if self.position < len(self.tokens) else (None, None)
+
+    def keyword(self, *words):
+        kind, text = self.peek()
+        return kind == 'word' and text.upper() in words
+
+    def take(self, *kinds, text=None):
+        kind, value = self.peek()
+        if kind is None or (kinds and kind not in kinds) or (text is not None and value != text):
+            raise self.unsupported()
+        self.position += 1
+        return value
+
+    def attribute(self):
+        return self.take('name', 'word')
+
+    def done(self):
+        if self.position != len(self.tokens):
+            raise self.unsupported()
+
+    # condition := term (AND term)* ; term := ( condition ) | contains(attribute, :value) | attribute = :value
+    def condition(self):
+        terms = self.term()
+        while self.keyword('AND'):
+            self.position += 1
+            terms += self.term()
+        return terms
+
+    def term(self):
+        if self.peek()[1] == '(':
+            self.position += 1
+            terms = self.condition()
+            self.take(text=')')
+            return terms
+        if self.peek() == ('word', 'contains'):
+            self.position += 1
+            self.take(text='(')
+            name = self.attribute()
+            self.take(text=',')
+            value = self.take('value')
+            self.take(text=')')
+            return (('contains', name, value),)
+        name = self.attribute()
+        self.take(text='=')
+        return (('=', name, self.take('value')),)
+
+    # update := (SET attribute = :value, ... | ADD attribute :value, ... | DELETE attribute :value, ...)+
+    def update(self):
+        actions = []
+        while self.peek()[0] is not None:
+            if not self.keyword(*UPDATE_CLAUSES):
+                raise self.unsupported()
+            clause = self.take().upper()
+            while True:
+                name = self.attribute()
+                if clause == 'SET':
+                    self.take(text='=')
+                actions.append((clause, name, self.take('value')))
+                if self.peek()[1] != ',':
+                    break
+                self.position += 1
+        return tuple(actions)
+
+    def projection(self):
+        names = [self.attribute()]
+        while self.peek()[1] == ',':
+            self.position += 1
+            names.append(self.attribute())
+        return tuple(names)
+
+
+@lru_cache(maxsize=1024)
+def parse_condition(expression):
+    parser = _Parser(expression)
+    terms = parser.condition()
+    parser.done()
+    return terms
+
+
+@lru_cache(maxsize=1024)
+def parse_update(expression):
+    parser = _Parser(expression)
+    actions = parser.update()
+    parser.done()
+    return actions
+
+
+@lru_cache(maxsize=1024)
+def parse_projection(expression):
+    parser = _Parser(expression)
+    names = parser.projection()
+    parser.done()
+    return names
+
+
+def _name(name, names):
+    if name.startswith('#'):
+        try:
+            return names[name]
+        except (KeyError, TypeError):
+            raise ExpressionError(f"Undefined attribute name placeholder {name}")
+    return name
+
+
+def _value(placeholder, values):
+    try:
+        return stored_value(values[placeholder])
+    except (KeyError, TypeError):
+        raise ExpressionError(f"Undefined attribute value placeholder {placeholder}")
+
+
+def evaluate(terms, item, names=None, values=None):
+    for operator, name, placeholder in terms:
+        value = item.get(_name(name, names), MISSING)
+        expected = _value(placeholder, values)
+        if operator == '=':
+            if type(value) is not type(expected) or value != expected:
+                return False
+        elif isinstance(value, str):
+            if not isinstance(expected, str) or expected not in value:
+                return False
+        elif not isinstance(value, (set, list)) or expected not in value:
+            return False
+    return True
+
+
+def key_equality(terms, names, values, attribute):
+    # The value a key condition requires attribute to equal
+    for operator, name, placeholder in terms:
+        if operator == '=' and _name(name, names) == attribute:
+            return _value(placeholder, values)
+    return MISSING
+
+
+def apply_update(item, expression, names=None, values=None):
+    # (new item, attributes it touched); every operand reads the item as it was
+    updated = dict(item)
+    touched = []
+    for clause, name, placeholder in parse_update(expression):
+        name = _name(name, names)
+        amount = _value(placeholder, values)
+        current = item.get(name, MISSING)
+        if clause == 'SET':
+            value = amount
+        elif clause == 'ADD':
+            if current is MISSING:
+                value = amount
+            elif isinstance(current, Decimal) and isinstance(amount, Decimal):
+                value = current + amount
+            elif isinstance(current, set) and isinstance(amount, set):
+                value = current | amount
+            else:
+                raise ExpressionError("ADD needs a number or a set of the attribute's type")
+        else:
+            if not isinstance(amount, set) or (current is not MISSING and not isinstance(current, set)):
+                raise ExpressionError("DELETE needs a set")
+            value = MISSING if current is MISSING else (current - amount) or MISSING
+        if value is MISSING:
+            updated.pop(name, None)
+        else:
+            updated[name] = value
+        touched.append(name)
+    return updated, touched
+
+
+def project(item, expression, names=None):
+    if not expression:
+        return item
+    projected = {}
+    for name in parse_projection(expression):
+        name = _name(name, names)
+        if name in item:
+            projected[name] = item[name]
+    return projected
@@ -1,157 +1,295 @@
+import lambdaRuntime as runtime
 import json
-import boto3
+import time
 import uuid
+import base64
+import hashlib
 from boto3.dynamodb.conditions import Key
 from urllib.parse import unquote
 from html import unescape
+import presignCache
+import imageVariants
+import sessionCache
+import batchOps
+import membershipCache
+import popularity
+import requestLog
 
-dynamodb = boto3.resource('dynamodb', region_name='us-east-1')
-subscription_table = dynamodb.Table('user_subscriptions')
-music_table = dynamodb.Table('music')
-session_table = dynamodb.Table('sessions')
-s3 = boto3.client('s3', region_name='us-east-1')
+dynamodb = runtime.dynamodb
+subscription_table = runtime.lazy_table('user_subscriptions')
+music_table = runtime.lazy_table('music')
+session_table = runtime.lazy_table('sessions')
+popularity_table = runtime.lazy_table(popularity.TABLE_NAME)
 BUCKET_NAME = 'rmit-music-images'
+url_cache = presignCache.PresignedUrlCache(runtime.s3, BUCKET_NAME)
+sessions = sessionCache.SessionCache(session_table)
+MAX_BATCH_SIZE = 500
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 200
+LISTING_ATTRIBUTES = ('title', 'year', 'artist', 'album', 'img_key', 'uuid')
+# A 304 keeps the client's signed URLs, so the ETag changes well before cached ones run short
+ETAG_WINDOW = url_cache.min_remaining // 2
+INDEX_SETTLE_SECONDS = 5      # How long a change may take to reach user-title-index
 
-def generate_presigned_url(bucket_name, key, expiration=3600):
-    try:
-        url = s3.generate_presigned_url(
-            'get_object',
-            Params={'Bucket': bucket_name, 'Key': key},
-            ExpiresIn=expiration
-        )
-        return url
-    except Exception as e:
-        print(f"Error generating pre-signed URL: {e}")
+HEADERS = runtime.headers()
+PREFLIGHT_HEADERS = runtime.headers(methods='POST, DELETE, GET, OPTIONS', allow_headers='Content-Type, X-Session-Token, If-None-Match')
+log = requestLog.RequestLog('subscriptionFunction')
+
+def subscription_item(user_email, music_item):
+    return {
+        'user_email': user_email,
+        'uuid': str(uuid.uuid4()),
+        'title': music_item['title'],
+        'year': music_item['year'],
+        'album': music_item['album'],
+        'artist': music_item['artist'],
+        'img_key': presignCache.image_key_for_url(music_item.get('img_url')),  # Store key only
+        'title_sort': membershipCache.title_sort_key(music_item['title'])
+    }
+
+def listing_etag(user_email, version, event, page_size, next_token):
+    # Everything that changes the body: the user's subscriptions, the signing window and the request
+    parts = (
+        user_email, version, int(time.time() // ETAG_WINDOW), page_size, next_token or '',
+        imageVariants.requested_view(event), imageVariants.accepts_webp(event)
+    )
+    return 'W/"' + hashlib.sha256('\n'.join(map(str, parts)).encode('utf-8')).hexdigest()[:24] + '"'
+
+def etag_matches(headers, etag):
+    header = next((value for name, value in headers.items() if name.lower() == 'if-none-match'), None)
+    if not header:
+        return False
+    # Weak comparison: W/"x" and "x" name the same representation
+    tags = {tag.strip().removeprefix('W/') for tag in header.split(',')}
+    return '*' in tags or etag.removeprefix('W/') in tags
+
+def encode_cursor(last_key):
+    raw = json.dumps({'t': last_key['title_sort'], 'u': last_key['uuid']}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+def decode_cursor(token, user_email):
+    if not token:
         return None
+    try:
+        state = json.loads(base64.urlsafe_b64decode(token.encode('ascii')))
+        # The partition always comes from the session, never from the token
+        return {'user_email': user_email, 'title_sort': state['t'], 'uuid': state['u']}
+    except Exception:
+        raise ValueError("Invalid continuation token.")
+
+def list_subscriptions(user_email, page_size, start_key):
+    kwargs = {
+        'IndexName': membershipCache.TITLE_INDEX,
+        'KeyConditionExpression': Key('user_email').eq(user_email),
+        'ProjectionExpression': ', '.join(f'#a{i}' for i in range(len(LISTING_ATTRIBUTES))),
+        'ExpressionAttributeNames': {f'#a{i}': name for i, name in enumerate(LISTING_ATTRIBUTES)},
+        'Limit': page_size
+    }
+    if start_key:
+        kwargs['ExclusiveStartKey'] = start_key
+    response = subscription_table.query(**kwargs)
+    last_key = response.get('LastEvaluatedKey')
+    return response.get('Items', []), encode_cursor(last_key) if last_key else None
 
+def batch_subscribe(user_email, songs):
+    requested = []
+    for song in songs:
+        title, year = (song.get('title'), song.get('year')) if isinstance(song, dict) else (None, None)
+        if not isinstance(title, str) or not isinstance(year, str) or not title or not year:
+            requested.append(None)
+        else:
+            requested.append((unescape(title), year))
+
+    keys = [{'title': title, 'year': year} for title, year in filter(None, requested)]
+    music_items, unprocessed_keys = batchOps.batch_get(dynamodb, music_table.name, keys)
+    found = {(item['title'], item['year']): item for item in music_items}
+    unresolved = {(key['title'], key['year']) for key in unprocessed_keys}
+
+    new_items = {key: subscription_item(user_email, item) for key, item in found.items()}
+    unprocessed = batchOps.batch_write(
+        dynamodb,
+        subscription_table.name,
+        [{'PutRequest': {'Item': item}} for item in new_items.values()]
+    )
+    failed = {request['PutRequest']['Item']['uuid'] for request in unprocessed}
+    popularity.record(popularity_table, [item for item in new_items.values() if item['uuid'] not in failed], 1)
+
+    results = []
+    for song, key in zip(songs, requested):
+        if key is None:
+            results.append({'song': song, 'status': 'invalid'})
+        elif key in unresolved:
+            results.append({'title': key[0], 'year': key[1], 'status': 'failed'})
+        elif key not in new_items:
+            results.append({'title': key[0], 'year': key[1], 'status': 'not_found'})
+        elif new_items[key]['uuid'] in failed:
+            results.append({'title': key[0], 'year': key[1], 'status': 'failed'})
+        else:
+            results.append({'title': key[0], 'year': key[1], 'status': 'subscribed', 'uuid': new_items[key]['uuid']})
+    return results
+
+def valid_uuid(subscription_uuid):
+    # The per-user version item shares the partition but is not a subscription
+    return isinstance(subscription_uuid, str) and subscription_uuid and subscription_uuid != membershipCache.VERSION_UUID
+
+def batch_unsubscribe(user_email, uuids):
+    unique_uuids = list(dict.fromkeys(u for u in uuids if valid_uuid(u)))
+    # BatchWriteItem returns no old images, so read the songs being removed for the counters
+    existing, unread_keys = batchOps.batch_get(
+        dynamodb, subscription_table.name, [{'user_email': user_email, 'uuid': u} for u in unique_uuids],
+        ProjectionExpression='#u, ' + ', '.join(f'#f{i}' for i in range(len(popularity.SONG_FIELDS))),
+        ExpressionAttributeNames={'#u': 'uuid', **{f'#f{i}': field for i, field in enumerate(popularity.SONG_FIELDS)}}
+    )
+    # Keys the read could not get to may still exist, so they are deleted all the same
+    found = {item['uuid'] for item in existing} | {key['uuid'] for key in unread_keys}
+    unprocessed = batchOps.batch_write(
+        dynamodb,
+        subscription_table.name,
+        [{'DeleteRequest': {'Key': {'user_email': user_email, 'uuid': u}}} for u in unique_uuids if u in found]
+    )
+    failed = {request['DeleteRequest']['Key']['uuid'] for request in unprocessed}
+    popularity.record(popularity_table, [item for item in existing if item['uuid'] not in failed], -1)
+
+    results = []
+    for subscription_uuid in uuids:
+        if not valid_uuid(subscription_uuid):
+            results.append({'uuid': subscription_uuid, 'status': 'invalid'})
+        elif subscription_uuid not in found:
+            results.append({'uuid': subscription_uuid, 'status': 'not_found'})
+        elif subscription_uuid in failed:
+            results.append({'uuid': subscription_uuid, 'status': 'failed'})
+        else:
+            results.append({'uuid': subscription_uuid, 'status': 'deleted'})
+    return results
+
+@log.handler
+@runtime.compressible
 def lambda_handler(event, context):
     try:
-        print("Received event:", json.dumps(event))
+        runtime.start_invocation()
+
+        log.debug("Received event: %s", lambda: requestLog.dumps(requestLog.redact_event(event)))
         method = event.get('httpMethod')
         headers = event.get('headers', {})
         session_token = headers.get('X-Session-Token') or headers.get('x-session-token')
 
         if not session_token:
-            return {
-                'statusCode': 400,
-                'headers': {'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({"error": "Session token missing."})
-            }
-
-        session_response = session_table.get_item(Key={'session_token': session_token})
-        if 'Item' not in session_response:
-            return {
-                'statusCode': 401,
-                'headers': {'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({"error": "Invalid session token."})
-            }
-
-        user_email = session_response['Item']['email']
+            return runtime.json_response(400, {"error": "Session token missing."}, HEADERS)
+
+        session = sessions.resolve(session_token)
+        if session is None:
+            return runtime.json_response(401, {"error": "Invalid session token."}, HEADERS)
+
+        user_email = session['email']
 
         if method == 'OPTIONS':
-            return {
-                'statusCode': 200,
-                'headers': {
-                    'Access-Control-Allow-Origin': '*',
-                    'Access-Control-Allow-Methods': 'POST, DELETE, GET, OPTIONS',
-                    'Access-Control-Allow-Headers': 'Content-Type, X-Session-Token'
-                },
-                'body': 'CORS preflight successful'
-            }
+            return runtime.text_response(200, 'CORS preflight successful', PREFLIGHT_HEADERS)
 
         if method == 'GET':
-            response = subscription_table.query(
-                KeyConditionExpression=Key('user_email').eq(user_email)
-            )
-            subscriptions = response.get('Items', [])
+            params = event.get('queryStringParameters') or {}
+            try:
+                page_size = int(params.get('limit') or DEFAULT_PAGE_SIZE)
+            except ValueError:
+                page_size = 0
+            if not 1 <= page_size <= MAX_PAGE_SIZE:
+                return runtime.json_response(400, {"error": f"limit must be between 1 and {MAX_PAGE_SIZE}."}, HEADERS)
+            next_token = params.get('next_token')
 
-            for sub in subscriptions:
-                if 'img_key' in sub:
-                    presigned_url = generate_presigned_url(BUCKET_NAME, sub['img_key'])
-                    if presigned_url:
-                        sub['img_url'] = presigned_url
+            # One consistent read decides whether the client's copy is still current
+            version, updated = membershipCache.read_version(subscription_table, user_email)
+            etag = listing_etag(user_email, version, event, page_size, next_token)
+            # Right after a change the index may still be behind, so that listing is not tagged
+            settled = time.time() - updated >= INDEX_SETTLE_SECONDS
+            listing_headers = dict(HEADERS)
+            if settled:
+                listing_headers.update({'ETag': etag, 'Cache-Control': 'private, no-cache', 'Access-Control-Expose-Headers': 'ETag'})
+                if etag_matches(headers, etag):
+                    log.set(not_modified=True)
+                    return runtime.text_response(304, '', listing_headers)
+            else:
+                listing_headers['Cache-Control'] = 'no-store'
 
-            subscriptions.sort(key=lambda x: x.get('title', '').lower())
+            try:
+                start_key = decode_cursor(next_token, user_email)
+            except ValueError as e:
+                return runtime.json_response(400, {"error": str(e)}, HEADERS)
+            subscriptions, next_token = list_subscriptions(user_email, page_size, start_key)
 
-            return {
-                'statusCode': 200,
-                'headers': {'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({"subscriptions": subscriptions})
-            }
+            select_key = imageVariants.selector(event)
+            with log.timed('s3.presign'):
+                urls = url_cache.sign_many(select_key(sub['img_key']) for sub in subscriptions if sub.get('img_key'))
+            for sub in subscriptions:
+                presigned_url = urls.get(select_key(sub.get('img_key')))
+                if presigned_url:
+                    sub['img_url'] = presigned_url
+
+            payload = {"subscriptions": subscriptions}
+            if next_token:
+                payload['next_token'] = next_token
+            return runtime.json_response(200, payload, listing_headers)
 
-        body = json.loads(event.get('body', '{}'))
+        body = json.loads(runtime.request_body(event, '{}'))
         raw_title = body.get('title', '')
         decoded_title = unescape(raw_title)
         year = body.get('year')
         subscription_uuid = body.get('uuid')
 
+        # Batch mode: {"songs": [{"title", "year"}, ...]} for POST, {"uuids": [...]} for DELETE
+        batch = body.get('songs') if method == 'POST' else body.get('uuids') if method == 'DELETE' else None
+        if batch is not None:
+            if not isinstance(batch, list) or not 1 <= len(batch) <= MAX_BATCH_SIZE:
+                return runtime.json_response(400, {"error": f"Batch must be a list of 1 to {MAX_BATCH_SIZE} entries."}, HEADERS)
+
+            if method == 'POST':
+                results = batch_subscribe(user_email, batch)
+                succeeded = all(result['status'] == 'subscribed' for result in results)
+                changed = any(result['status'] == 'subscribed' for result in results)
+            else:
+                results = batch_unsubscribe(user_email, batch)
+                succeeded = all(result['status'] == 'deleted' for result in results)
+                changed = any(result['status'] == 'deleted' for result in results)
+            if changed:
+                membershipCache.bump_version(subscription_table, user_email)
+
+            return runtime.json_response(200, {"success": succeeded, "results": results}, HEADERS)
+
         if method == 'POST':
             response = music_table.get_item(Key={'title': decoded_title, 'year': year})
             if 'Item' not in response:
-                return {
-                    'statusCode': 404,
-                    'headers': {'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({"error": "Music not found."})
-                }
-
-            music_item = response['Item']
-            subscription_uuid = str(uuid.uuid4())
-
-            
-            img_key = None
-            if 'img_url' in music_item and 'githubusercontent.com' in music_item['img_url']:
-                img_name = music_item['img_url'].split("/")[-1]
-                img_key = f'images/{img_name}'
-
-            subscription_table.put_item(
-                Item={
-                    'user_email': user_email,
-                    'uuid': subscription_uuid,
-                    'title': music_item['title'],
-                    'year': music_item['year'],
-                    'album': music_item['album'],
-                    'artist': music_item['artist'],
-                    'img_key': img_key  # Store key only
-                }
-            )
-
-            return {
-                'statusCode': 200,
-                'headers': {'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({"success": True, "uuid": subscription_uuid})
-            }
+                return runtime.json_response(404, {"error": "Music not found."}, HEADERS)
+
+            item = subscription_item(user_email, response['Item'])
+            subscription_uuid = item['uuid']
+
+            subscription_table.put_item(Item=item)
+            # Tells queryFunction containers their cached membership for this user is stale
+            membershipCache.bump_version(subscription_table, user_email)
+            popularity.record(popularity_table, [item], 1)
+
+            return runtime.json_response(200, {"success": True, "uuid": subscription_uuid}, HEADERS)
 
         elif method == 'DELETE':
-            if not subscription_uuid:
-                return {
-                    'statusCode': 400,
-                    'headers': {'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({"error": "UUID is required for deletion."})
-                }
-
-            subscription_table.delete_item(
+            if not subscription_uuid or subscription_uuid == membershipCache.VERSION_UUID:
+                return runtime.json_response(400, {"error": "UUID is required for deletion."}, HEADERS)
+
+            removed = subscription_table.delete_item(
                 Key={
                     'user_email': user_email,
                     'uuid': subscription_uuid
-                }
-            )
+                },
+                ReturnValues='ALL_OLD'
+            ).get('Attributes')
+            membershipCache.bump_version(subscription_table, user_email)
+            # Only a subscription that really existed lowers the song's count
+            if removed:
+                popularity.record(popularity_table, [removed], -1)
 
-            return {
-                'statusCode': 200,
-                'headers': {'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({"success": True})
-            }
+            return runtime.json_response(200, {"success": True}, HEADERS)
 
-        return {
-            'statusCode': 405,
-            'headers': {'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({"error": "Method not allowed."})
-        }
+        return runtime.json_response(405, {"error": "Method not allowed."}, HEADERS)
 
     except Exception as e:
-        print(f"Error: {str(e)}")
-        return {
-            'statusCode': 500,
-            'headers': {'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({"error": str(e)})
-        }
+        log.error("Subscription request failed: %s", e)
+        return runtime.json_response(500, {"error": str(e)}, HEADERS)
+
+runtime.init_complete('subscriptionFunction')
@@ -0,0 +1,78 @@
+import lambdaRuntime as runtime
+import presignCache
+import imageVariants
+import popularity
+import sessionCache
+import requestLog
+
+# Trending songs from the lists rollupFunction precomputes: overall, or for
+# one artist or year. Every request is a single get_item, however large the
+# catalog or the number of subscriptions.
+#
+#   GET ?artist=Taylor%20Swift&limit=10
+
+session_table = runtime.lazy_table('sessions')
+popularity_table = runtime.lazy_table(popularity.TABLE_NAME)
+sessions = sessionCache.SessionCache(session_table)
+BUCKET_NAME = 'rmit-music-images'
+url_cache = presignCache.PresignedUrlCache(runtime.s3, BUCKET_NAME)
+DEFAULT_LIMIT = 10
+MAX_LIMIT = 50
+
+HEADERS = runtime.headers(content_type=True, methods='GET, OPTIONS', allow_headers='Content-Type, X-Session-Token')
+log = requestLog.RequestLog('trendingFunction')
+
+@log.handler
+def lambda_handler(event, context):
+    try:
+        runtime.start_invocation()
+
+        log.debug("Received event: %s", lambda: requestLog.dumps(requestLog.redact_event(event)))
+
+        method = event.get('httpMethod')
+        if method == 'OPTIONS':
+            return runtime.text_response(200, 'CORS preflight successful', HEADERS)
+
+        headers = event.get('headers') or {}
+        session_token = headers.get('X-Session-Token') or headers.get('x-session-token')
+        if not session_token:
+            return runtime.json_response(400, {"error": "Session token missing."}, HEADERS)
+
+        if method != 'GET':
+            return runtime.json_response(405, {"error": "Method not allowed."}, HEADERS)
+
+        if sessions.resolve(session_token) is None:
+            return runtime.json_response(401, {"error": "Invalid session token."}, HEADERS)
+
+        params = event.get('queryStringParameters') or {}
+        artist = params.get('artist', '').strip()
+        year = params.get('year', '').strip()
+        if artist and year:
+            return runtime.json_response(400, {"error": "Choose either artist or year, not both."}, HEADERS)
+        try:
+            limit = int(params.get('limit', DEFAULT_LIMIT))
+        except ValueError:
+            limit = 0
+        if not 1 <= limit <= MAX_LIMIT:
+            return runtime.json_response(400, {"error": f"limit must be between 1 and {MAX_LIMIT}."}, HEADERS)
+
+        scope, value = ('artist', artist) if artist else ('year', year) if year else ('overall', None)
+        item = popularity_table.get_item(Key={'counter_key': popularity.rollup_key(scope, value)}).get('Item') or {}
+        songs = item.get('songs', [])[:limit]
+
+        select_key = imageVariants.selector(event)
+        with log.timed('s3.presign'):
+            urls = url_cache.sign_many(select_key(song['img_key']) for song in songs if song.get('img_key'))
+        for song in songs:
+            presigned_url = urls.get(select_key(song.pop('img_key', None)))
+            if presigned_url:
+                song['img_url'] = presigned_url
+        log.set(scope=scope, results=len(songs))
+
+        return runtime.json_response(200, {"success": True, "scope": scope, "songs": songs, "updated": item.get('updated')}, HEADERS)
+
+    except Exception as e:
+        log.error("Trending request failed: %s", e)
+        return runtime.json_response(500, {"error": str(e)}, HEADERS)
+
+runtime.init_complete('trendingFunction')
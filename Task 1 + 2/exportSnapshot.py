@@ -0,0 +1,104 @@
+import os
+import sys
+import json
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import boto3
+from loadCatalog import iter_songs
+
+# The snapshot format and its loader live with the Lambda functions
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Lambda Functions'))
+import catalogSnapshot
+import queryCache
+
+# Exports the music catalog into the memory-mapped snapshot the Lambda
+# functions load at cold start (see catalogSnapshot), from the table itself
+# or straight from a catalog file, and publishes it to S3 or a local path.
+# Publish again after every catalog load: containers only build their indexes
+# from a snapshot whose catalog version is no older than the query cache's
+# shared version, and scan the table otherwise. Without --catalog-version the
+# shared version is read from QUERY_CACHE_TABLE before the table is scanned.
+#
+#   python exportSnapshot.py s3://rmit-music-images/catalog/music.snap
+#   python exportSnapshot.py music.snap --catalog 2025a1.json
+#   python exportSnapshot.py music.snap --segments 16 --endpoint-url http://localhost:8000
+
+# year is a reserved word, so every attribute goes through a placeholder
+SCAN_NAMES = {f'#f{i}': field for i, field in enumerate(catalogSnapshot.FIELDS)}
+
+
+def scan_table(table_name='music', region_name='us-east-1', endpoint_url=None, segments=8):
+    # Parallel scan; every segment runs on its own resource, since those are not thread safe
+    def scan_segment(segment):
+        table = boto3.session.Session().resource(
+            'dynamodb', region_name=region_name, endpoint_url=endpoint_url).Table(table_name)
+        kwargs = {'ProjectionExpression': ', '.join(SCAN_NAMES), 'ExpressionAttributeNames': SCAN_NAMES,
+                  'Segment': segment, 'TotalSegments': segments}
+        items = []
+        while True:
+            response = table.scan(**kwargs)
+            items.extend(response.get('Items', []))
+            if 'LastEvaluatedKey' not in response:
+                return items
+            kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+    with ThreadPoolExecutor(max_workers=segments) as executor:
+        for items in executor.map(scan_segment, range(segments)):
+            yield from items
+
+
+def read_catalog_version(cache_table, region_name='us-east-1', endpoint_url=None):
+    table = boto3.resource('dynamodb', region_name=region_name, endpoint_url=endpoint_url).Table(cache_table)
+    return queryCache.DynamoDBTier(table).version()
+
+
+def export_snapshot(location, catalog_path=None, table_name='music', region_name='us-east-1',
+                    endpoint_url=None, segments=8, catalog_version=None, cache_table=None):
+    started = time.time()
+    if catalog_version is None and cache_table and not catalog_path:
+        # Read before the scan: every write counted in this version is already in the table
+        catalog_version = read_catalog_version(cache_table, region_name, endpoint_url)
+    items = iter_songs(catalog_path) if catalog_path else scan_table(table_name, region_name, endpoint_url, segments)
+    data = catalogSnapshot.build(items, catalog_version=catalog_version)
+    s3 = boto3.client('s3', region_name=region_name) if location.startswith('s3://') else None
+    catalogSnapshot.publish(data, location, s3=s3)
+    header, _ = catalogSnapshot.read_header(data)
+    return {
+        'location': location,
+        'songs': header['count'],
+        'catalog_version': header.get('catalog_version'),
+        'bytes': len(data),
+        'distinct': {field: column['distinct'] for field, column in header['columns'].items() if 'distinct' in column},
+        'elapsed_seconds': round(time.time() - started, 3)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the music catalog as a memory-mapped snapshot")
+    parser.add_argument('location', help="s3://bucket/key or a local file path")
+    parser.add_argument('--catalog', help="Build from a catalog JSON or JSONL file instead of the table")
+    parser.add_argument('--table', default='music')
+    parser.add_argument('--region', default='us-east-1')
+    parser.add_argument('--endpoint-url', help="e.g. http://localhost:8000 for DynamoDB Local")
+    parser.add_argument('--segments', type=int, default=8, help="Parallel scan segments")
+    parser.add_argument('--catalog-version', type=int, help="Recorded in the snapshot header (default: read from --cache-table)")
+    parser.add_argument('--cache-table', default=os.environ.get('QUERY_CACHE_TABLE'),
+                        help="Query cache table holding the shared catalog version")
+    args = parser.parse_args()
+
+    summary = export_snapshot(
+        args.location,
+        catalog_path=args.catalog,
+        table_name=args.table,
+        region_name=args.region,
+        endpoint_url=args.endpoint_url,
+        segments=args.segments,
+        catalog_version=args.catalog_version,
+        cache_table=args.cache_table
+    )
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == '__main__':
+    main()
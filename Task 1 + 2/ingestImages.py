@@ -0,0 +1,317 @@
+import io
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+import boto3
+import requests
+from botocore.config import Config
+from botocore.exceptions import ClientError
+from boto3.exceptions import S3UploadFailedError
+from boto3.s3.transfer import TransferConfig
+from loadCatalog import iter_songs
+
+try:
+    from PIL import Image
+except ImportError:  # Without Pillow only the originals are copied
+    Image = None
+
+# Variant names and key layout are shared with the handlers that sign them
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Lambda Functions'))
+import imageVariants
+
+# Copies every distinct song image into the S3 bucket. Each target key is
+# fetched once, bytes are streamed straight from the HTTP response into S3,
+# and objects that are already there are skipped. With Pillow installed, a
+# thumbnail and WebP versions of every image are written under their own
+# prefixes (see imageVariants), and missing ones are filled in for skipped
+# images; resizing is CPU bound, so it runs in a pool of processes while the
+# threads keep the transfers going.
+#
+#   python ingestImages.py 2025a1.json
+#   python ingestImages.py 2025a1.json --workers 32 --endpoint-url http://localhost:5000
+#   python ingestImages.py 2025a1.json --no-derivatives
+
+BUCKET_NAME = 'rmit-music-images'
+KEY_PREFIX = 'images/'
+MAX_ATTEMPTS = 4
+BASE_DELAY = 0.25
+TRANSFER_CONFIG = TransferConfig(multipart_threshold=8 * 1024 * 1024, multipart_chunksize=8 * 1024 * 1024)
+JPEG_QUALITY = 82
+WEBP_QUALITY = 78
+DERIVATIVE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+
+def image_targets(songs, prefix=KEY_PREFIX):
+    # Many songs share an artist image; keep one source URL per target key
+    targets = {}
+    for song in songs:
+        img_url = song.get('img_url') if isinstance(song, dict) else None
+        if img_url:
+            targets.setdefault(prefix + img_url.split("/")[-1], img_url)
+    return targets
+
+
+def render_variants(data, names):
+    # Runs in a worker process: decodes the original once and encodes each variant
+    with Image.open(io.BytesIO(data)) as source:
+        largest = max(imageVariants.VARIANTS[name][1] for name in names)
+        source.draft('RGB', (largest * 2, largest * 2))   # JPEG decoders can skip most of the pixels
+        source.load()
+        rendered = {}
+        for name in names:
+            _, edge, image_format, _, _ = imageVariants.VARIANTS[name]
+            image = source.copy()
+            image.thumbnail((edge, edge), Image.LANCZOS)
+            if image_format == 'JPEG' and image.mode != 'RGB':
+                image = image.convert('RGB')
+            elif image.mode not in ('RGB', 'RGBA'):
+                image = image.convert('RGBA' if 'A' in image.getbands() or 'transparency' in image.info else 'RGB')
+            out = io.BytesIO()
+            if image_format == 'JPEG':
+                image.save(out, 'JPEG', quality=JPEG_QUALITY, optimize=True, progressive=True)
+            else:
+                image.save(out, 'WEBP', quality=WEBP_QUALITY, method=4)
+            rendered[name] = out.getvalue()
+    return rendered
+
+
+class CountingReader:
+    def __init__(self, raw, keep=None):
+        self.raw = raw
+        self.count = 0
+        self.keep = keep       # Collects the bytes when derivatives are made from them
+
+    def read(self, size=-1):
+        data = self.raw.read(size)
+        self.count += len(data)
+        if self.keep is not None:
+            self.keep.append(data)
+        return data
+
+
+class IngestStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started = time.time()
+        self.targets = 0
+        self.uploaded = 0
+        self.skipped = 0
+        self.failed = 0
+        self.retries = 0
+        self.bytes = 0
+        self.derived = 0
+        self.derived_bytes = 0
+        self.derive_failed = 0
+
+    def add(self, **counts):
+        with self._lock:
+            for name, value in counts.items():
+                setattr(self, name, getattr(self, name) + value)
+
+    def summary(self):
+        elapsed = time.time() - self.started
+        return {
+            'targets': self.targets,
+            'uploaded': self.uploaded,
+            'skipped': self.skipped,
+            'failed': self.failed,
+            'retries': self.retries,
+            'bytes': self.bytes,
+            'derived': self.derived,
+            'derived_bytes': self.derived_bytes,
+            'derive_failed': self.derive_failed,
+            'elapsed_seconds': round(elapsed, 3),
+            'objects_per_second': round((self.uploaded + self.skipped) / elapsed, 1) if elapsed > 0 else 0.0,
+            'megabytes_per_second': round(self.bytes / elapsed / 1e6, 2) if elapsed > 0 else 0.0
+        }
+
+
+class ImageIngester:
+    def __init__(self, bucket_name=BUCKET_NAME, region_name='us-east-1', endpoint_url=None,
+                 workers=16, timeout=30, force=False, derivatives=True, processes=None):
+        self.bucket_name = bucket_name
+        self.workers = workers
+        self.timeout = timeout
+        self.force = force
+        self.derivatives = derivatives and Image is not None
+        if derivatives and Image is None:
+            print("Pillow is not installed; copying originals without derivatives.")
+        self.processes = processes or os.cpu_count() or 1
+        self._pool = None
+        self._variant_keys = set()   # Variant objects already in the bucket, listed once per ingest
+        self.stats = IngestStats()
+        # boto3 clients are thread safe; size the pool to the number of workers
+        self.s3 = boto3.client('s3', region_name=region_name, endpoint_url=endpoint_url,
+                               config=Config(max_pool_connections=workers, retries={'mode': 'standard'}))
+        self._local = threading.local()
+
+    def _http(self):
+        # One keep-alive session per worker thread
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = self._local.session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=4)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+        return session
+
+    def ensure_bucket(self):
+        try:
+            self.s3.head_bucket(Bucket=self.bucket_name)
+        except ClientError:
+            self.s3.create_bucket(Bucket=self.bucket_name)
+            print(f"Bucket '{self.bucket_name}' created successfully.")
+
+    def _existing(self, key):
+        try:
+            return self.s3.head_object(Bucket=self.bucket_name, Key=key)
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+                return None
+            raise
+
+    def _is_current(self, key, url):
+        existing = self._existing(key)
+        if existing is None:
+            return False
+        source_etag = existing.get('Metadata', {}).get('source-etag')
+        if not source_etag:
+            return True
+        # Re-copy only when the source has changed since the last upload
+        response = self._http().head(url, timeout=self.timeout, allow_redirects=True)
+        return response.ok and response.headers.get('ETag', '') == source_etag
+
+    def _list_variants(self):
+        # One listing per variant prefix instead of a HEAD per variant of every skipped image
+        keys = set()
+        paginator = self.s3.get_paginator('list_objects_v2')
+        for prefix in {variant[0] for variant in imageVariants.VARIANTS.values()}:
+            for page in paginator.paginate(Bucket=self.bucket_name, Prefix=prefix):
+                keys.update(item['Key'] for item in page.get('Contents', []))
+        return keys
+
+    def _missing_variants(self, key):
+        if self.force:
+            return list(imageVariants.VARIANTS)
+        return [name for name in imageVariants.VARIANTS
+                if imageVariants.variant_key(key, name) not in self._variant_keys]
+
+    def _derive(self, key, names=None, data=None):
+        try:
+            names = names or self._missing_variants(key)
+            if not names:
+                return
+            if data is None:
+                data = self.s3.get_object(Bucket=self.bucket_name, Key=key)['Body'].read()
+            rendered = self._pool.submit(render_variants, data, names).result()
+            for name, body in rendered.items():
+                content_type = imageVariants.VARIANTS[name][4]
+                self.s3.put_object(Bucket=self.bucket_name, Key=imageVariants.variant_key(key, name), Body=body,
+                                   ContentType=content_type, CacheControl=DERIVATIVE_CACHE_CONTROL)
+                self.stats.add(derived=1, derived_bytes=len(body))
+        except Exception as e:  # A bad image must not stop the rest of the ingest
+            print(f"Failed to make derivatives of {key}: {e}")
+            self.stats.add(derive_failed=1)
+
+    @staticmethod
+    def _status(error):
+        # HTTP status behind a failed source request or S3 call, if there was a response
+        if isinstance(error, ClientError):
+            return error.response.get('ResponseMetadata', {}).get('HTTPStatusCode')
+        return getattr(getattr(error, 'response', None), 'status_code', None)
+
+    def ingest_one(self, key, url):
+        current = False if self.force else None
+        for attempt in range(1, MAX_ATTEMPTS + 1):
+            try:
+                if current is None:
+                    current = self._is_current(key, url)
+                if current:
+                    self.stats.add(skipped=1)
+                    break
+                with self._http().get(url, stream=True, timeout=self.timeout) as response:
+                    response.raise_for_status()
+                    response.raw.decode_content = True
+                    extra_args = {'ContentType': response.headers.get('Content-Type', 'image/jpeg')}
+                    if response.headers.get('ETag'):
+                        extra_args['Metadata'] = {'source-etag': response.headers['ETag']}
+                    chunks = [] if self.derivatives else None
+                    body = CountingReader(response.raw, chunks)
+                    self.s3.upload_fileobj(body, self.bucket_name, key, ExtraArgs=extra_args, Config=TRANSFER_CONFIG)
+                # Only the attempt that made it counts towards the throughput
+                self.stats.add(uploaded=1, bytes=body.count)
+                if self.derivatives:
+                    self._derive(key, list(imageVariants.VARIANTS), b''.join(chunks))
+                return 'uploaded'
+            except (requests.RequestException, ClientError, S3UploadFailedError) as e:
+                status = self._status(e)
+                if attempt == MAX_ATTEMPTS or (status is not None and 400 <= status < 500 and status != 429):
+                    print(f"Failed to copy {url} to {key}: {e}")
+                    self.stats.add(failed=1)
+                    return 'failed'
+                self.stats.add(retries=1)
+                time.sleep(random.uniform(0, BASE_DELAY * (2 ** attempt)))
+
+        if self.derivatives:
+            self._derive(key)
+        return 'skipped'
+
+    def ingest(self, targets):
+        self.stats.targets = len(targets)
+        results = {}
+        if self.derivatives:
+            self._pool = ProcessPoolExecutor(max_workers=self.processes)
+            if not self.force:
+                self._variant_keys = self._list_variants()
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                futures = {executor.submit(self.ingest_one, key, url): key for key, url in targets.items()}
+                for future in as_completed(futures):
+                    results[futures[future]] = future.result()
+        finally:
+            if self._pool is not None:
+                self._pool.shutdown()
+                self._pool = None
+        return results
+
+
+def ingest_images(path, bucket_name=BUCKET_NAME, create_bucket=True, **kwargs):
+    ingester = ImageIngester(bucket_name=bucket_name, **kwargs)
+    if create_bucket:
+        ingester.ensure_bucket()
+    ingester.ingest(image_targets(iter_songs(path)))
+    return ingester.stats.summary()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Copy song images into the S3 image bucket")
+    parser.add_argument('path', help="Catalog JSON or JSONL with img_url fields")
+    parser.add_argument('--bucket', default=BUCKET_NAME)
+    parser.add_argument('--region', default='us-east-1')
+    parser.add_argument('--endpoint-url', help="S3 endpoint, e.g. a local moto or MinIO server")
+    parser.add_argument('--workers', type=int, default=16)
+    parser.add_argument('--force', action='store_true', help="Upload even when the object already exists")
+    parser.add_argument('--no-derivatives', action='store_true', help="Copy originals only, without thumbnails or WebP")
+    parser.add_argument('--processes', type=int, help="Resizing processes (default: one per CPU)")
+    args = parser.parse_args()
+
+    summary = ingest_images(
+        args.path,
+        bucket_name=args.bucket,
+        region_name=args.region,
+        endpoint_url=args.endpoint_url,
+        workers=args.workers,
+        force=args.force,
+        derivatives=not args.no_derivatives,
+        processes=args.processes
+    )
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,350 @@
+import os
+import json
+import time
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+import sys
+import boto3
+
+# The DynamoDB rate limiter and the result cache's version are shared with the Lambda handlers
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Lambda Functions'))
+import rateLimiter
+import queryCache
+
+# Bulk loader for the music table. Streams a JSON ({"songs": [...]}) or JSONL
+# catalog, writes it through batch_writer from a pool of threads and keeps a
+# checkpoint so an interrupted load resumes where it stopped.
+#
+#   python loadCatalog.py 2025a1.json
+#   python loadCatalog.py songs.jsonl --workers 16 --endpoint-url http://localhost:8000
+
+SONG_FIELDS = ('title', 'year', 'artist', 'album', 'img_url')
+READ_SIZE = 1 << 16
+
+
+def _iter_json_array(file, array_key='songs'):
+    # Incremental decode of one array inside a JSON document, element by element
+    decoder = json.JSONDecoder()
+    buffer = ''
+    position = 0
+    eof = False
+
+    def fill():
+        nonlocal buffer, position, eof
+        chunk = file.read(READ_SIZE)
+        if not chunk:
+            eof = True
+        buffer = buffer[position:] + chunk
+        position = 0
+
+    def skip_whitespace():
+        nonlocal position
+        while True:
+            while position < len(buffer) and buffer[position] in ' \t\r\n,':
+                position += 1
+            if position < len(buffer) or eof:
+                return
+            fill()
+
+    # The catalog is either a bare array or a document with a "songs": [...] member
+    fill()
+    if buffer.lstrip().startswith('['):
+        position = buffer.index('[') + 1
+    else:
+        marker = f'"{array_key}"'
+        while True:
+            start = buffer.find(marker, position)
+            if start != -1:
+                bracket = buffer.find('[', start)
+                if bracket != -1:
+                    position = bracket + 1
+                    break
+                position = start
+            else:
+                # Keep a tail long enough to hold a marker split across reads
+                position = max(position, len(buffer) - len(marker))
+            if eof:
+                raise ValueError(f"No '{array_key}' array found in catalog")
+            fill()
+
+    while True:
+        skip_whitespace()
+        if position >= len(buffer):
+            raise ValueError("Catalog ended before the songs array was closed")
+        if buffer[position] == ']':
+            return
+        while True:
+            try:
+                value, end = decoder.raw_decode(buffer, position)
+                break
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                fill()
+        position = end
+        yield value
+
+
+def iter_songs(path):
+    with open(path, 'r', encoding='utf-8') as file:
+        if path.endswith(('.jsonl', '.ndjson')):
+            for line in file:
+                line = line.strip()
+                if line:
+                    yield json.loads(line)
+        else:
+            yield from _iter_json_array(file)
+
+
+def song_item(song):
+    if not isinstance(song, dict) or not song.get('title') or not song.get('year'):
+        return None
+    return {field: song[field] for field in SONG_FIELDS if song.get(field) is not None}
+
+
+class Checkpoint:
+    # Records how many leading rows are known to be written. Chunks finish out
+    # of order, so the count only advances over a contiguous run of chunks.
+
+    def __init__(self, path, source):
+        self.path = path
+        self.source = os.path.abspath(source)
+        self.completed_rows = 0
+        self._finished = {}   # chunk index -> rows, for chunks done ahead of the contiguous run
+        self._next_chunk = 0
+
+    def load(self):
+        if not self.path or not os.path.exists(self.path):
+            return 0
+        with open(self.path, 'r') as file:
+            state = json.load(file)
+        if state.get('source') != self.source:
+            raise ValueError(f"Checkpoint {self.path} belongs to {state.get('source')}")
+        self.completed_rows = state['completed_rows']
+        return self.completed_rows
+
+    def mark_done(self, chunk_index, rows):
+        self._finished[chunk_index] = rows
+        if self._next_chunk not in self._finished:
+            return
+        while self._next_chunk in self._finished:
+            self.completed_rows += self._finished.pop(self._next_chunk)
+            self._next_chunk += 1
+        self.save()
+
+    def save(self):
+        if not self.path:
+            return
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'w') as file:
+            json.dump({'source': self.source, 'completed_rows': self.completed_rows, 'updated_at': int(time.time())}, file)
+        os.replace(temp_path, self.path)
+
+    def clear(self):
+        if self.path and os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class LoadStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started = time.time()
+        self.written = 0
+        self.skipped = 0
+        self.invalid = 0
+        self.throttled = 0
+        self.unprocessed = 0
+
+    def add(self, **counts):
+        with self._lock:
+            for name, value in counts.items():
+                setattr(self, name, getattr(self, name) + value)
+
+    def rows_per_second(self):
+        elapsed = time.time() - self.started
+        return self.written / elapsed if elapsed > 0 else 0.0
+
+    def summary(self):
+        return {
+            'written': self.written,
+            'skipped': self.skipped,
+            'invalid': self.invalid,
+            'throttled': self.throttled,
+            'unprocessed_retries': self.unprocessed,
+            'elapsed_seconds': round(time.time() - self.started, 3),
+            'rows_per_second': round(self.rows_per_second(), 1)
+        }
+
+
+class CatalogLoader:
+    def __init__(self, table_name='music', region_name='us-east-1', endpoint_url=None,
+                 workers=8, chunk_size=500, checkpoint_path=None):
+        self.table_name = table_name
+        self.region_name = region_name
+        self.endpoint_url = endpoint_url
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.checkpoint_path = checkpoint_path
+        self.stats = LoadStats()
+        self.limiter = rateLimiter.AdaptiveLimiter()   # One set of buckets for all workers
+        self._local = threading.local()
+
+    def _table(self):
+        # boto3 resources are not thread safe, so every worker gets its own
+        table = getattr(self._local, 'table', None)
+        if table is None:
+            session = boto3.session.Session()
+            dynamodb = session.resource('dynamodb', region_name=self.region_name, endpoint_url=self.endpoint_url)
+            events = dynamodb.meta.client.meta.events
+            # Only counts throttles: botocore calls every needs-retry handler and uses the first delay returned
+            events.register('needs-retry.dynamodb.BatchWriteItem', self._on_needs_retry)
+            events.register('after-call.dynamodb.BatchWriteItem', self._on_after_call)
+            rateLimiter.install(dynamodb.meta.client, self.limiter)
+            table = self._local.table = dynamodb.Table(self.table_name)
+        return table
+
+    def _on_needs_retry(self, response=None, **kwargs):
+        if response is not None:
+            code = response[1].get('Error', {}).get('Code')
+            if code in rateLimiter.THROTTLE_CODES:
+                self.stats.add(throttled=1)
+
+    def _on_after_call(self, parsed=None, **kwargs):
+        unprocessed = (parsed or {}).get('UnprocessedItems') or {}
+        count = sum(len(requests) for requests in unprocessed.values())
+        if count:
+            self.stats.add(unprocessed=count, throttled=1)
+
+    def _write_chunk(self, items):
+        table = self._table()
+        with table.batch_writer(overwrite_by_pkeys=['title', 'year']) as writer:
+            for item in items:
+                writer.put_item(Item=item)
+        self.stats.add(written=len(items))
+
+    def load(self, path, resume=True, progress_interval=5.0):
+        checkpoint = Checkpoint(self.checkpoint_path, path)
+        if not resume:
+            checkpoint.clear()
+        resume_rows = checkpoint.load()
+        if resume_rows:
+            print(f"Resuming after {resume_rows} rows from {self.checkpoint_path}")
+
+        pending = {}   # future -> (chunk index, rows in chunk)
+        last_report = time.time()
+        row = 0
+        chunk = []
+        chunk_rows = 0
+        chunk_index = 0
+
+        def collect(block):
+            if block:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            else:
+                done = [future for future in pending if future.done()]
+            for future in done:
+                index, rows = pending.pop(future)
+                future.result()
+                checkpoint.mark_done(index, rows)
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            def submit():
+                nonlocal chunk, chunk_rows, chunk_index
+                # Bound the number of queued chunks so memory stays flat
+                while len(pending) >= self.workers * 2:
+                    collect(block=True)
+                pending[executor.submit(self._write_chunk, chunk)] = (chunk_index, chunk_rows)
+                chunk = []
+                chunk_rows = 0
+                chunk_index += 1
+                collect(block=False)
+
+            for song in iter_songs(path):
+                row += 1
+                if row <= resume_rows:
+                    self.stats.add(skipped=1)
+                    continue
+                chunk_rows += 1
+                item = song_item(song)
+                if item is None:
+                    self.stats.add(invalid=1)
+                else:
+                    chunk.append(item)
+                if chunk_rows == self.chunk_size:
+                    submit()
+
+                if time.time() - last_report >= progress_interval:
+                    last_report = time.time()
+                    print(f"{self.stats.written} rows written, {self.stats.rows_per_second():.0f} rows/s, "
+                          f"{self.stats.throttled} throttled")
+
+            if chunk_rows:
+                submit()
+            while pending:
+                collect(block=True)
+
+        checkpoint.clear()
+        summary = self.stats.summary()
+        summary['rate_limit'] = self.limiter.stats()
+        return summary
+
+
+def bump_cache_version(cache_table, region_name='us-east-1', endpoint_url=None):
+    # queryFunction keys cached results on this version, so bumping it drops every cached page
+    table = boto3.resource('dynamodb', region_name=region_name, endpoint_url=endpoint_url).Table(cache_table)
+    return queryCache.DynamoDBTier(table).bump()
+
+
+def load_catalog(path, **kwargs):
+    resume = kwargs.pop('resume', True)
+    cache_table = kwargs.pop('cache_table', os.environ.get('QUERY_CACHE_TABLE'))
+    snapshot = kwargs.pop('snapshot', os.environ.get('CATALOG_SNAPSHOT'))
+    if 'checkpoint_path' not in kwargs:
+        kwargs['checkpoint_path'] = path + '.checkpoint'
+    summary = CatalogLoader(**kwargs).load(path, resume=resume)
+    if cache_table and summary['written']:
+        summary['cache_version'] = bump_cache_version(
+            cache_table, kwargs.get('region_name', 'us-east-1'), kwargs.get('endpoint_url'))
+    if snapshot and summary['written']:
+        # Imported here: exportSnapshot itself reads catalog files through this module
+        from exportSnapshot import export_snapshot
+        summary['snapshot'] = export_snapshot(
+            snapshot, table_name=kwargs.get('table_name', 'music'), region_name=kwargs.get('region_name', 'us-east-1'),
+            endpoint_url=kwargs.get('endpoint_url'), catalog_version=summary.get('cache_version'))
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load a song catalog into the music table")
+    parser.add_argument('path', help="JSON file with a songs array, or JSONL with one song per line")
+    parser.add_argument('--table', default='music')
+    parser.add_argument('--region', default='us-east-1')
+    parser.add_argument('--endpoint-url', help="e.g. http://localhost:8000 for DynamoDB Local")
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--chunk-size', type=int, default=500)
+    parser.add_argument('--checkpoint', help="Checkpoint file (default: <path>.checkpoint)")
+    parser.add_argument('--restart', action='store_true', help="Ignore any existing checkpoint")
+    parser.add_argument('--cache-table', default=os.environ.get('QUERY_CACHE_TABLE'),
+                        help="Query cache table whose catalog version is bumped after the load")
+    parser.add_argument('--snapshot', default=os.environ.get('CATALOG_SNAPSHOT'),
+                        help="Republish the catalog snapshot here (s3://bucket/key or a path) after the load")
+    args = parser.parse_args()
+
+    summary = load_catalog(
+        args.path,
+        table_name=args.table,
+        region_name=args.region,
+        endpoint_url=args.endpoint_url,
+        workers=args.workers,
+        chunk_size=args.chunk_size,
+        checkpoint_path=args.checkpoint or args.path + '.checkpoint',
+        resume=not args.restart,
+        cache_table=args.cache_table,
+        snapshot=args.snapshot
+    )
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == '__main__':
+    main()
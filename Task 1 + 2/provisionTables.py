@@ -0,0 +1,432 @@
+import os
+import json
+import math
+import time
+import argparse
+from collections import Counter
+import boto3
+from botocore.exceptions import ClientError
+from loadCatalog import iter_songs
+import membershipCache   # From ../Lambda Functions, which loadCatalog puts on the path
+import popularity
+
+# Schema as code for every DynamoDB table the Lambda functions use. Running it
+# creates missing tables, adds missing GSIs, switches capacity mode and turns
+# on TTL, and is safe to repeat. It also estimates the read cost of each real
+# access pattern against the catalog, so index projections can be tuned.
+#
+#   python provisionTables.py                      # on-demand capacity
+#   python provisionTables.py --capacity autoscaled --min-capacity 5 --max-capacity 200
+#   python provisionTables.py --dry-run --report-only
+#   python provisionTables.py --backfill           # rerun index backfills
+
+# Attributes the query and subscription pages show for a song
+SONG_ATTRIBUTES = ('title', 'year', 'artist', 'album', 'img_url')
+
+
+def gsi(name, hash_key, range_key, projected=SONG_ATTRIBUTES, table_keys=('title', 'year')):
+    # INCLUDE only what the UI shows, so index items and query reads stay small
+    keys = {hash_key, range_key, *table_keys}
+    return {
+        'name': name,
+        'keys': [(hash_key, 'HASH'), (range_key, 'RANGE')],
+        'include': [attribute for attribute in projected if attribute not in keys]
+    }
+
+
+def backfill_title_sort(client, table_name):
+    # Subscriptions written before title_sort existed are missing from user-title-index until it is set
+    updated = 0
+    for page in client.get_paginator('scan').paginate(
+            TableName=table_name,
+            ProjectionExpression='user_email, #u, #t',
+            FilterExpression='attribute_not_exists(title_sort) AND attribute_exists(#t)',
+            ExpressionAttributeNames={'#u': 'uuid', '#t': 'title'}):
+        for item in page['Items']:
+            title_sort = membershipCache.title_sort_key(item['title'].get('S'))
+            if not title_sort:
+                continue
+            client.update_item(
+                TableName=table_name,
+                Key={'user_email': item['user_email'], 'uuid': item['uuid']},
+                UpdateExpression='SET title_sort = :t',
+                ConditionExpression='attribute_exists(user_email)',   # Don't resurrect a concurrent delete
+                ExpressionAttributeValues={':t': {'S': title_sort}}
+            )
+            updated += 1
+    return updated
+
+
+def seed_popularity(client, table_name, source_table='user_subscriptions'):
+    # Counts the subscriptions that predate the counters. Only safe on a new, empty table:
+    # run again it would add every subscription a second time.
+    dynamodb = boto3.resource('dynamodb', region_name=client.meta.region_name, endpoint_url=client.meta.endpoint_url)
+    names = {f'#f{i}': field for i, field in enumerate(popularity.SONG_FIELDS)}
+    counts = Counter()
+    songs = {}
+    kwargs = {'ProjectionExpression': ', '.join(names), 'ExpressionAttributeNames': names}
+    source = dynamodb.Table(source_table)
+    while True:
+        response = source.scan(**kwargs)
+        for item in response.get('Items', []):
+            if item.get('title') and item.get('year'):
+                key = (item['title'], item['year'])
+                counts[key] += 1
+                songs.setdefault(key, item)
+        if 'LastEvaluatedKey' not in response:
+            break
+        kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+    with dynamodb.Table(table_name).batch_writer() as writer:
+        for (title, year), subscribers in counts.items():
+            writer.put_item(Item={
+                **songs[(title, year)],
+                'counter_key': popularity.counter_key(title, year, 0),
+                'shard': 0,
+                'subscribers': subscribers
+            })
+    return len(counts)
+
+
+SCHEMA = {
+    'login': {
+        'keys': [('email', 'HASH')],
+        'attributes': {'email': 'S'}
+    },
+    'sessions': {
+        'keys': [('session_token', 'HASH')],
+        'attributes': {'session_token': 'S'},
+        'ttl': 'ttl'
+    },
+    'music': {
+        'keys': [('title', 'HASH'), ('year', 'RANGE')],
+        'attributes': {'title': 'S', 'year': 'S', 'artist': 'S', 'album': 'S'},
+        'indexes': [
+            gsi('artist-title-index', 'artist', 'title'),
+            gsi('album-title-index', 'album', 'title'),
+            gsi('year-title-index', 'year', 'title'),
+            gsi('title-year-index', 'title', 'year')
+        ],
+        'stream': 'NEW_AND_OLD_IMAGES'   # Keeps queryFunction's search index and result cache current
+    },
+    'user_subscriptions': {
+        'keys': [('user_email', 'HASH'), ('uuid', 'RANGE')],
+        'attributes': {'user_email': 'S', 'uuid': 'S', 'title_sort': 'S'},
+        'indexes': [
+            # Sorted, paginated listing for subscriptionFunction GET
+            dict(gsi(membershipCache.TITLE_INDEX, 'user_email', 'title_sort',
+                     ('title', 'year', 'artist', 'album', 'img_key'), table_keys=('user_email', 'uuid')),
+                 backfill=backfill_title_sort)
+        ]
+    },
+    'song_popularity': {
+        'keys': [('counter_key', 'HASH')],
+        'attributes': {'counter_key': 'S'},
+        'seed': seed_popularity     # Runs once, when the table is created
+    },
+    'query_cache': {
+        'keys': [('cache_key', 'HASH')],
+        'attributes': {'cache_key': 'S'},
+        'ttl': 'expires'
+    }
+}
+
+READ_UNIT = 4096
+WRITE_UNIT = 1024
+INDEX_ITEM_OVERHEAD = 100     # Bytes DynamoDB adds to every index item
+TARGET_UTILIZATION = 70.0
+
+
+def _key_schema(keys):
+    return [{'AttributeName': name, 'KeyType': key_type} for name, key_type in keys]
+
+
+def _projection(index):
+    return {'ProjectionType': 'INCLUDE', 'NonKeyAttributes': index['include']} if index['include'] else {'ProjectionType': 'KEYS_ONLY'}
+
+
+class Provisioner:
+    def __init__(self, region_name='us-east-1', endpoint_url=None, capacity='on-demand',
+                 min_capacity=5, max_capacity=100, dry_run=False, schema=SCHEMA):
+        self.client = boto3.client('dynamodb', region_name=region_name, endpoint_url=endpoint_url)
+        self.region_name = region_name
+        self.capacity = capacity
+        self.min_capacity = min_capacity
+        self.max_capacity = max_capacity
+        self.dry_run = dry_run
+        self.schema = schema
+        self.actions = []
+
+    def _act(self, description, call=None, **kwargs):
+        self.actions.append(description)
+        print(('[dry run] ' if self.dry_run else '') + description)
+        if not self.dry_run and call is not None:
+            return call(**kwargs)
+
+    def _throughput(self):
+        return {'ReadCapacityUnits': self.min_capacity, 'WriteCapacityUnits': self.min_capacity}
+
+    def _index_definition(self, index):
+        definition = {'IndexName': index['name'], 'KeySchema': _key_schema(index['keys']), 'Projection': _projection(index)}
+        if self.capacity != 'on-demand':
+            definition['ProvisionedThroughput'] = self._throughput()
+        return definition
+
+    def _attribute_definitions(self, spec):
+        return [{'AttributeName': name, 'AttributeType': kind} for name, kind in spec['attributes'].items()]
+
+    def describe(self, table_name):
+        try:
+            return self.client.describe_table(TableName=table_name)['Table']
+        except ClientError as e:
+            if e.response['Error']['Code'] == 'ResourceNotFoundException':
+                return None
+            raise
+
+    def wait_active(self, table_name, index_name=None):
+        # Table and index creation are asynchronous; later updates fail until they are ACTIVE
+        while not self.dry_run:
+            table = self.describe(table_name)
+            if index_name is None:
+                if table['TableStatus'] == 'ACTIVE':
+                    return
+            else:
+                statuses = {i['IndexName']: i['IndexStatus'] for i in table.get('GlobalSecondaryIndexes', [])}
+                if statuses.get(index_name) == 'ACTIVE' and table['TableStatus'] == 'ACTIVE':
+                    return
+            time.sleep(5)
+
+    def create(self, table_name, spec):
+        kwargs = {
+            'TableName': table_name,
+            'KeySchema': _key_schema(spec['keys']),
+            'AttributeDefinitions': self._attribute_definitions(spec)
+        }
+        if spec.get('indexes'):
+            kwargs['GlobalSecondaryIndexes'] = [self._index_definition(index) for index in spec['indexes']]
+        if self.capacity == 'on-demand':
+            kwargs['BillingMode'] = 'PAY_PER_REQUEST'
+        else:
+            kwargs['BillingMode'] = 'PROVISIONED'
+            kwargs['ProvisionedThroughput'] = self._throughput()
+        if spec.get('stream'):
+            kwargs['StreamSpecification'] = {'StreamEnabled': True, 'StreamViewType': spec['stream']}
+        self._act(f"create table {table_name}", self.client.create_table, **kwargs)
+        self.wait_active(table_name)
+        if spec.get('seed'):
+            count = self._act(f"seed {table_name}", spec['seed'], client=self.client, table_name=table_name)
+            if count is not None:
+                print(f"seeded {count} items in {table_name}")
+
+    def migrate(self, table_name, spec, table):
+        billing = table.get('BillingModeSummary', {}).get('BillingMode', 'PROVISIONED')
+        wanted = 'PAY_PER_REQUEST' if self.capacity == 'on-demand' else 'PROVISIONED'
+        if billing != wanted:
+            kwargs = {'TableName': table_name, 'BillingMode': wanted}
+            if wanted == 'PROVISIONED':
+                kwargs['ProvisionedThroughput'] = self._throughput()
+                kwargs['GlobalSecondaryIndexUpdates'] = [
+                    {'Update': {'IndexName': i['IndexName'], 'ProvisionedThroughput': self._throughput()}}
+                    for i in table.get('GlobalSecondaryIndexes', [])
+                ]
+            self._act(f"switch {table_name} to {wanted}", self.client.update_table, **kwargs)
+            self.wait_active(table_name)
+
+        existing = {i['IndexName']: i for i in table.get('GlobalSecondaryIndexes', [])}
+        for index in spec.get('indexes', []):
+            current = existing.pop(index['name'], None)
+            if current is None:
+                # One index per UpdateTable call; DynamoDB backfills it from the table
+                self._act(
+                    f"add index {index['name']} to {table_name}", self.client.update_table,
+                    TableName=table_name,
+                    AttributeDefinitions=self._attribute_definitions(spec),
+                    GlobalSecondaryIndexUpdates=[{'Create': self._index_definition(index)}]
+                )
+                self.wait_active(table_name, index['name'])
+                if index.get('backfill'):
+                    self.backfill(table_name, index)
+            elif current['Projection'].get('ProjectionType') != _projection(index)['ProjectionType'] or \
+                    set(current['Projection'].get('NonKeyAttributes', [])) != set(index['include']):
+                # Projections can't be changed in place and dropping a live index breaks queries
+                print(f"warning: {table_name}.{index['name']} projection differs from the schema; "
+                      f"recreate it to apply {_projection(index)}")
+        for name in existing:
+            print(f"warning: {table_name}.{name} is not in the schema and was left in place")
+
+        stream = table.get('StreamSpecification', {})
+        if spec.get('stream') and not stream.get('StreamEnabled'):
+            self._act(f"enable stream on {table_name}", self.client.update_table, TableName=table_name,
+                      StreamSpecification={'StreamEnabled': True, 'StreamViewType': spec['stream']})
+            self.wait_active(table_name)
+
+    def backfill(self, table_name, index):
+        # Sets the new index's sort key on items written before it existed
+        count = self._act(f"backfill {table_name} for {index['name']}", index['backfill'], client=self.client,
+                          table_name=table_name)
+        if count is not None:
+            print(f"backfilled {count} items in {table_name}")
+
+    def ensure_ttl(self, table_name, attribute):
+        if self.describe(table_name) is not None:
+            status = self.client.describe_time_to_live(TableName=table_name)['TimeToLiveDescription']
+            if status.get('TimeToLiveStatus') in ('ENABLED', 'ENABLING') and status.get('AttributeName') == attribute:
+                return
+        self._act(f"enable TTL on {table_name}.{attribute}", self.client.update_time_to_live, TableName=table_name,
+                  TimeToLiveSpecification={'Enabled': True, 'AttributeName': attribute})
+
+    def ensure_autoscaling(self, table_name, spec):
+        scaling = boto3.client('application-autoscaling', region_name=self.region_name)
+        resources = [f'table/{table_name}'] + [f"table/{table_name}/index/{index['name']}" for index in spec.get('indexes', [])]
+        for resource_id in resources:
+            dimension_prefix = 'dynamodb:index' if '/index/' in resource_id else 'dynamodb:table'
+            for kind, metric in (('Read', 'DynamoDBReadCapacityUtilization'), ('Write', 'DynamoDBWriteCapacityUtilization')):
+                dimension = f'{dimension_prefix}:{kind}CapacityUnits'
+                self._act(f"autoscale {resource_id} {kind.lower()}s {self.min_capacity}-{self.max_capacity}",
+                          scaling.register_scalable_target, ServiceNamespace='dynamodb', ResourceId=resource_id,
+                          ScalableDimension=dimension, MinCapacity=self.min_capacity, MaxCapacity=self.max_capacity)
+                self._act(f"target {TARGET_UTILIZATION:.0f}% {kind.lower()} utilization on {resource_id}",
+                          scaling.put_scaling_policy, ServiceNamespace='dynamodb', ResourceId=resource_id,
+                          ScalableDimension=dimension, PolicyName=f'{resource_id.replace("/", "-")}-{kind.lower()}',
+                          PolicyType='TargetTrackingScaling',
+                          TargetTrackingScalingPolicyConfiguration={
+                              'TargetValue': TARGET_UTILIZATION,
+                              'PredefinedMetricSpecification': {'PredefinedMetricType': metric}
+                          })
+
+    def provision(self):
+        for table_name, spec in self.schema.items():
+            table = self.describe(table_name)
+            if table is None:
+                self.create(table_name, spec)
+            else:
+                self.migrate(table_name, spec, table)
+            if spec.get('ttl'):
+                self.ensure_ttl(table_name, spec['ttl'])
+            if self.capacity == 'autoscaled':
+                self.ensure_autoscaling(table_name, spec)
+        return self.actions
+
+    def backfill_all(self):
+        for table_name, spec in self.schema.items():
+            for index in spec.get('indexes', []):
+                if index.get('backfill'):
+                    self.backfill(table_name, index)
+        return self.actions
+
+
+def item_size(item, attributes=None):
+    # DynamoDB item size: attribute name plus UTF-8 value length for string attributes
+    return sum(len(name.encode('utf-8')) + len(str(value).encode('utf-8'))
+               for name, value in item.items() if attributes is None or name in attributes)
+
+
+def read_units(rows, bytes_per_row, consistent=False):
+    # Query and Scan round the whole response up to 4 KB units; eventually consistent reads cost half
+    units = max(1, math.ceil(rows * bytes_per_row / READ_UNIT))
+    return units if consistent else units / 2
+
+
+def estimate_report(catalog_path, subscriptions_per_user=20, schema=SCHEMA):
+    songs = [song for song in iter_songs(catalog_path) if song.get('title') and song.get('year')]
+    if not songs:
+        return []
+    table_bytes = sum(item_size(song) for song in songs) / len(songs)
+
+    def index_bytes(index):
+        projected = {name for name, _ in index['keys']} | {'title', 'year'} | set(index['include'])
+        return sum(item_size(song, projected) for song in songs) / len(songs) + INDEX_ITEM_OVERHEAD
+
+    def rows_per_value(field):
+        counts = sorted(Counter(song.get(field) for song in songs).values())
+        return sum(counts) / len(counts), counts[min(len(counts) - 1, int(len(counts) * 0.95))]
+
+    report = [
+        {'pattern': 'login get_item', 'target': 'login', 'rows': 1, 'rcu': read_units(1, 200, consistent=True)},
+        {'pattern': 'session get_item (consistent)', 'target': 'sessions', 'rows': 1, 'rcu': read_units(1, 150, consistent=True)}
+    ]
+    for index in schema['music']['indexes']:
+        field = index['keys'][0][0]
+        average, p95 = rows_per_value(field)
+        size = index_bytes(index)
+        report.append({
+            'pattern': f'query by {field}', 'target': f"music.{index['name']}",
+            'rows': round(average, 1), 'rows_p95': p95, 'item_bytes': round(size),
+            'rcu': read_units(average, size), 'rcu_p95': read_units(p95, size)
+        })
+    report.append({'pattern': 'scan with filter', 'target': 'music', 'rows': len(songs),
+                   'item_bytes': round(table_bytes), 'rcu': read_units(len(songs), table_bytes)})
+    subscription_bytes = table_bytes + len('user_email') + 30 + len('uuid') + 36
+    report.append({'pattern': 'list subscriptions', 'target': f'user_subscriptions.{membershipCache.TITLE_INDEX}',
+                   'rows': subscriptions_per_user, 'item_bytes': round(subscription_bytes),
+                   'rcu': read_units(subscriptions_per_user, subscription_bytes)})
+    report.append({'pattern': 'subscriptions unchanged (304)', 'target': 'user_subscriptions', 'rows': 1,
+                   'rcu': read_units(1, 60, consistent=True)})
+    report.append({'pattern': 'trending list (get_item)', 'target': 'song_popularity', 'rows': 1,
+                   'rcu': read_units(1, 50 * 150)})
+    report.append({'pattern': 'subscribe (put_item)', 'target': 'user_subscriptions', 'rows': 1,
+                   'wcu': math.ceil(subscription_bytes / WRITE_UNIT)})
+    return report
+
+
+def print_report(report):
+    print(f"{'pattern':<32} {'target':<32} {'rows':>8} {'p95':>6} {'bytes':>6} {'RCU':>7} {'RCU p95':>8}")
+    for row in report:
+        rcu = row.get('rcu', '')
+        if 'wcu' in row:
+            rcu = f"{row['wcu']} WCU"
+        print(f"{row['pattern']:<32} {row['target']:<32} {row['rows']:>8} {row.get('rows_p95', ''):>6} "
+              f"{row.get('item_bytes', ''):>6} {rcu:>7} {row.get('rcu_p95', ''):>8}")
+
+
+def provision_tables(catalog_path=None, report=True, **kwargs):
+    actions = Provisioner(**kwargs).provision()
+    rows = estimate_report(catalog_path) if report and catalog_path else []
+    if rows:
+        print_report(rows)
+    return {'actions': actions, 'report': rows}
+
+
+def main():
+    default_catalog = os.path.join(os.path.dirname(os.path.abspath(__file__)), '2025a1.json')
+    parser = argparse.ArgumentParser(description="Create or migrate the DynamoDB tables and report read costs")
+    parser.add_argument('--region', default='us-east-1')
+    parser.add_argument('--endpoint-url', help="e.g. http://localhost:8000 for DynamoDB Local")
+    parser.add_argument('--capacity', choices=('on-demand', 'autoscaled'), default='on-demand')
+    parser.add_argument('--min-capacity', type=int, default=5)
+    parser.add_argument('--max-capacity', type=int, default=100)
+    parser.add_argument('--catalog', default=default_catalog, help="Catalog used for the RCU estimates")
+    parser.add_argument('--dry-run', action='store_true', help="Print the changes without making them")
+    parser.add_argument('--report-only', action='store_true', help="Only print the RCU estimates")
+    parser.add_argument('--json', action='store_true', help="Print the report as JSON")
+    parser.add_argument('--backfill', action='store_true', help="Rerun the index backfills, e.g. after a partial migration")
+    args = parser.parse_args()
+
+    if args.report_only:
+        rows = estimate_report(args.catalog)
+        if args.json:
+            print(json.dumps(rows, indent=2))
+        else:
+            print_report(rows)
+        return
+
+    result = provision_tables(
+        args.catalog,
+        report=not args.json,
+        region_name=args.region,
+        endpoint_url=args.endpoint_url,
+        capacity=args.capacity,
+        min_capacity=args.min_capacity,
+        max_capacity=args.max_capacity,
+        dry_run=args.dry_run
+    )
+    if args.backfill:
+        result['actions'] += Provisioner(region_name=args.region, endpoint_url=args.endpoint_url,
+                                        dry_run=args.dry_run).backfill_all()
+    if args.json:
+        result['report'] = estimate_report(args.catalog)
+        print(json.dumps(result, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,199 @@
+import os
+import sys
+import json
+import time
+import argparse
+import multiprocessing
+
+# Drives every lambda_handler with synthetic API Gateway events against local
+# stand-ins and reports p50/p95/p99 latency and consumed capacity per endpoint,
+# for catalogs from the 137 songs in 2025a1.json up to 1M generated songs.
+#
+#   python benchmarks/benchHandlers.py --sizes 137,10000,100000 --requests 200
+#   python benchmarks/benchHandlers.py --no-mock      # against DynamoDB Local, e.g. with
+#                                                     # AWS_ENDPOINT_URL_DYNAMODB=http://localhost:8000
+#
+# The default stand-in is moto (pip install moto). Each catalog size runs in a
+# fresh process so every run starts from a cold container.
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LAMBDA_DIR = os.path.join(ROOT, 'Lambda Functions')
+TASK_DIR = os.path.join(ROOT, 'Task 1 + 2')
+CATALOG_PATH = os.path.join(TASK_DIR, '2025a1.json')
+
+USERS = 10
+SUBSCRIPTIONS_PER_USER = 25
+PASSWORD = 'benchmark'
+
+
+def synthetic_catalog(size):
+    # Repeats the real catalog with numbered titles so artists, years and images keep their real skew
+    with open(CATALOG_PATH, 'r') as file:
+        base = json.load(file)['songs']
+    for i in range(size):
+        song = dict(base[i % len(base)])
+        if i >= len(base):
+            song['title'] = f"{song['title']} ({i // len(base)})"
+        yield song
+
+
+def create_tables():
+    # Same schema, projections and capacity mode as production
+    sys.path.insert(0, TASK_DIR)
+    from provisionTables import Provisioner
+    Provisioner(region_name='us-east-1').provision()
+
+
+def seed(dynamodb, size):
+    songs = []
+    with dynamodb.Table('music').batch_writer() as writer:
+        for song in synthetic_catalog(size):
+            writer.put_item(Item=song)
+            if len(songs) < SUBSCRIPTIONS_PER_USER:
+                songs.append(song)
+
+    expires = int(time.time()) + 86400
+    with dynamodb.Table('login').batch_writer() as writer:
+        for n in range(USERS):
+            writer.put_item(Item={'email': f'user{n}@bench.local', 'user_name': f'User{n}', 'password': PASSWORD})
+    with dynamodb.Table('sessions').batch_writer() as writer:
+        for n in range(USERS):
+            writer.put_item(Item={'session_token': f'bench-token-{n}', 'email': f'user{n}@bench.local', 'ttl': expires})
+    with dynamodb.Table('user_subscriptions').batch_writer() as writer:
+        for n in range(USERS):
+            for i, song in enumerate(songs):
+                writer.put_item(Item={
+                    'user_email': f'user{n}@bench.local', 'uuid': f'bench-{n}-{i}',
+                    'title': song['title'], 'year': song['year'], 'artist': song['artist'], 'album': song['album'],
+                    'img_key': 'images/' + song['img_url'].split('/')[-1],
+                    'title_sort': song['title'].casefold()   # Sort key of user-title-index
+                })
+    return songs
+
+
+def api_event(method, body=None, token=None, query=None):
+    headers = {'Content-Type': 'application/json', 'X-Debug-Metrics': '1'}
+    if token:
+        headers['X-Session-Token'] = token
+    return {
+        'httpMethod': method,
+        'headers': headers,
+        'queryStringParameters': query,
+        'body': json.dumps(body) if body is not None else None
+    }
+
+
+def scenarios(songs):
+    song = songs[0]
+    token = lambda n: f'bench-token-{n % USERS}'
+    return [
+        ('login', 'loginFunction', lambda n: api_event('POST', {'email': f'user{n % USERS}@bench.local', 'password': PASSWORD})),
+        ('mainPage', 'mainPage', lambda n: api_event('GET', token=token(n))),
+        ('query artist', 'queryFunction', lambda n: api_event('POST', {'artist': song['artist']}, token(n))),
+        ('query year', 'queryFunction', lambda n: api_event('POST', {'year': song['year']}, token(n))),
+        ('query year page', 'queryFunction', lambda n: api_event('POST', {'year': song['year'], 'page_size': 20}, token(n))),
+        ('query combined', 'queryFunction', lambda n: api_event('POST', {'artist': song['artist'][:6], 'year': song['year']}, token(n))),
+        ('subscriptions list', 'subscriptionFunction', lambda n: api_event('GET', token=token(n))),
+        ('subscribe', 'subscriptionFunction', lambda n: api_event('POST', {'title': song['title'], 'year': song['year']}, token(n))),
+    ]
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, int(round(fraction * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[rank]
+
+
+def run_scenario(handler, make_event, requests, warmup):
+    for n in range(warmup):
+        handler(make_event(n), None)
+
+    latencies = []
+    rcu = wcu = 0.0
+    errors = 0
+    for n in range(requests):
+        event = make_event(n)
+        started = time.perf_counter()
+        response = handler(event, None)
+        latencies.append((time.perf_counter() - started) * 1000)
+        if response.get('statusCode', 500) >= 500:
+            errors += 1
+        capacity = json.loads(response.get('headers', {}).get('X-Debug-Capacity', '{}'))
+        rcu += sum(units['rcu'] for units in capacity.values())
+        wcu += sum(units['wcu'] for units in capacity.values())
+
+    latencies.sort()
+    return {
+        'p50_ms': round(percentile(latencies, 0.50), 3),
+        'p95_ms': round(percentile(latencies, 0.95), 3),
+        'p99_ms': round(percentile(latencies, 0.99), 3),
+        'rcu_per_request': round(rcu / requests, 3),
+        'wcu_per_request': round(wcu / requests, 3),
+        'errors': errors
+    }
+
+
+def bench_size(size, requests, warmup, use_mock):
+    # Runs in its own process: set up the stand-in, seed it, then import the handlers cold
+    os.environ.setdefault('AWS_ACCESS_KEY_ID', 'bench')
+    os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'bench')
+    os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+    os.environ['DEBUG_METRICS'] = 'header'
+    os.environ['LOG_LEVEL'] = 'WARNING'
+
+    mock = None
+    if use_mock:
+        from moto import mock_aws
+        mock = mock_aws()
+        mock.start()
+
+    import boto3
+    dynamodb = boto3.resource('dynamodb', region_name='us-east-1')
+    create_tables()
+    started = time.perf_counter()
+    songs = seed(dynamodb, size)
+    seed_seconds = time.perf_counter() - started
+
+    sys.path.insert(0, LAMBDA_DIR)
+    import importlib
+    results = []
+    for name, module_name, make_event in scenarios(songs):
+        module = importlib.import_module(module_name)
+        stats = run_scenario(module.lambda_handler, make_event, requests, warmup)
+        results.append({'size': size, 'endpoint': name, **stats})
+
+    if mock is not None:
+        mock.stop()
+    return {'size': size, 'seed_seconds': round(seed_seconds, 2), 'results': results}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the Lambda handlers against local stand-ins")
+    parser.add_argument('--sizes', default='137,10000', help="Comma separated catalog sizes, up to 1000000")
+    parser.add_argument('--requests', type=int, default=100, help="Measured requests per endpoint")
+    parser.add_argument('--warmup', type=int, default=5)
+    parser.add_argument('--no-mock', action='store_true', help="Use the endpoint from the environment instead of moto")
+    parser.add_argument('--json', help="Also write the results to this file")
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(',')]
+    context = multiprocessing.get_context('spawn')
+    runs = []
+    for size in sizes:
+        with context.Pool(1) as pool:
+            runs.append(pool.apply(bench_size, (size, args.requests, args.warmup, not args.no_mock)))
+
+    print(f"{'size':>8}  {'endpoint':<20} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'RCU/req':>8} {'WCU/req':>8} {'errors':>6}")
+    for run in runs:
+        for row in run['results']:
+            print(f"{row['size']:>8}  {row['endpoint']:<20} {row['p50_ms']:>8} {row['p95_ms']:>8} {row['p99_ms']:>8} "
+                  f"{row['rcu_per_request']:>8} {row['wcu_per_request']:>8} {row['errors']:>6}")
+
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump(runs, file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+import json
+import time
+import argparse
+import threading
+import http.client
+from collections import Counter
+from urllib.parse import urlsplit
+from benchHandlers import USERS, PASSWORD, synthetic_catalog, percentile
+
+# Sustained load against localServer (or any deployment of the handlers): each
+# thread holds one keep-alive connection and repeats the user flow
+# login -> mainPage -> query -> subscribe as fast as the server answers, then
+# requests per second and p50/p95/p99 latency per step are reported.
+#
+#   python benchmarks/localServer.py --seed 10000 &
+#   python benchmarks/loadTest.py --threads 16 --duration 30
+#   python benchmarks/loadTest.py --unsubscribe    # remove each subscription again, so the tables stay the same size
+
+STEPS = ('login', 'mainPage', 'query', 'subscribe', 'unsubscribe')
+
+
+class Session:
+    def __init__(self, url, prefix):
+        parts = urlsplit(url)
+        self.connection = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=30)
+        self.prefix = prefix
+        self.records = []    # (step, status, milliseconds)
+
+    def request(self, step, method, function, body=None, token=None):
+        headers = {'Content-Type': 'application/json', 'Accept': 'application/json'}
+        if token:
+            headers['X-Session-Token'] = token
+        started = time.perf_counter()
+        try:
+            self.connection.request(method, f'{self.prefix}/{function}',
+                                    body=json.dumps(body) if body is not None else None, headers=headers)
+            response = self.connection.getresponse()
+            data = response.read()
+            status = response.status
+        except (OSError, http.client.HTTPException):
+            # Reconnects on the next request
+            self.connection.close()
+            data, status = b'', 0
+        self.records.append((step, status, (time.perf_counter() - started) * 1000))
+        try:
+            return status, json.loads(data) if data else {}
+        except ValueError:
+            return status, {}
+
+    def flow(self, n, song, unsubscribe):
+        email = f'user{n % USERS}@bench.local'
+        status, payload = self.request('login', 'POST', 'loginFunction', {'email': email, 'password': PASSWORD})
+        token = payload.get('session_token')
+        if status != 200 or not token:
+            return
+        self.request('mainPage', 'GET', 'mainPage', token=token)
+        self.request('query', 'POST', 'queryFunction', {'artist': song['artist']}, token)
+        status, payload = self.request('subscribe', 'POST', 'subscriptionFunction',
+                                       {'title': song['title'], 'year': song['year']}, token)
+        if unsubscribe and status == 200 and payload.get('uuid'):
+            self.request('unsubscribe', 'DELETE', 'subscriptionFunction', {'uuid': payload['uuid']}, token)
+
+
+def run(url, threads, duration, songs, unsubscribe=False, prefix=''):
+    deadline = time.perf_counter() + duration
+    sessions = [Session(url, prefix) for _ in range(threads)]
+
+    def worker(number, session):
+        n = number
+        while time.perf_counter() < deadline:
+            session.flow(n, songs[n % len(songs)], unsubscribe)
+            n += threads
+
+    workers = [threading.Thread(target=worker, args=(i, session)) for i, session in enumerate(sessions)]
+    started = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    records = [record for session in sessions for record in session.records]
+    summary = {'threads': threads, 'seconds': round(elapsed, 2), 'requests': len(records),
+               'requests_per_second': round(len(records) / elapsed, 1), 'steps': []}
+    for step in STEPS:
+        latencies = sorted(ms for name, _, ms in records if name == step)
+        if not latencies:
+            continue
+        summary['steps'].append({
+            'step': step,
+            'requests': len(latencies),
+            'per_second': round(len(latencies) / elapsed, 1),
+            'p50_ms': round(percentile(latencies, 0.50), 3),
+            'p95_ms': round(percentile(latencies, 0.95), 3),
+            'p99_ms': round(percentile(latencies, 0.99), 3),
+            'statuses': dict(Counter(status for name, status, _ in records if name == step))
+        })
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Drive the login -> mainPage -> query -> subscribe flow under load")
+    parser.add_argument('--url', default='http://localhost:8080')
+    parser.add_argument('--prefix', default='', help="Path before the function name, e.g. /test on API Gateway")
+    parser.add_argument('--threads', type=int, default=16, help="Concurrent keep-alive connections")
+    parser.add_argument('--duration', type=float, default=10, help="Seconds to run")
+    parser.add_argument('--songs', type=int, default=137, help="Subscribe to the first SONGS songs of the seeded catalog")
+    parser.add_argument('--unsubscribe', action='store_true', help="Delete every subscription the flow creates")
+    parser.add_argument('--json', help="Also write the summary to this file")
+    args = parser.parse_args()
+
+    songs = list(synthetic_catalog(args.songs))
+    summary = run(args.url, args.threads, args.duration, songs, args.unsubscribe, args.prefix.rstrip('/'))
+
+    print(f"{summary['requests']} requests in {summary['seconds']}s over {args.threads} connections: "
+          f"{summary['requests_per_second']} req/s")
+    print(f"{'step':<12} {'requests':>9} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}  statuses")
+    for row in summary['steps']:
+        print(f"{row['step']:<12} {row['requests']:>9} {row['per_second']:>8} {row['p50_ms']:>8} "
+              f"{row['p95_ms']:>8} {row['p99_ms']:>8}  {row['statuses']}")
+
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump(summary, file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,217 @@
+import os
+import sys
+import time
+import base64
+import pstats
+import signal
+import argparse
+import cProfile
+import importlib
+import itertools
+import mimetypes
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qsl, unquote
+
+# Runs the Lambda handlers behind a local multi-threaded HTTP/1.1 server with
+# keep-alive, on the in-memory or SQLite storage backend (see
+# storageBackend), for sustained load tests and profiling of the handler code
+# without API Gateway, DynamoDB or S3. A request for /<function> or
+# /<stage>/<function> becomes an API Gateway proxy event for that handler, so
+# the frontend can point at it unchanged. Presigned image URLs point back at
+# this server and are served from --images when their signature checks out.
+#
+#   python benchmarks/localServer.py --seed 10000                   # in-memory, benchmark users and catalog
+#   python benchmarks/localServer.py --backend sqlite --path /tmp/music.db --seed 137
+#   python benchmarks/localServer.py --profile handlers.prof        # cProfile every invocation
+#   python benchmarks/loadTest.py --url http://localhost:8080 --threads 16 --duration 30
+#
+# Connections are served in parallel, but one handler invocation runs at a
+# time: like a Lambda container, every handler module keeps per-request state
+# (its request log, caches) that was never meant to be shared between
+# concurrent requests.
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LAMBDA_DIR = os.path.join(ROOT, 'Lambda Functions')
+
+# Short route name -> handler module; either one works as the last path segment
+FUNCTIONS = {
+    'login': 'loginFunction',
+    'register': 'registerFunction',
+    'mainPage': 'mainPage',
+    'query': 'queryFunction',
+    'subscription': 'subscriptionFunction',
+    'autocomplete': 'autocompleteFunction',
+    'trending': 'trendingFunction',
+}
+IMAGE_PREFIX = '/images/'
+
+
+class LocalApi:
+    def __init__(self, image_dir=None, profile_path=None):
+        self.handlers = {}
+        for route, module_name in FUNCTIONS.items():
+            handler = importlib.import_module(module_name).lambda_handler
+            self.handlers[route] = self.handlers[module_name] = handler
+        import storageBackend   # Only importable once configure() has put the handlers on the path
+        self.presigner = storageBackend.presigner()
+        self.image_dir = os.path.realpath(image_dir) if image_dir else None
+        self.profile_path = profile_path
+        self.profiler = cProfile.Profile() if profile_path else None
+        self._invocation = threading.Lock()
+        self._request_ids = itertools.count(1)
+        self.invocations = 0
+
+    def event(self, method, path, query, headers, body):
+        try:
+            text, encoded = (body.decode('utf-8'), False) if body else (None, False)
+        except UnicodeDecodeError:
+            text, encoded = base64.b64encode(body).decode('ascii'), True
+        return {
+            'httpMethod': method,
+            'path': path,
+            'headers': headers,
+            'queryStringParameters': dict(parse_qsl(query)) or None,
+            'body': text,
+            'isBase64Encoded': encoded,
+            'requestContext': {
+                'stage': 'local',
+                'requestId': str(next(self._request_ids)),
+                'requestTimeEpoch': int(time.time() * 1000)
+            }
+        }
+
+    def invoke(self, route, event):
+        handler = self.handlers[route]
+        with self._invocation:
+            self.invocations += 1
+            if self.profiler is not None:
+                self.profiler.enable()
+            try:
+                return handler(event, None)
+            finally:
+                if self.profiler is not None:
+                    self.profiler.disable()
+
+    def image(self, path, query):
+        # (status, content type, body) for a presigned image URL
+        bucket, _, key = unquote(path[len(IMAGE_PREFIX):]).partition('/')
+        params = dict(parse_qsl(query))
+        if not self.presigner.verify(bucket, key, params.get('Expires'), params.get('Signature')):
+            return 403, 'text/plain', b'Request has expired or the signature does not match'
+        if self.image_dir is None:
+            return 404, 'text/plain', b'No --images directory to serve from'
+        file_path = os.path.realpath(os.path.join(self.image_dir, key))
+        if not file_path.startswith(self.image_dir + os.sep) or not os.path.isfile(file_path):
+            return 404, 'text/plain', b'No such image'
+        with open(file_path, 'rb') as file:
+            return 200, mimetypes.guess_type(file_path)[0] or 'application/octet-stream', file.read()
+
+    def report(self, limit=30):
+        if self.profiler is None:
+            return
+        self.profiler.dump_stats(self.profile_path)
+        print(f"Profile of {self.invocations} invocations written to {self.profile_path}")
+        pstats.Stats(self.profile_path).sort_stats('cumulative').print_stats(limit)
+
+
+def request_handler(api, verbose=False):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'    # Keep-alive unless the client asks to close
+        disable_nagle_algorithm = True   # Headers and body go out as separate writes
+
+        def _send(self, status, headers, body):
+            self.send_response(status)
+            for name, value in headers.items():
+                self.send_header(name, str(value))
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            if self.command != 'HEAD':
+                self.wfile.write(body)
+
+        def _dispatch(self):
+            parts = urlsplit(self.path)
+            length = int(self.headers.get('Content-Length') or 0)
+            body = self.rfile.read(length) if length else b''
+            if parts.path.startswith(IMAGE_PREFIX) and self.command in ('GET', 'HEAD'):
+                status, content_type, data = api.image(parts.path, parts.query)
+                self._send(status, {'Content-Type': content_type}, data)
+                return
+            route = parts.path.rstrip('/').rsplit('/', 1)[-1]
+            if route not in api.handlers:
+                self._send(404, {'Content-Type': 'application/json'}, b'{"error": "No such function."}')
+                return
+            event = api.event(self.command, parts.path, parts.query, dict(self.headers.items()), body)
+            response = api.invoke(route, event)
+            data = response.get('body') or ''
+            data = base64.b64decode(data) if response.get('isBase64Encoded') else data.encode('utf-8')
+            self._send(response.get('statusCode', 200), response.get('headers') or {}, data)
+
+        do_GET = do_POST = do_PUT = do_PATCH = do_DELETE = do_OPTIONS = do_HEAD = _dispatch
+
+        def log_message(self, format, *args):
+            if verbose:
+                super().log_message(format, *args)
+
+    return Handler
+
+
+class Server(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024   # Load tests open many connections at once
+
+
+def configure(args):
+    # Must run before any handler module is imported: lambdaRuntime picks the backend at import
+    os.environ['STORAGE_BACKEND'] = args.backend
+    if args.path:
+        os.environ['STORAGE_PATH'] = args.path
+    os.environ['STORAGE_IMAGE_URL'] = f'http://{args.host}:{args.port}{IMAGE_PREFIX.rstrip("/")}'
+    os.environ.setdefault('LOG_LEVEL', args.log_level)
+    os.environ.setdefault('DEBUG_METRICS', 'header')   # X-Debug-Metrics works against the local server
+    os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+    sys.path.insert(0, LAMBDA_DIR)
+
+
+def seed(size):
+    # The benchmark's users, sessions and subscriptions over a synthetic catalog of size songs
+    import storageBackend
+    from benchHandlers import seed as seed_tables
+    started = time.perf_counter()
+    songs = seed_tables(storageBackend.resource(), size)
+    print(f"Seeded {size} songs in {time.perf_counter() - started:.1f}s; "
+          f"log in as user0@bench.local .. with password 'benchmark'")
+    return songs
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the Lambda handlers locally on in-memory or SQLite storage")
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--backend', choices=('memory', 'sqlite'), default='memory')
+    parser.add_argument('--path', help="SQLite database file (default STORAGE_PATH or /tmp/music-storage.db)")
+    parser.add_argument('--seed', type=int, metavar='SONGS', help="Load a synthetic catalog and the benchmark users first")
+    parser.add_argument('--images', help="Directory to serve signed image keys from, e.g. a copy of the bucket")
+    parser.add_argument('--profile', metavar='FILE', help="Profile every handler invocation and write pstats here on exit")
+    parser.add_argument('--log-level', default='WARNING', help="Handler LOG_LEVEL unless set in the environment")
+    parser.add_argument('--verbose', action='store_true', help="Log every HTTP request")
+    args = parser.parse_args()
+
+    configure(args)
+    if args.seed:
+        seed(args.seed)
+    api = LocalApi(image_dir=args.images, profile_path=args.profile)
+    server = Server((args.host, args.port), request_handler(api, args.verbose))
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))   # Still write the profile when stopped by kill
+    print(f"Serving {', '.join(FUNCTIONS)} on http://{args.host}:{args.port} ({args.backend} storage)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        api.report()
+
+
+if __name__ == '__main__':
+    main()
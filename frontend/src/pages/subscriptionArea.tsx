@@ -29,33 +29,40 @@ const SubscriptionArea: React.FC<Props> = ({ userName, onLogout, subscriptionUpd
         }
 
         try {
-            const response = await axios.get(
-                `https://eqbqzqdxh1.execute-api.us-east-1.amazonaws.com/test/subscriptionFunction`, 
-                { 
-                    headers: { 
-                        'Content-Type': 'application/json',
-                        'Accept': 'application/json',
-                        'X-Session-Token': storedSessionToken  
+            // The listing is paginated; unchanged pages come back from the browser cache via ETag
+            const allSubscriptions: Subscription[] = [];
+            let nextToken: string | undefined;
+            do {
+                const response = await axios.get(
+                    `https://eqbqzqdxh1.execute-api.us-east-1.amazonaws.com/test/subscriptionFunction`,
+                    {
+                        headers: {
+                            'Content-Type': 'application/json',
+                            'Accept': 'application/json',
+                            'X-Session-Token': storedSessionToken
+                        },
+                        params: nextToken ? { next_token: nextToken } : undefined
                     }
-                }
-            );
+                );
 
+                if (response.status !== 200) {
+                    setError('Failed to fetch subscriptions.');
+                    return;
+                }
 
-            if (response.status === 200) {
                 let responseData = typeof response.data === 'string' ? JSON.parse(response.data) : response.data;
 
                 if (responseData.body && typeof responseData.body === 'string') {
                     responseData = JSON.parse(responseData.body);
                 }
 
-                if (responseData.subscriptions) {
-                    setSubscriptions(responseData.subscriptions);
-                } else {
-                    setSubscriptions([]);
-                    setError('No subscriptions found.');
-                }
-            } else {
-                setError('Failed to fetch subscriptions.');
+                allSubscriptions.push(...(responseData.subscriptions || []));
+                nextToken = responseData.next_token;
+            } while (nextToken);
+
+            setSubscriptions(allSubscriptions);
+            if (allSubscriptions.length === 0) {
+                setError('No subscriptions found.');
             }
         } catch (error) {
             console.error('Error fetching subscriptions:', error);
@@ -0,0 +1,60 @@
+import os
+import sys
+import json
+import pytest
+
+# The handlers against moto, with the tables provisionTables creates and the
+# catalog, users and sessions benchHandlers seeds (pip install moto pytest).
+#
+#   python -m pytest -q
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'Lambda Functions'))
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+os.environ.setdefault('AWS_ACCESS_KEY_ID', 'test')
+os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'test')
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+os.environ['STORAGE_BACKEND'] = 'dynamodb'
+os.environ['LOG_LEVEL'] = 'ERROR'
+os.environ['QUERY_CACHE_TTL'] = '0'   # Tests that need the result cache install their own
+os.environ.pop('QUERY_CACHE_TABLE', None)
+
+CATALOG_SIZE = 400   # About three copies of 2025a1.json, so every artist and album spans several pages
+
+
+@pytest.fixture(scope='session')
+def dynamodb():
+    from moto import mock_aws
+    with mock_aws():
+        import boto3
+        import benchHandlers
+        benchHandlers.create_tables()
+        resource = boto3.resource('dynamodb', region_name='us-east-1')
+        benchHandlers.seed(resource, CATALOG_SIZE)
+        yield resource
+
+
+@pytest.fixture(scope='session')
+def catalog(dynamodb):
+    table = dynamodb.Table('music')
+    response = table.scan()
+    items = response['Items']
+    while 'LastEvaluatedKey' in response:
+        response = table.scan(ExclusiveStartKey=response['LastEvaluatedKey'])
+        items += response['Items']
+    return items
+
+
+@pytest.fixture
+def invoke(dynamodb):
+    # Calls module.lambda_handler with an API Gateway event; returns (status, headers, decoded body)
+    import benchHandlers
+
+    def call(module, method, body=None, user=1, query=None, headers=None):
+        event = benchHandlers.api_event(method, body, f'bench-token-{user}', query)
+        event['headers'].update(headers or {})
+        response = module.lambda_handler(event, None)
+        payload = json.loads(response['body']) if response['body'] else None
+        return response['statusCode'], response['headers'], payload
+    return call
@@ -0,0 +1,129 @@
+from collections import Counter
+import pytest
+import queryCache
+import queryFunction
+import queryPlanner
+import searchIndex
+
+
+def expected(catalog, filters, exact=False):
+    # year is always matched exactly, the other fields exactly or as substrings
+    def matches(song):
+        return all(song.get(field) == value if field == 'year' or exact else value in song.get(field, '')
+                   for field, value in filters.items())
+    return {(song['title'], song['year']) for song in catalog if matches(song)}
+
+
+def read_all(invoke, body, page_size):
+    # Follows next_token to the last page; returns every (title, year) in order and the strategies used
+    keys = []
+    strategies = set()
+    token = None
+    while True:
+        request = dict(body, page_size=page_size, explain=True)
+        if token:
+            request['next_token'] = token
+        status, _, payload = invoke(queryFunction, 'POST', request)
+        assert status == 200, payload
+        keys += [(song['title'], song['year']) for song in payload['results']]
+        strategies.add(payload['plan']['strategy'])
+        token = payload.get('next_token')
+        if token is None:
+            return keys, strategies
+        assert len(keys) < 1000, "pagination does not terminate"
+
+
+@pytest.fixture
+def popular(catalog):
+    # The artist with the most songs and that artist's most common album
+    artist = Counter(song['artist'] for song in catalog).most_common(1)[0][0]
+    album = Counter(song['album'] for song in catalog if song['artist'] == artist).most_common(1)[0][0]
+    year = Counter(song['year'] for song in catalog).most_common(1)[0][0]
+    return {'artist': artist, 'album': album, 'year': year}
+
+
+@pytest.mark.parametrize('strategy, fields, match, search_index', [
+    ('gsi', ('year',), 'contains', True),
+    ('scan', ('artist', 'album'), 'contains', False),
+    ('search-index', ('artist', 'album'), 'contains', True),
+    ('gsi-residual', ('artist', 'album'), 'exact', False),
+])
+def test_pages_cover_every_match_once(invoke, catalog, popular, monkeypatch, strategy, fields, match, search_index):
+    monkeypatch.setattr(queryFunction, 'SEARCH_INDEX_ENABLED', search_index)
+    filters = {field: popular[field] if match == 'exact' or field == 'year' else popular[field][:5] for field in fields}
+    wanted = expected(catalog, filters, exact=match == 'exact')
+    assert len(wanted) > 2
+
+    keys, strategies = read_all(invoke, dict(filters, match=match), page_size=2)
+    assert strategies == {strategy}
+    assert len(keys) == len(set(keys))
+    assert set(keys) == wanted
+
+
+def test_residual_plan_stops_at_read_budget(invoke, catalog, popular, monkeypatch):
+    monkeypatch.setattr(queryFunction, 'SEARCH_INDEX_ENABLED', False)
+    monkeypatch.setattr(queryPlanner, 'READ_BUDGET', 3)
+    filters = {'artist': popular['artist'], 'album': popular['album']}
+
+    keys, strategies = read_all(invoke, dict(filters, match='exact'), page_size=50)
+    assert strategies == {'gsi-residual'}
+    assert len(keys) == len(set(keys))
+    assert set(keys) == expected(catalog, filters, exact=True)
+
+
+def test_get_item_plan_has_no_next_page(invoke, catalog):
+    song = catalog[0]
+    keys, strategies = read_all(invoke, {'title': song['title'], 'year': song['year'], 'match': 'exact'}, page_size=1)
+    assert strategies == {'get-item'}
+    assert keys == [(song['title'], song['year'])]
+
+
+def test_fuzzy_pages_follow_the_ranking(invoke, popular):
+    body = {'artist': popular['artist'][:-1], 'match': 'fuzzy'}
+    ranked, _ = read_all(invoke, body, page_size=1000)
+    keys, strategies = read_all(invoke, body, page_size=2)
+    assert strategies == {'fuzzy'}
+    assert len(ranked) > 2
+    assert keys == ranked
+
+
+def test_tokens_are_tied_to_their_query(invoke, popular):
+    _, _, payload = invoke(queryFunction, 'POST', {'year': popular['year'], 'page_size': 1})
+    status, _, payload = invoke(queryFunction, 'POST', {'year': '1900', 'page_size': 1,
+                                                        'next_token': payload['next_token']})
+    assert status == 400
+
+
+def test_stale_index_page_is_not_cached(dynamodb, invoke, monkeypatch):
+    # Another container bumps the shared version after a write; until this container's
+    # index has caught up, its pages must not be stored under the new version
+    shared = queryCache.DynamoDBTier(dynamodb.Table('query_cache'))
+    cache = queryCache.QueryCache(ttl=60, shared=shared)
+    monkeypatch.setattr(queryFunction, 'result_cache', cache)
+    monkeypatch.setattr(searchIndex, '_catalog', searchIndex.RefreshingIndex('index', searchIndex.build_index))
+    filters = {'title': 'Zz', 'artist': 'Test Artist'}
+
+    def titles():
+        status, _, payload = invoke(queryFunction, 'POST', dict(filters, explain=True))
+        assert status == 200, payload
+        assert payload['plan']['strategy'] == 'search-index'
+        return [song['title'] for song in payload['results']]
+
+    def cached():
+        return cache.get(queryCache.cache_key(cache.version(), filters))
+
+    assert titles() == []
+    song = {'title': 'Song Zz', 'year': '2030', 'artist': 'Test Artist', 'album': 'Test Album'}
+    dynamodb.Table('music').put_item(Item=song)
+    try:
+        queryCache.QueryCache(shared=shared).invalidate()
+        cache._version_checked = 0   # Read the new version now, not after VERSION_CHECK_INTERVAL
+
+        assert titles() == []
+        assert cached() is None
+
+        searchIndex._catalog.wait()
+        assert titles() == ['Song Zz']
+        assert cached() is not None
+    finally:
+        dynamodb.Table('music').delete_item(Key={'title': song['title'], 'year': song['year']})
@@ -0,0 +1,56 @@
+import membershipCache
+import subscriptionFunction
+
+
+def test_batch_subscribe_reports_each_song(invoke, catalog):
+    song = catalog[0]
+    status, _, payload = invoke(subscriptionFunction, 'POST', {'songs': [
+        {'title': song['title'], 'year': song['year']},
+        {'title': 5, 'year': '1999'},
+        {'title': song['title'], 'year': int(song['year'])},
+        'not a song',
+        {'title': 'No Such Song', 'year': '1999'},
+    ]}, user=2)
+    assert status == 200
+    assert payload['success'] is False
+    assert [result['status'] for result in payload['results']] == [
+        'subscribed', 'invalid', 'invalid', 'invalid', 'not_found']
+    assert payload['results'][0]['uuid']
+
+
+def test_batch_unsubscribe_reports_each_uuid(invoke, dynamodb):
+    table = dynamodb.Table('user_subscriptions')
+    status, _, payload = invoke(subscriptionFunction, 'DELETE', {'uuids': [
+        'bench-2-0', 'no-such-uuid', None, membershipCache.VERSION_UUID, 'bench-3-0',
+    ]}, user=2)
+    assert status == 200
+    assert payload['success'] is False
+    assert [result['status'] for result in payload['results']] == [
+        'deleted', 'not_found', 'invalid', 'invalid', 'not_found']
+    assert 'Item' not in table.get_item(Key={'user_email': 'user2@bench.local', 'uuid': 'bench-2-0'})
+    # Another user's subscription is never touched
+    assert 'Item' in table.get_item(Key={'user_email': 'user3@bench.local', 'uuid': 'bench-3-0'})
+
+
+def test_unchanged_listing_is_not_modified(invoke, catalog, monkeypatch):
+    status, headers, payload = invoke(subscriptionFunction, 'GET', user=4)
+    assert status == 200 and payload['subscriptions']
+    etag = headers['ETag']
+
+    status, headers, payload = invoke(subscriptionFunction, 'GET', user=4, headers={'If-None-Match': etag})
+    assert status == 304
+    assert payload is None
+    assert headers['ETag'] == etag
+
+    # Right after a change the listing is not tagged, so the old tag can't match
+    song = catalog[-1]
+    status, _, _ = invoke(subscriptionFunction, 'POST', {'title': song['title'], 'year': song['year']}, user=4)
+    assert status == 200
+    status, headers, _ = invoke(subscriptionFunction, 'GET', user=4, headers={'If-None-Match': etag})
+    assert status == 200
+    assert 'ETag' not in headers
+
+    monkeypatch.setattr(subscriptionFunction, 'INDEX_SETTLE_SECONDS', 0)
+    status, headers, _ = invoke(subscriptionFunction, 'GET', user=4, headers={'If-None-Match': etag})
+    assert status == 200
+    assert headers['ETag'] != etag